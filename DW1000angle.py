@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 ANGLE CORRECTION SOFTWARE (x64)
+
+Range error depends on the angle between the tag and anchor antennas (see the
+angle section of analysis_investigation3.py). This module fits that error
+from archived trials into a small range x angle lookup table and corrects
+live ranges with it whenever an orientation estimate is available
+
+    python DW1000angle.py <investigation directory> <table .npz file>
+                          [--range-bins N] [--angle-bins N]
+
+METHOD:
+-Fit: mean error (scaled range minus webcam distance) of the archived samples
+ in each range/angle cell; cells without samples take the mean of their
+ angle column, then of the whole table
+-Lookup: bilinear interpolation between the cell centres, clamped at the
+ edges of the table; every range/angle pair of an array is looked up with
+ the same numpy calls
+
+NOTES:
+-Ranges and errors are in cm and angles in degrees. Negative angles are
+ webcamAverages.py's marker for frames it couldn't measure an angle in, and
+ are left out of fits like NaN; 0 degrees (head-on) is a real angle
+-Live correction needs an orientation source calling
+ DW1000test.setOrientation; none is wired in yet (webcamAverages.py only
+ processes recorded webcam files), so until one is the streamers pass
+ ranges through unchanged
+-Tables are saved as compressed .npz files (a few hundred bytes)
+-The archive is read the same way analysis_investigation3.py reads it: raw
+ ranges are scaled with the average line fit of the trials before the error
+ is taken
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import argparse
+import os
+import sys
+
+import numpy as np
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000angleCorrection(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,rangeAxis,angleAxis,table):
+        self.rangeAxis = np.asarray(rangeAxis,dtype=np.float64)    #cell centre ranges (cm), ascending
+        self.angleAxis = np.asarray(angleAxis,dtype=np.float64)    #cell centre angles (degrees), ascending
+        self.table = np.asarray(table,dtype=np.float64)            #range error (cm), ranges x angles
+
+        if (self.table.shape != (len(self.rangeAxis),len(self.angleAxis))):
+            raise ValueError("Table shape {0} doesn't match the axes ({1} x {2})".format(self.table.shape,
+                                                                                     len(self.rangeAxis),
+                                                                                     len(self.angleAxis)))
+
+    #==========================================================================
+    # FITTING FUNCTIONS
+    #==========================================================================
+    #Fit a table from samples of range, angle and range error; negative
+    #angles (no angle measured) are left out
+    @classmethod
+    def fit(cls,ranges,angles,errors,rangeBins=8,angleBins=7):
+        ranges = np.ravel(np.asarray(ranges,dtype=np.float64))
+        angles = np.ravel(np.asarray(angles,dtype=np.float64))
+        errors = np.ravel(np.asarray(errors,dtype=np.float64))
+
+        valid = np.isfinite(ranges) & np.isfinite(angles) & np.isfinite(errors) & (angles >= 0)
+        ranges = ranges[valid]
+        angles = angles[valid]
+        errors = errors[valid]
+
+        if (len(errors) == 0):
+            raise ValueError("No samples with a range, angle and error")
+
+        rangeEdges = np.linspace(ranges.min(),ranges.max(),rangeBins+1)
+        angleEdges = np.linspace(angles.min(),angles.max(),angleBins+1)
+
+        #Cell of every sample (the last edge belongs to the last cell)
+        rangeIndex = np.clip(np.searchsorted(rangeEdges,ranges,side="right")-1,0,rangeBins-1)
+        angleIndex = np.clip(np.searchsorted(angleEdges,angles,side="right")-1,0,angleBins-1)
+        cellIndex = rangeIndex*angleBins + angleIndex
+
+        counts = np.bincount(cellIndex,minlength=rangeBins*angleBins).reshape(rangeBins,angleBins)
+        sums = np.bincount(cellIndex,weights=errors,minlength=rangeBins*angleBins).reshape(rangeBins,angleBins)
+
+        with np.errstate(invalid="ignore",divide="ignore"):
+            table = sums/counts
+            columnMeans = sums.sum(axis=0)/counts.sum(axis=0)
+
+        #Fill empty cells from their angle column, or failing that the whole table
+        columnMeans = np.where(np.isfinite(columnMeans),columnMeans,errors.mean())
+        table = np.where(counts > 0,table,columnMeans[None,:])
+
+        return cls((rangeEdges[:-1]+rangeEdges[1:])/2,
+                   (angleEdges[:-1]+angleEdges[1:])/2,
+                   table)
+
+    #Fit a table from an investigation directory (see analysis_investigation3.py)
+    @classmethod
+    def fromArchive(cls,path,rangeBins=8,angleBins=7):
+        coeff = np.genfromtxt(os.path.join(path,"coeff.csv"),delimiter=",")
+        raw = np.genfromtxt(os.path.join(path,"raw.csv"),delimiter=",")
+        camDistances = np.genfromtxt(os.path.join(path,"webcam_corrected.csv"),delimiter=",")
+        angles = np.genfromtxt(os.path.join(path,"angles.csv"),delimiter=",")
+
+        #Scale with the room average, as the analysis does
+        roomScaled = (raw - np.mean(coeff[1,:]))/np.mean(coeff[0,:])
+
+        return cls.fit(camDistances,angles,roomScaled - camDistances,rangeBins,angleBins)
+
+    #==========================================================================
+    # FILE FUNCTIONS
+    #==========================================================================
+    def save(self,fileName):
+        np.savez_compressed(fileName,
+                            verNum=self.verNum,
+                            rangeAxis=self.rangeAxis.astype(np.float32),
+                            angleAxis=self.angleAxis.astype(np.float32),
+                            table=self.table.astype(np.float32))
+
+    @classmethod
+    def load(cls,fileName):
+        with np.load(fileName) as data:
+            return cls(data["rangeAxis"],data["angleAxis"],data["table"])
+
+    #==========================================================================
+    # CORRECTION FUNCTIONS
+    #==========================================================================
+    #Interpolated range error for ranges and angles (any matching shapes);
+    #NaN angles get no correction
+    def correction(self,ranges,angles):
+        ranges = np.asarray(ranges,dtype=np.float64)
+        angles = np.asarray(angles,dtype=np.float64)
+
+        rangeLow,rangeFrac = self.axisPosition(self.rangeAxis,ranges)
+        angleLow,angleFrac = self.axisPosition(self.angleAxis,np.nan_to_num(angles))
+        rangeHigh = np.minimum(rangeLow+1,len(self.rangeAxis)-1)
+        angleHigh = np.minimum(angleLow+1,len(self.angleAxis)-1)
+
+        table = self.table
+        correction = ((1-rangeFrac)*((1-angleFrac)*table[rangeLow,angleLow] + angleFrac*table[rangeLow,angleHigh])
+                      + rangeFrac*((1-angleFrac)*table[rangeHigh,angleLow] + angleFrac*table[rangeHigh,angleHigh]))
+
+        return np.where(np.isfinite(angles),correction,0.0)
+
+    #Ranges with the angle dependent error removed
+    def apply(self,ranges,angles):
+        return np.asarray(ranges,dtype=np.float64) - self.correction(ranges,angles)
+
+    #Index of the cell centre below each value and the fraction of the way to
+    #the next one, clamped to the ends of the axis
+    def axisPosition(self,axis,values):
+        if (len(axis) == 1):
+            return np.zeros(np.shape(values),dtype=np.intp),np.zeros(np.shape(values))
+
+        values = np.clip(values,axis[0],axis[-1])
+        low = np.clip(np.searchsorted(axis,values,side="right")-1,0,len(axis)-2)
+        fraction = (values - axis[low])/(axis[low+1] - axis[low])
+
+        return low,fraction
+
+#==========================================================================
+# MAIN
+#==========================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit a range x angle correction table from archived trials")
+    parser.add_argument("path",help="investigation directory with coeff.csv, raw.csv, webcam_corrected.csv and angles.csv")
+    parser.add_argument("fileName",help=".npz file to save the table to")
+    parser.add_argument("--range-bins",type=int,default=8,dest="rangeBins")
+    parser.add_argument("--angle-bins",type=int,default=7,dest="angleBins")
+    args = parser.parse_args()
+
+    try: correction = DW1000angleCorrection.fromArchive(args.path,args.rangeBins,args.angleBins)
+    except (IOError,OSError,ValueError) as error:
+        print("ERROR: Could not fit the correction table ({0})".format(error))
+        sys.exit(1)
+
+    correction.save(args.fileName)
+
+    np.set_printoptions(precision=2,suppress=True)
+    print("Range axis (cm): {0}".format(correction.rangeAxis))
+    print("Angle axis (deg): {0}".format(correction.angleAxis))
+    print("Range error (cm):\n{0}".format(correction.table))
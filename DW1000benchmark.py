@@ -0,0 +1,545 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 BENCHMARK SOFTWARE (x64)
+
+Benchmark suite for the DW1000 software that runs without any hardware (the
+devices are emulated, see DW1000emulator.py):
+    -imports: how long the DW1000 modules take to import and which heavy
+     dependencies (matplotlib, scipy, PyQt5) each one loads; every
+     measurement runs in a fresh interpreter so that nothing is cached
+    -runtime: range line parsing, distMeasLoop, antenna delay calibration,
+     curve fitting, data file round trips, position solving, particle
+     filter tracking, timing correction, replay and plot rendering
+
+    python DW1000benchmark.py [--suite all|imports|runtime] [--repeats N]
+                              [--save FILE] [--compare FILE] [--tolerance T]
+                              [--check]
+
+NOTES:
+-With --save the results are written to a JSON baseline file; with
+ --compare they are compared against one and the script exits with an error
+ if any metric got worse by more than the tolerance (a fraction, 0.25 by
+ default). Timings are only comparable between runs on the same machine
+-With --check the script exits with an error if any of the headless targets
+ (everything a streamer needs to get its first sample) loads matplotlib or
+ scipy
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+#==========================================================================
+# CONSTANTS
+#==========================================================================
+heavyModules = ("matplotlib","scipy","PyQt5")
+
+#(name, code to time, whether or not it has to stay free of matplotlib/scipy)
+importTargets = [("DW1000serial","import DW1000serial",True),
+                 ("DW1000compress","import DW1000compress",True),
+                 ("DW1000logger","import DW1000logger",True),
+                 ("DW1000test","import DW1000test",True),
+                 ("streamer start-up","import DW1000test\nDW1000test.DW1000test()",True),
+                 ("DW1000manager","import DW1000manager",True),
+                 ("DW1000emulator","import DW1000emulator",True),
+                 ("DW1000position","import DW1000position",True),
+                 ("DW1000tracker","import DW1000tracker",True),
+                 ("DW1000filters","import DW1000filters",True),
+                 ("DW1000quality","import DW1000quality",True),
+                 ("DW1000angle","import DW1000angle",True),
+                 ("DW1000fusion","import DW1000fusion",True),
+                 ("DW1000timing","import DW1000timing",True),
+                 ("DW1000replay","import DW1000replay",True),
+                 ("DW1000render","import DW1000render",True),
+                 ("DW1000gui","import DW1000gui",False)]
+
+#Run in the child interpreter; prints the time taken and the heavy modules loaded
+timingScript = """
+import json,sys,time
+sys.path.insert(0,{path!r})
+startTime = time.perf_counter()
+exec(compile({code!r},"<benchmark>","exec"))
+elapsedTime = time.perf_counter() - startTime
+loaded = sorted(name for name in {heavy!r} if name in sys.modules)
+sys.stdout.write("\\n" + json.dumps({{"seconds":elapsedTime,"loaded":loaded}}) + "\\n")
+"""
+
+#==========================================================================
+# BENCHMARK FUNCTIONS
+#==========================================================================
+#Time a piece of code in fresh interpreters; returns the median and minimum
+#time in seconds and the heavy modules it loaded
+def importTime(code,repeats=5):
+    script = timingScript.format(path=os.path.dirname(os.path.abspath(__file__)),
+                                 code=code,
+                                 heavy=heavyModules)
+    times = []
+    loaded = []
+
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable,"-c",script],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                check=True).stdout.decode(errors="ignore")
+
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        loaded = result["loaded"]
+
+    return {"median":float(np.median(times)),
+            "min":float(np.min(times)),
+            "loaded":loaded}
+
+#Time every import target
+def runImportBenchmark(repeats=5,targets=importTargets):
+    results = []
+
+    for name,code,headless in targets:
+        try: result = importTime(code,repeats)
+        except (subprocess.CalledProcessError,ValueError) as exception:
+            result = {"median":None,"min":None,"loaded":[],"error":str(exception)}
+
+        result["name"] = name
+        result["headless"] = headless
+        results.append(result)
+
+    return results
+
+#Print the results as a table; returns the names of headless targets that
+#loaded matplotlib or scipy
+def printImportBenchmark(results):
+    failures = []
+
+    print("{0:<20} {1:>10} {2:>10}  {3}".format("Target","Median (ms)","Min (ms)","Heavy modules loaded"))
+
+    for result in results:
+        if (result["median"] == None):
+            print("{0:<20} {1:>10}".format(result["name"],"ERROR"))
+            continue
+
+        print("{0:<20} {1:>10.1f} {2:>10.1f}  {3}".format(result["name"],
+                                                          result["median"]*1000,
+                                                          result["min"]*1000,
+                                                          ", ".join(result["loaded"]) or "-"))
+
+        if result["headless"] and (set(result["loaded"]) & {"matplotlib","scipy"}):
+            failures.append(result["name"])
+
+    return failures
+
+#Import times as baseline metrics
+def importMetrics(results):
+    return {"import.{0}".format(result["name"]):metric(result["median"]*1000,"ms",False)
+            for result in results if (result["median"] != None)}
+
+#==========================================================================
+# RUNTIME BENCHMARK FUNCTIONS
+#==========================================================================
+#A single measurement; higherIsBetter says which way is an improvement
+def metric(value,unit,higherIsBetter):
+    return {"value":float(value),
+            "unit":unit,
+            "better":"higher" if higherIsBetter else "lower"}
+
+#testInfoDict with the keys the file and plot functions need
+def benchTestInfoDict():
+    return {"testType":"benchmark",
+            "numSamples":100,
+            "startDist":5,
+            "stopDist":100,
+            "stepDist":5,
+            "device":"anchor",
+            "anchorPort":"",
+            "tagPort":"",
+            "anchorBaud":115200,
+            "tagBaud":115200,
+            "anchorAntDelayDec":32900,
+            "tagAntDelayDec":0,
+            "compressData":False,
+            "pairName":"",
+            "numSteps":19,
+            "enableDebug":False}
+
+#A DW1000test object connected to emulated devices
+def emulatedTest(trueDist=100.0,testInfoDict=None):
+    import DW1000emulator
+    import DW1000test
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        DW1000 = DW1000test.DW1000test(testInfoDict=testInfoDict)
+
+    link = DW1000emulator.DW1000emulatedLink(trueDist=trueDist)
+    link.attach(DW1000)
+
+    return DW1000,link
+
+#Distance dictionary like the ones the calibration loops build
+def makeDistDict(numDists,samplesPerDist,seed=0):
+    random = np.random.RandomState(seed)
+
+    return {"{0} cm".format(dist):list(dist*1.02 + 3 + random.normal(0,2,samplesPerDist))
+            for dist in range(5,5*(numDists+1),5)}
+
+#Anchors at the corners of a 5 x 4 m room, in cm
+roomAnchors = np.array([[0,0],[500,0],[500,400],[0,400]],dtype=np.float64)
+
+#Noisy ranges (epochs x anchors) from the room's anchors to each position
+def makeRoomRanges(positions,rangeStd=5.0,seed=0):
+    random = np.random.RandomState(seed)
+
+    return (np.sqrt(((positions[:,None,:] - roomAnchors[None,:,:])**2).sum(axis=2))
+            + random.normal(0,rangeStd,(len(positions),len(roomAnchors))))
+
+def benchParse(numLines=20000):
+    DW1000,link = emulatedTest()
+    lines = [link.anchor.makeLine().decode() for _ in range(numLines)]
+
+    startTime = time.perf_counter()
+    for line in lines:
+        DW1000.anchor.parseRangeLine(line)
+    elapsedTime = time.perf_counter() - startTime
+
+    return {"parse.linesPerSec":metric(numLines/elapsedTime,"lines/s",True)}
+
+def benchDistMeasLoop(numSamples=2000):
+    DW1000,link = emulatedTest()
+
+    startTime = time.perf_counter()
+    for _ in range(numSamples):
+        DW1000.distMeasLoop()
+    elapsedTime = time.perf_counter() - startTime
+
+    return {"distMeasLoop.samplesPerSec":metric(numSamples/elapsedTime,"samples/s",True)}
+
+#Antenna delay calibration starting a few centimetres away from the answer
+def benchCalibration(delayOffset=100,calSamples=50):
+    DW1000,link = emulatedTest()
+    link.trueDist = DW1000.testInfoDict["startDist"]
+    output = io.StringIO()
+
+    startTime = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        DW1000.antDelayCalLoop(link.trueAntDelay + delayOffset,calSamples)
+    elapsedTime = time.perf_counter() - startTime
+
+    return {"calibration.seconds":metric(elapsedTime,"s",False),
+            "calibration.rounds":metric(output.getvalue().count("distAvg"),"rounds",False)}
+
+def benchCurveFit(numDists=20,samplesPerDist=10000):
+    import DW1000test
+
+    DW1000,link = emulatedTest()
+    distDict = makeDistDict(numDists,samplesPerDist)
+    DW1000test.fitCache.clear()     #time the fit, not the cache
+
+    startTime = time.perf_counter()
+    DW1000.linearCurveFit(distDict)
+    elapsedTime = time.perf_counter() - startTime
+
+    return {"curveFit.seconds":metric(elapsedTime,"s",False)}
+
+#fileWrite then fileRead, for both file formats
+def benchFileRoundTrip(numDists=20,samplesPerDist=1000):
+    metrics = {}
+    distDict = makeDistDict(numDists,samplesPerDist)
+    loopTimeDict = makeDistDict(numDists,samplesPerDist,seed=1)
+
+    for extension,compressData in (("csv",False),("rfz",True)):
+        DW1000,link = emulatedTest(testInfoDict=dict(benchTestInfoDict(),compressData=compressData))
+        tempDir = tempfile.mkdtemp()
+        currentDir = os.getcwd()
+
+        try:
+            os.chdir(tempDir)   #the file names are generated in the working directory
+
+            startTime = time.perf_counter()
+            DW1000.fileWrite(distDict,loopTimeDict)
+            writeTime = time.perf_counter() - startTime
+
+            fileName = [name for name in os.listdir(tempDir) if name.endswith(extension)][0]
+
+            startTime = time.perf_counter()
+            DW1000.fileRead(fileName)
+            readTime = time.perf_counter() - startTime
+
+            fileSize = os.path.getsize(fileName)
+        finally:
+            os.chdir(currentDir)
+            shutil.rmtree(tempDir,ignore_errors=True)
+
+        metrics["file.{0}.writeSeconds".format(extension)] = metric(writeTime,"s",False)
+        metrics["file.{0}.readSeconds".format(extension)] = metric(readTime,"s",False)
+        metrics["file.{0}.bytes".format(extension)] = metric(fileSize,"B",False)
+
+    return metrics
+
+def benchRender(numDists=20,samplesPerDist=1000):
+    import matplotlib
+    matplotlib.use("Agg")
+    import DW1000test
+
+    metrics = {}
+    distDict = makeDistDict(numDists,samplesPerDist)
+    plotInfoDict = {"makeGaussPlot":True,
+                    "makeHistPlot":True,
+                    "makeRefPlot":True,
+                    "scaleData":False,
+                    "truncateData":False,
+                    "fileName":"",
+                    "useFile":False,
+                    "show":False,
+                    "minTruncDist":5,
+                    "maxTruncDist":5}
+
+    DW1000,link = emulatedTest(testInfoDict=dict(benchTestInfoDict(),device="anchor"))
+    plt = DW1000test.loadPyplot()
+    tempDir = tempfile.mkdtemp()
+    currentDir = os.getcwd()
+
+    try:
+        os.chdir(tempDir)
+
+        for name,function in (("errorPlot",DW1000.makeErrorPlotDist),
+                              ("gaussianPlot",DW1000.makeGaussianPlotDist)):
+            startTime = time.perf_counter()
+            function(dict(distDict),dict(plotInfoDict))
+            metrics["render.{0}Seconds".format(name)] = metric(time.perf_counter() - startTime,"s",False)
+            plt.close("all")
+    finally:
+        os.chdir(currentDir)
+        shutil.rmtree(tempDir,ignore_errors=True)
+
+    return metrics
+
+#Multilateration of simulated ranges from four anchors around a 5 x 4 m room
+def benchPosition(numEpochs=20000,liveEpochs=2000):
+    import DW1000position
+
+    solver = DW1000position.DW1000positionSolver(roomAnchors,rangeStd=5.0)
+    positions = np.random.RandomState(1).uniform([50,50],[450,350],(numEpochs,2))
+    ranges = makeRoomRanges(positions)
+
+    startTime = time.perf_counter()
+    for epoch in range(liveEpochs):
+        solver.solve(ranges[epoch])
+    liveTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    solver.solveBatch(ranges)
+    batchTime = time.perf_counter() - startTime
+
+    return {"position.liveEpochsPerSec":metric(liveEpochs/liveTime,"epochs/s",True),
+            "position.batchEpochsPerSec":metric(numEpochs/batchTime,"epochs/s",True)}
+
+#Particle filter updates per second for a tag walking around the same room,
+#for a range of particle counts
+def benchTracker(particleCounts=(500,2000,10000),numUpdates=200):
+    import DW1000tracker
+
+    times = np.arange(numUpdates)*0.01
+    positions = np.column_stack((250 + 150*np.cos(times),200 + 100*np.sin(times)))
+    ranges = makeRoomRanges(positions)
+    metrics = {}
+
+    for numParticles in particleCounts:
+        tracker = DW1000tracker.DW1000particleTracker(roomAnchors,numParticles=numParticles,seed=0)
+        tracker.initUniform([0,0],[500,400],timestamp=0.0)
+
+        startTime = time.perf_counter()
+        for update in range(numUpdates):
+            tracker.step(times[update],ranges[update])
+            tracker.estimate()
+        elapsedTime = time.perf_counter() - startTime
+
+        metrics["tracker.updatesPerSec.{0}".format(numParticles)] = metric(numUpdates/elapsedTime,"updates/s",True)
+
+    return metrics
+
+#Timing correction updates per second for a port with 10 Hz frames, USB
+#latency timer jitter and the odd missed frame
+def benchTiming(numFrames=20000):
+    import DW1000timing
+
+    random = np.random.RandomState(0)
+    emitted = np.arange(numFrames)*0.1
+    arrivals = np.ceil((emitted + 0.003 + random.uniform(0,0.016,numFrames))*1000)/1000
+    arrivals = arrivals[random.rand(numFrames) > 0.01]
+    estimator = DW1000timing.DW1000cadenceEstimator(nominalPeriod=0.1)
+
+    startTime = time.perf_counter()
+    for arrival in arrivals:
+        estimator.update(arrival)
+    elapsedTime = time.perf_counter() - startTime
+
+    return {"timing.updatesPerSec":metric(len(arrivals)/elapsedTime,"updates/s",True)}
+
+#distMeasLoop driven by a replay of an emulated raw capture, as fast as
+#possible (the samples/s the pipeline manages on recorded data)
+def benchReplay(numSamples=2000):
+    import DW1000replay
+    import DW1000test
+
+    DW1000,link = emulatedTest()
+    tempDir = tempfile.mkdtemp()
+    prefix = os.path.join(tempDir,"capture")
+
+    try:
+        DW1000.startRawCapture(prefix)
+        for _ in range(numSamples):
+            DW1000.distMeasLoop()
+        DW1000.stopRawCapture()
+
+        replay = DW1000replay.DW1000replay.fromRawCaptures({role:"{0}_{1}.dwraw".format(prefix,role) for role in ("anchor","tag")},
+                                                           speed=0)
+        DW1000 = DW1000test.DW1000test()
+        replay.attach(DW1000)
+        replayedSamples = 0
+
+        startTime = time.perf_counter()
+        while not replay.finished():
+            if not DW1000.distMeasLoop():
+                break
+            replayedSamples += 1
+        elapsedTime = time.perf_counter() - startTime
+    finally:
+        shutil.rmtree(tempDir,ignore_errors=True)
+
+    return {"replay.samplesPerSec":metric(replayedSamples/elapsedTime,"samples/s",True)}
+
+runtimeBenchmarks = [("parse",benchParse),
+                     ("distMeasLoop",benchDistMeasLoop),
+                     ("calibration",benchCalibration),
+                     ("curveFit",benchCurveFit),
+                     ("file",benchFileRoundTrip),
+                     ("position",benchPosition),
+                     ("tracker",benchTracker),
+                     ("timing",benchTiming),
+                     ("replay",benchReplay),
+                     ("render",benchRender)]
+
+#Run every runtime benchmark; returns the median of each metric
+def runRuntimeBenchmark(repeats=5,benchmarks=runtimeBenchmarks):
+    sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+    metrics = {}
+
+    for name,function in benchmarks:
+        runs = []
+
+        for _ in range(repeats):
+            with contextlib.redirect_stdout(io.StringIO()):
+                runs.append(function())
+
+        for key in runs[0]:
+            metrics[key] = dict(runs[0][key],value=float(np.median([run[key]["value"] for run in runs])))
+
+    return metrics
+
+def printMetrics(metrics):
+    print("{0:<32} {1:>14}  {2}".format("Metric","Value","Unit"))
+
+    for key,value in metrics.items():
+        print("{0:<32} {1:>14.4g}  {2}".format(key,value["value"],value["unit"]))
+
+#==========================================================================
+# BASELINE FUNCTIONS
+#==========================================================================
+def saveBaseline(fileName,metrics):
+    with open(fileName,"w") as baselineFile:
+        json.dump({"created":time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "python":platform.python_version(),
+                   "machine":platform.platform(),
+                   "metrics":metrics},
+                  baselineFile,
+                  indent=1,
+                  sort_keys=True)
+
+def loadBaseline(fileName):
+    with open(fileName,"r") as baselineFile:
+        return json.load(baselineFile)["metrics"]
+
+#Print how every metric changed from the baseline; returns the names of the
+#ones that got worse by more than the tolerance (a fraction)
+def compareBaseline(metrics,baseline,tolerance=0.25):
+    regressions = []
+
+    print("{0:<32} {1:>12} {2:>12} {3:>9}".format("Metric","Baseline","Current","Change"))
+
+    for key,value in metrics.items():
+        if not (key in baseline):
+            print("{0:<32} {1:>12} {2:>12.4g} {3:>9}".format(key,"-",value["value"],"new"))
+            continue
+
+        oldValue = baseline[key]["value"]
+        newValue = value["value"]
+        change = (newValue - oldValue)/oldValue if oldValue else 0.0
+        worse = (-change if (value["better"] == "higher") else change) > tolerance
+
+        if worse:
+            regressions.append(key)
+
+        print("{0:<32} {1:>12.4g} {2:>12.4g} {3:>+8.1%}{4}".format(key,
+                                                                    oldValue,
+                                                                    newValue,
+                                                                    change,
+                                                                    " REGRESSION" if worse else ""))
+
+    return regressions
+
+#==========================================================================
+# MAIN CODE
+#==========================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the DW1000 software without hardware")
+    parser.add_argument("--suite",choices=("all","imports","runtime"),default="all",help="benchmarks to run")
+    parser.add_argument("--repeats",type=int,default=5,help="runs (fresh interpreters for imports) per benchmark")
+    parser.add_argument("--save",metavar="FILE",help="write the results to a JSON baseline file")
+    parser.add_argument("--compare",metavar="FILE",help="compare the results against a JSON baseline file")
+    parser.add_argument("--tolerance",type=float,default=0.25,help="largest allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--check",action="store_true",help="fail if a headless target loads matplotlib or scipy")
+    args = parser.parse_args()
+
+    metrics = {}
+    failures = []
+
+    if (args.suite in ("all","imports")):
+        results = runImportBenchmark(args.repeats)
+        failures = printImportBenchmark(results)
+        metrics.update(importMetrics(results))
+
+        if failures:
+            print("Headless targets loading matplotlib/scipy: {0}".format(", ".join(failures)))
+
+        print("")
+
+    if (args.suite in ("all","runtime")):
+        runtimeMetrics = runRuntimeBenchmark(args.repeats)
+        printMetrics(runtimeMetrics)
+        metrics.update(runtimeMetrics)
+        print("")
+
+    if args.save:
+        saveBaseline(args.save,metrics)
+        print("Saved baseline to '{0}'".format(args.save))
+
+    regressions = []
+
+    if args.compare:
+        regressions = compareBaseline(metrics,loadBaseline(args.compare),args.tolerance)
+
+        if regressions:
+            print("Regressions: {0}".format(", ".join(regressions)))
+
+    sys.exit(1 if ((args.check and failures) or regressions) else 0)
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 SAMPLE COMPRESSION SOFTWARE (x64)
+
+Quantizes sample columns to a fixed resolution, delta-encodes them and
+compresses them in independent chunks (zlib or lzma) so that long recordings
+stay small on disk and any chunk can be read back on its own
+
+FILE LAYOUT:
+-File magic ("RFZ1") followed by any number of chunks
+-Each chunk is a fixed header, the UTF-8 column name and the compressed payload
+     -Header: name length, codec, delta dtype, sample count, resolution,
+              first quantized value, payload length
+     -Metadata chunks (dtype code 0) hold the repr() of a Python literal
+-There is no footer; the reader builds its chunk index by hopping from header
+ to header, so partially written files can still be read
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import ast
+import lzma
+import struct
+import zlib
+
+import numpy as np
+
+#==========================================================================
+# CONSTANTS
+#==========================================================================
+fileMagic = b"RFZ1"
+
+#name length, codec, dtype, sample count, resolution, first value, payload length
+chunkHeader = struct.Struct("<HBBIdqI")
+
+codecIds = {"none":0,
+            "zlib":1,
+            "lzma":2}
+codecNames = {value:key for key,value in codecIds.items()}
+
+#Delta dtypes in order of preference (smallest first); code 0 is metadata
+deltaDtypes = [(1,np.dtype("<i1")),
+               (2,np.dtype("<i2")),
+               (3,np.dtype("<i4")),
+               (4,np.dtype("<i8"))]
+deltaDtypeCodes = dict(deltaDtypes)
+metaDtypeCode = 0
+
+#==========================================================================
+# CODEC CLASS
+#==========================================================================
+class DW1000codec(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,resolution=0.01,method="zlib",level=None):
+        if not (method in codecIds):
+            raise ValueError("Unknown compression method '{0}'; expected one of {1}".format(method,
+                                                                                           sorted(codecIds)))
+        if not (resolution > 0):
+            raise ValueError("Resolution must be greater than zero")
+
+        self.resolution = float(resolution)    #quantization step in sample units (cm, ms, ...)
+        self.method = method                   #'none', 'zlib' or 'lzma'
+        self.level = level                     #compression level (None for the library default)
+
+    #==========================================================================
+    # BYTE-LEVEL FUNCTIONS
+    #==========================================================================
+    #Compress raw bytes with the selected method
+    def compressBytes(self,data,method=None):
+        if (method == None):
+            method = self.method
+
+        if (method == "zlib"):
+            return zlib.compress(data,6 if (self.level == None) else self.level)
+        elif (method == "lzma"):
+            return lzma.compress(data,preset=6 if (self.level == None) else self.level)
+
+        return bytes(data)
+
+    #Decompress raw bytes with the given method
+    def decompressBytes(self,data,method):
+        if (method == "zlib"):
+            return zlib.decompress(data)
+        elif (method == "lzma"):
+            return lzma.decompress(data)
+
+        return bytes(data)
+
+    #==========================================================================
+    # SAMPLE FUNCTIONS
+    #==========================================================================
+    #Quantize, delta-encode and compress a column of samples
+    #Returns (dtype code, count, first quantized value, payload)
+    def encodeSamples(self,values,resolution=None):
+        if (resolution == None):
+            resolution = self.resolution
+
+        values = np.asarray(values,dtype=np.float64).ravel()
+
+        if not np.all(np.isfinite(values)):
+            raise ValueError("Cannot encode non-finite samples")
+
+        if (len(values) == 0):
+            return deltaDtypes[0][0],0,0,self.compressBytes(b"")
+
+        quantized = np.round(self.scaleToSteps(values,resolution)).astype(np.int64)
+        deltas = np.diff(quantized)
+
+        if (len(deltas) == 0):
+            dtypeCode,dtype = deltaDtypes[0]
+        else:
+            deltaMin = deltas.min()
+            deltaMax = deltas.max()
+
+            for dtypeCode,dtype in deltaDtypes:
+                info = np.iinfo(dtype)
+                if (deltaMin >= info.min) and (deltaMax <= info.max):
+                    break
+
+        payload = self.compressBytes(deltas.astype(dtype).tobytes())
+
+        return dtypeCode,len(values),int(quantized[0]),payload
+
+    #Inverse of encodeSamples
+    def decodeSamples(self,dtypeCode,count,first,payload,resolution,method):
+        if (count == 0):
+            return np.zeros(0,dtype=np.float64)
+
+        deltas = np.frombuffer(self.decompressBytes(payload,method),
+                               dtype=deltaDtypeCodes[dtypeCode])
+
+        quantized = np.empty(count,dtype=np.int64)
+        quantized[0] = first
+        np.cumsum(deltas,out=quantized[1:])
+        quantized[1:] += first
+
+        return self.scaleFromSteps(quantized,resolution)
+
+    #Convert samples to (fractional) quantization steps
+    #NOTE: resolutions like 0.01 are handled as a division by 100 so that
+    #      decoded values print the same way the originals did
+    def scaleToSteps(self,values,resolution):
+        stepsPerUnit = 1.0/resolution
+
+        if (abs(stepsPerUnit - round(stepsPerUnit)) < 1e-9):
+            return values*round(stepsPerUnit)
+
+        return values/resolution
+
+    #Convert quantization steps back to samples
+    def scaleFromSteps(self,steps,resolution):
+        stepsPerUnit = 1.0/resolution
+
+        if (abs(stepsPerUnit - round(stepsPerUnit)) < 1e-9):
+            return steps/float(round(stepsPerUnit))
+
+        return steps*resolution
+
+#==========================================================================
+# SESSION WRITER CLASS
+#==========================================================================
+class DW1000sessionWriter(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,fileName,resolution=0.01,method="zlib",chunkSize=4096,level=None):
+        self.codec = DW1000codec(resolution=resolution,method=method,level=level)
+        self.fileName = fileName
+        self.chunkSize = chunkSize      #number of samples per chunk when appending
+        self.resolutions = {}           #per-column resolution overrides
+        self.pending = {}               #samples waiting to be written, by column
+
+        self.file = open(fileName,"wb")
+        self.file.write(fileMagic)
+
+    #Set the quantization resolution for a single column
+    def setResolution(self,name,resolution):
+        self.resolutions[name] = float(resolution)
+
+    #Write a whole column, split into chunks of chunkSize samples
+    def writeColumn(self,name,values,resolution=None):
+        if (resolution != None):
+            self.setResolution(name,resolution)
+
+        values = np.asarray(values,dtype=np.float64).ravel()
+
+        if (len(values) == 0):
+            self.writeChunk(name,values)
+
+        for index in range(0,len(values),self.chunkSize):
+            self.writeChunk(name,values[index:index+self.chunkSize])
+
+    #Append a single sample to a column; full chunks are written out immediately
+    def append(self,name,value):
+        try: buffer = self.pending[name]
+        except KeyError:
+            buffer = self.pending[name] = []
+
+        buffer.append(value)
+
+        if (len(buffer) >= self.chunkSize):
+            self.writeChunk(name,buffer)
+            del buffer[:]
+
+    #Write a metadata entry (any value that round-trips through repr/literal_eval)
+    def writeMeta(self,name,value):
+        nameBytes = name.encode("utf-8")
+        payload = self.codec.compressBytes(repr(value).encode("utf-8"))
+
+        self.file.write(chunkHeader.pack(len(nameBytes),
+                                         codecIds[self.codec.method],
+                                         metaDtypeCode,
+                                         0,
+                                         0.0,
+                                         0,
+                                         len(payload)))
+        self.file.write(nameBytes)
+        self.file.write(payload)
+
+    #Encode and write a single chunk
+    def writeChunk(self,name,values):
+        resolution = self.resolutions.get(name,self.codec.resolution)
+        nameBytes = name.encode("utf-8")
+
+        (dtypeCode,
+         count,
+         first,
+         payload) = self.codec.encodeSamples(values,resolution=resolution)
+
+        self.file.write(chunkHeader.pack(len(nameBytes),
+                                         codecIds[self.codec.method],
+                                         dtypeCode,
+                                         count,
+                                         resolution,
+                                         first,
+                                         len(payload)))
+        self.file.write(nameBytes)
+        self.file.write(payload)
+
+    #Write out any partially filled chunks
+    def flush(self):
+        for name,buffer in self.pending.items():
+            if buffer:
+                self.writeChunk(name,buffer)
+                del buffer[:]
+
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        self.close()
+
+#==========================================================================
+# SESSION READER CLASS
+#==========================================================================
+class DW1000sessionReader(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,fileName):
+        self.codec = DW1000codec()
+        self.fileName = fileName
+        self.index = {}     #column name -> list of chunk entries
+        self.meta = {}      #metadata name -> chunk entry
+
+        self.file = open(fileName,"rb")
+
+        if (self.file.read(len(fileMagic)) != fileMagic):
+            self.file.close()
+            raise ValueError("{0} is not a compressed session file".format(fileName))
+
+        self.buildIndex()
+
+    #Hop from chunk header to chunk header and record where each chunk lives
+    def buildIndex(self):
+        offset = len(fileMagic)
+        fileSize = self.fileSize()
+
+        while True:
+            self.file.seek(offset)
+            header = self.file.read(chunkHeader.size)
+
+            if (len(header) < chunkHeader.size):
+                break
+
+            (nameLen,
+             codecId,
+             dtypeCode,
+             count,
+             resolution,
+             first,
+             payloadLen) = chunkHeader.unpack(header)
+
+            name = self.file.read(nameLen).decode("utf-8")
+            payloadOffset = offset + chunkHeader.size + nameLen
+
+            #Stop at a chunk that was cut short (e.g. the writer was killed)
+            if (payloadOffset + payloadLen > fileSize):
+                break
+
+            entry = {"method":codecNames[codecId],
+                     "dtypeCode":dtypeCode,
+                     "count":count,
+                     "resolution":resolution,
+                     "first":first,
+                     "offset":payloadOffset,
+                     "length":payloadLen}
+
+            if (dtypeCode == metaDtypeCode):
+                self.meta[name] = entry
+            else:
+                self.index.setdefault(name,[]).append(entry)
+
+            offset = payloadOffset + payloadLen
+
+    def fileSize(self):
+        position = self.file.tell()
+        self.file.seek(0,2)
+        size = self.file.tell()
+        self.file.seek(position)
+
+        return size
+
+    #Names of the sample columns in the file, in the order they first appear
+    def columns(self):
+        return list(self.index.keys())
+
+    def numChunks(self,name):
+        return len(self.index[name])
+
+    def numSamples(self,name):
+        return sum(entry["count"] for entry in self.index[name])
+
+    #Read and decode one chunk of a column
+    def readChunk(self,name,chunkIndex):
+        entry = self.index[name][chunkIndex]
+
+        self.file.seek(entry["offset"])
+        payload = self.file.read(entry["length"])
+
+        return self.codec.decodeSamples(entry["dtypeCode"],
+                                        entry["count"],
+                                        entry["first"],
+                                        payload,
+                                        entry["resolution"],
+                                        entry["method"])
+
+    #Read and decode a whole column
+    def readColumn(self,name):
+        chunks = [self.readChunk(name,index) for index in range(self.numChunks(name))]
+
+        if not chunks:
+            return np.zeros(0,dtype=np.float64)
+
+        return np.concatenate(chunks)
+
+    #Read a metadata entry
+    def readMeta(self,name):
+        entry = self.meta[name]
+
+        self.file.seek(entry["offset"])
+        payload = self.file.read(entry["length"])
+
+        return ast.literal_eval(self.codec.decompressBytes(payload,entry["method"]).decode("utf-8"))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        self.close()
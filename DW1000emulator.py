@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 DEVICE EMULATOR SOFTWARE (x64)
+
+Emulates the serial port of a DW1000 running the ranging firmware so that
+the test and streaming code can run (and be benchmarked) without hardware
+
+The emulated port behaves like the parts of a pyserial Serial object that
+DW1000serial uses: it streams range lines of the form
+    t:<device type> f:<peer address> d:<range in m> p:<RX power in dBm>
+and answers the "get,antDelay" and "set,antDelay,<value>" commands
+
+NOTES:
+-An anchor and a tag share a DW1000emulatedLink, which holds the true
+ separation; the reported range moves with the antenna delay of both ports
+ the same way it does on the hardware, so calibration loops converge
+-With rate=None a new range line is ready whenever the port is read, which
+ measures how fast the software can go; otherwise lines arrive at the given
+ rate in real time
+-With nlosRatio, that fraction of the ranges take a blocked direct path:
+ they come out long by nlosBias and nlosPowerLoss dB weaker (for checking
+ DW1000quality.py)
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import time
+
+import numpy as np
+
+#==========================================================================
+# LINK CLASS
+#==========================================================================
+class DW1000emulatedLink(object):
+    verNum = "0.0.0"
+
+    #Constants (see DW1000test)
+    speedOfLightCm = 299792458.0*100
+    antDelayLSB = 1/(499.2e6*128)
+
+    #Object initialization
+    def __init__(self,trueDist=100.0,trueAntDelay=32900,noiseStd=2.0,rxPower=-80.0,rate=None,seed=0,
+                 nlosRatio=0.0,nlosBias=(10.0,40.0),nlosPowerLoss=10.0):
+        self.trueDist = trueDist            #separation of the devices in cm
+        self.trueAntDelay = trueAntDelay    #aggregate antenna delay of the pair (register units)
+        self.noiseStd = noiseStd            #standard deviation of the range noise in cm
+        self.rxPower = rxPower              #mean RX power in dBm
+        self.rate = rate                    #range lines per second per port (None for as fast as possible)
+        self.nlosRatio = nlosRatio          #fraction of ranges with a blocked direct path
+        self.nlosBias = nlosBias            #range (cm) those ranges come out long by, drawn uniformly
+        self.nlosPowerLoss = nlosPowerLoss  #how much weaker (dB) those ranges arrive
+        self.random = np.random.RandomState(seed)
+
+        self.anchor = DW1000emulatedPort(self,"anchor","1234")
+        self.tag = DW1000emulatedPort(self,"tag","5678")
+
+    #Measured range in cm given the antenna delays currently set
+    def measuredRange(self):
+        return self.measuredSample()[0]
+
+    #Measured range in cm and RX power in dBm; NLOS ranges come out long and weak
+    def measuredSample(self):
+        delayError = self.trueAntDelay - self.anchor.antDelay - self.tag.antDelay
+        rangeVal = (self.trueDist
+                    + delayError*self.antDelayLSB*self.speedOfLightCm
+                    + self.random.normal(0,self.noiseStd))
+        rxPower = self.rxPower + self.random.normal(0,0.5)
+
+        if self.nlosRatio and (self.random.rand() < self.nlosRatio):
+            rangeVal += self.random.uniform(*self.nlosBias)
+            rxPower -= self.nlosPowerLoss
+
+        return rangeVal,rxPower
+
+    #Connect a DW1000test object to this link instead of serial ports
+    def attach(self,DW1000,readbackTimeout=0.0):
+        for role,port in (("anchor",self.anchor),("tag",self.tag)):
+            device = DW1000.devices[role]
+            device.ser = port
+            device.readbackTimeout = readbackTimeout   #the emulator answers immediately
+            DW1000.deviceConnect(role)
+
+#==========================================================================
+# PORT CLASS
+#==========================================================================
+class DW1000emulatedPort(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,link,deviceType,peerAddr):
+        self.link = link
+        self.deviceType = deviceType
+        self.peerAddr = peerAddr
+        self.antDelay = 0
+        self.timeout = 0.01     #same meaning as pyserial; how long an empty read blocks
+
+        self.buffer = bytearray()   #bytes waiting to be read
+        self.commandBuffer = bytearray()    #command characters received so far
+        self.isOpened = True
+        self.nextLineTime = time.perf_counter()
+        self.linesSent = 0
+
+    #==========================================================================
+    # STREAMING FUNCTIONS
+    #==========================================================================
+    def makeLine(self):
+        self.linesSent += 1
+        rangeVal,rxPower = self.link.measuredSample()
+
+        return "t:{0} f:{1} d:{2:.4f} p:{3:.2f}\r\n".format(self.deviceType,
+                                                          self.peerAddr,
+                                                          rangeVal/100,
+                                                          rxPower).encode()
+
+    #Add the range lines that are due by now
+    def fill(self):
+        if (self.link.rate == None):
+            if not self.buffer:
+                self.buffer.extend(self.makeLine())
+            return
+
+        now = time.perf_counter()
+
+        while (self.nextLineTime <= now):
+            self.buffer.extend(self.makeLine())
+            self.nextLineTime += 1.0/self.link.rate
+
+        #Don't build up a backlog after a long pause
+        if (now - self.nextLineTime > 1.0):
+            self.nextLineTime = now
+
+    #==========================================================================
+    # SERIAL PORT FUNCTIONS
+    #==========================================================================
+    @property
+    def in_waiting(self):
+        self.fill()
+
+        return len(self.buffer)
+
+    def read(self,size=1):
+        self.fill()
+
+        if not self.buffer:
+            #Block until the next line is due, but no longer than the timeout
+            time.sleep(max(0,min(self.timeout,self.nextLineTime - time.perf_counter())))
+            self.fill()
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+
+        return data
+
+    #Commands may arrive a character at a time (see DW1000serial.sendMessage)
+    #and end with a carriage return or line feed
+    def write(self,data):
+        self.commandBuffer.extend(data.replace(b"\n",b"\r"))
+
+        while (b"\r" in self.commandBuffer):
+            index = self.commandBuffer.index(b"\r")
+            command = self.commandBuffer[:index].decode(errors="ignore").strip()
+            del self.commandBuffer[:index+1]
+
+            if command:
+                self.runCommand(command.split(","))
+
+        return len(data)
+
+    def runCommand(self,command):
+        if (command[:2] == ["get","antDelay"]):
+            self.buffer.extend("antDelay: {0}\r\n".format(self.antDelay).encode())
+        elif (command[:2] == ["set","antDelay"]) and (len(command) == 3):
+            try: self.antDelay = int(command[2])
+            except ValueError:
+                pass
+
+    def reset_input_buffer(self):
+        del self.buffer[:]
+
+    def isOpen(self):
+        return self.isOpened
+
+    def open(self):
+        self.isOpened = True
+
+    def close(self):
+        self.isOpened = False
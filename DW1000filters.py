@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 STREAMING FILTER SOFTWARE (x64)
+
+Filters that run on the range stream one sample at a time, so that smoothed
+output only lags the raw readings by a sample instead of a whole averaging
+window
+
+FILTERS:
+-DW1000kalmanFilter: constant velocity Kalman filter; one range/range rate
+ state per link, with many links updated by the same numpy operations
+-DW1000hampelFilter: Hampel identifier; a reading is an outlier if it is
+ further from the median of the last readings than a few (scaled) median
+ absolute deviations. Outliers can be dropped (NaN), replaced with the
+ median or only flagged, and are counted per link
+
+NOTES:
+-Every update costs the same no matter how long the filter has been running
+-Filters take a value per link (NaN for a link with no new reading) and the
+ time of the readings in seconds, and return a value per link
+-The Hampel windows are kept sorted as readings come and go (a binary search
+ and one list insert/delete per reading), and the MAD is read off the sorted
+ window by walking outwards from the median, so nothing is re-sorted
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import bisect
+import collections
+
+import numpy as np
+
+#==========================================================================
+# KALMAN FILTER CLASS
+#==========================================================================
+class DW1000kalmanFilter(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,numLinks=1,processNoise=100.0,measurementNoise=2.0,initVelocityStd=100.0):
+        self.numLinks = numLinks
+        self.processNoise = processNoise            #standard deviation of the tag's acceleration (cm/s^2);
+                                                    #higher follows movement faster, lower smooths more
+        self.measurementNoise = measurementNoise    #standard deviation of a range reading (cm)
+        self.initVelocityStd = initVelocityStd      #range rate uncertainty of a new link (cm/s)
+        self.scalarLinks = 8                        #up to this many links are updated without numpy
+
+        self.reset()
+
+    #Forget every link's state
+    def reset(self):
+        self.ranges = np.full(self.numLinks,np.nan)     #range estimate per link
+        self.rates = np.zeros(self.numLinks)            #range rate estimate per link (cm/s)
+        self.lastTimes = np.full(self.numLinks,np.nan)  #time of each link's last reading
+
+        #Covariance of each link's (range, rate) state; the matrix is
+        #symmetric so three arrays are enough
+        self.p00 = np.zeros(self.numLinks)
+        self.p01 = np.zeros(self.numLinks)
+        self.p11 = np.zeros(self.numLinks)
+
+    #==========================================================================
+    # FILTER FUNCTIONS
+    #==========================================================================
+    #Add a reading per link (NaN for none) taken at the given time; returns
+    #the filtered ranges (links that haven't had a reading yet are NaN)
+    def update(self,values,timestamp):
+        #A few links are quicker one at a time than through numpy's per-call
+        #overhead
+        if (self.numLinks <= self.scalarLinks):
+            for index,value in enumerate(values):
+                self.updateLink(index,value,timestamp)
+
+            return self.ranges.copy()
+
+        values = np.asarray(values,dtype=np.float64)
+        measured = np.isfinite(values)
+        started = np.isfinite(self.lastTimes)
+
+        #The first reading of a link sets its range
+        new = measured & ~started
+
+        if new.any():
+            self.ranges[new] = values[new]
+            self.rates[new] = 0
+            self.p00[new] = self.measurementNoise**2
+            self.p01[new] = 0
+            self.p11[new] = self.initVelocityStd**2
+            self.lastTimes[new] = timestamp
+
+        #Predict the other links forward to the new readings
+        links = measured & started
+
+        if links.all():
+            links = slice(None)     #usual case; plain slices are much cheaper than masks
+        elif not links.any():
+            return self.ranges.copy()
+
+        dt = np.maximum(timestamp - self.lastTimes[links],0)
+        dt2 = dt*dt
+        accelVar = self.processNoise**2
+        p00 = self.p00[links]
+        p01 = self.p01[links]
+        p11 = self.p11[links]
+
+        ranges = self.ranges[links] + self.rates[links]*dt
+        p00 = p00 + 2*dt*p01 + dt2*p11 + accelVar*dt2*dt2/4
+        p01 = p01 + dt*p11 + accelVar*dt2*dt/2
+        p11 = p11 + accelVar*dt2
+
+        #Update with the readings
+        gain0 = p00/(p00 + self.measurementNoise**2)
+        gain1 = p01/(p00 + self.measurementNoise**2)
+        innovations = values[links] - ranges
+
+        self.ranges[links] = ranges + gain0*innovations
+        self.rates[links] += gain1*innovations
+        self.p11[links] = p11 - gain1*p01
+        self.p00[links] = (1 - gain0)*p00
+        self.p01[links] = (1 - gain0)*p01
+        self.lastTimes[links] = timestamp
+
+        return self.ranges.copy()
+
+    #Add a reading for one link; same as update() for a single link
+    def updateLink(self,index,value,timestamp):
+        if not (value == value):    #NaN: no reading
+            return
+
+        lastTime = float(self.lastTimes[index])
+
+        if not (lastTime == lastTime):  #first reading sets the range
+            self.ranges[index] = value
+            self.rates[index] = 0
+            self.p00[index] = self.measurementNoise**2
+            self.p01[index] = 0
+            self.p11[index] = self.initVelocityStd**2
+            self.lastTimes[index] = timestamp
+            return
+
+        dt = max(timestamp - lastTime,0)
+        dt2 = dt*dt
+        accelVar = self.processNoise**2
+        p00 = float(self.p00[index])
+        p01 = float(self.p01[index])
+        p11 = float(self.p11[index])
+        rate = float(self.rates[index])
+
+        rangeVal = float(self.ranges[index]) + rate*dt
+        p00 = p00 + 2*dt*p01 + dt2*p11 + accelVar*dt2*dt2/4
+        p01 = p01 + dt*p11 + accelVar*dt2*dt/2
+        p11 = p11 + accelVar*dt2
+
+        gain0 = p00/(p00 + self.measurementNoise**2)
+        gain1 = p01/(p00 + self.measurementNoise**2)
+        innovation = value - rangeVal
+
+        self.ranges[index] = rangeVal + gain0*innovation
+        self.rates[index] = rate + gain1*innovation
+        self.p11[index] = p11 - gain1*p01
+        self.p00[index] = (1 - gain0)*p00
+        self.p01[index] = (1 - gain0)*p01
+        self.lastTimes[index] = timestamp
+
+    #Ranges predicted for a time after the last readings (e.g. to fill gaps)
+    def predict(self,timestamp):
+        return self.ranges + self.rates*np.maximum(timestamp - self.lastTimes,0)
+
+    #Standard deviation of each link's range estimate (cm)
+    def rangeStd(self):
+        return np.sqrt(self.p00)
+
+#==========================================================================
+# SLIDING WINDOW CLASS
+#==========================================================================
+class DW1000slidingWindow(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,size):
+        self.size = size
+        self.values = collections.deque()   #readings in arrival order
+        self.sorted = []                    #the same readings in ascending order
+
+    def __len__(self):
+        return len(self.values)
+
+    #Add a reading, dropping the oldest one once the window is full; returns
+    #the reading that was dropped (None if there wasn't one)
+    def push(self,value):
+        oldest = None
+
+        if (len(self.values) == self.size):
+            oldest = self.values.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted,oldest)]
+
+        self.values.append(value)
+        bisect.insort(self.sorted,value)
+
+        return oldest
+
+    def clear(self):
+        self.values.clear()
+        del self.sorted[:]
+
+    def median(self):
+        count = len(self.sorted)
+        half = count//2
+
+        if (count % 2):
+            return self.sorted[half]
+
+        return (self.sorted[half-1] + self.sorted[half])/2
+
+    #Median absolute deviation from the given median: the deviations come out
+    #in ascending order when walking outwards from the median, so only half
+    #of the window is visited
+    def mad(self,median):
+        values = self.sorted
+        count = len(values)
+        left = bisect.bisect_left(values,median) - 1
+        right = left + 1
+        deviations = []
+
+        while (len(deviations) <= count//2):
+            if (left < 0):
+                deviations.append(values[right] - median)
+                right += 1
+            elif (right >= count) or (median - values[left] <= values[right] - median):
+                deviations.append(median - values[left])
+                left -= 1
+            else:
+                deviations.append(values[right] - median)
+                right += 1
+
+        if (count % 2):
+            return deviations[-1]
+
+        return (deviations[-2] + deviations[-1])/2
+
+#==========================================================================
+# HAMPEL FILTER CLASS
+#==========================================================================
+class DW1000hampelFilter(object):
+    verNum = "0.0.0"
+
+    #Constants
+    madScale = 1.4826   #MAD to standard deviation for normally distributed readings
+    modes = ("drop","replace","flag")
+
+    #Object initialization
+    def __init__(self,numLinks=1,windowSize=21,threshold=3.0,mode="drop",minSamples=5,minDeviation=5.0):
+        if not (mode in self.modes):
+            raise ValueError("Outlier mode must be one of {0}".format(", ".join(self.modes)))
+
+        self.numLinks = numLinks
+        self.windowSize = windowSize        #readings the median and MAD are taken over
+        self.threshold = threshold          #outlier if further than this many deviations from the median
+        self.mode = mode                    #what happens to outliers ('drop', 'replace' or 'flag')
+        self.minSamples = minSamples        #readings needed in the window before anything is rejected
+        self.minDeviation = minDeviation    #smallest deviation used (cm); ranges are quantized, so the
+                                            #MAD of a still tag can be 0
+
+        self.windows = [DW1000slidingWindow(windowSize) for _ in range(numLinks)]
+        self.lastOutliers = [False]*numLinks    #which links the last update flagged
+        self.resetCounts()
+
+    #Forget the windows (e.g. after the tag or the antenna delay moved)
+    def reset(self):
+        for window in self.windows:
+            window.clear()
+
+        self.lastOutliers = [False]*self.numLinks
+
+    def resetCounts(self):
+        self.checked = [0]*self.numLinks    #readings seen per link
+        self.rejected = [0]*self.numLinks   #outliers found per link
+
+    #==========================================================================
+    # FILTER FUNCTIONS
+    #==========================================================================
+    #Check a reading per link (NaN for none); returns the readings with the
+    #outliers dropped (NaN), replaced or left as they are depending on the mode.
+    #Every reading goes into the window, so a real step in range is followed
+    #once it makes up half of the window
+    def update(self,values,timestamp=None):
+        filtered = []
+
+        for index,value in enumerate(values):
+            window = self.windows[index]
+            outlier = False
+            output = value
+
+            if (value == value):    #not NaN
+                self.checked[index] += 1
+
+                if (len(window) >= self.minSamples):
+                    median = window.median()
+                    deviation = max(self.madScale*window.mad(median),self.minDeviation)
+
+                    if (abs(value - median) > self.threshold*deviation):
+                        outlier = True
+                        self.rejected[index] += 1
+
+                        if (self.mode == "drop"):
+                            output = np.nan
+                        elif (self.mode == "replace"):
+                            output = median
+
+                window.push(value)
+
+            self.lastOutliers[index] = outlier
+            filtered.append(output)
+
+        return np.array(filtered,dtype=np.float64)
+
+    #Fraction of each link's readings that were outliers
+    def rejectRatios(self):
+        return [rejected/float(checked) if checked else 0.0
+                for rejected,checked in zip(self.rejected,self.checked)]
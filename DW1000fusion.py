@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 SAMPLE FUSION SOFTWARE (x64)
+
+Pairs the anchor and tag reports of the same ranging exchange and fuses
+their two ranges into one estimate. Reading the devices one after the other
+made the Nth anchor report and the Nth tag report a pair; once the devices
+are read together (DW1000manager) or from buffered input that no longer
+holds, so reports are paired by when they arrived and who they came from
+
+METHOD:
+-Pairing: a report is paired with the other device's pending report that
+ arrived closest to it, if that is within the tolerance and their peer
+ addresses ("f:" field) agree with the pairs seen before. Pending reports
+ from before the one that was paired, and any report left waiting for longer
+ than the tolerance, are counted as unmatched and thrown away
+-Fusion: inverse variance weighting of the two ranges; the fused variance is
+ 1/(1/anchorVariance + 1/tagVariance)
+
+NOTES:
+-The anchor's peer address is the tag's and the other way round, so the
+ first pair of addresses seen for each device is remembered, and later
+ reports that disagree with it are never paired (counted as address
+ mismatches). Known pairs can be given up front instead
+-The firmware doesn't print a sequence number, so the arrival time and the
+ peer addresses are all there is to go on
+-Timestamps are in seconds and must come from a monotonic clock (e.g.
+ DW1000manager's readNs or correctedNs) so they can't jump between reports
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import collections
+
+import numpy as np
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000sampleFusion(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,tolerance=0.05,rangeStds=(2.0,2.0),roles=("anchor","tag"),peerPairs=None):
+        self.tolerance = tolerance      #longest time between two reports of the same exchange (s)
+        self.rangeStds = rangeStds      #range noise of each role (cm) for reports without a variance
+        self.roles = roles              #the two roles reports are paired between
+
+        #Peer address each role's reports are paired with, per peer address of
+        #the other role; learned from the first pairs unless given
+        #({anchorPeer:tagPeer})
+        self.peerPairs = {roles[0]:{},roles[1]:{}}
+
+        if (peerPairs != None):
+            for firstPeer,secondPeer in peerPairs.items():
+                self.peerPairs[roles[0]][firstPeer] = secondPeer
+                self.peerPairs[roles[1]][secondPeer] = firstPeer
+
+        self.reset()
+        self.resetCounts()
+
+    #Forget the reports waiting for a partner
+    def reset(self):
+        #[timestamp, sample, counted as an address mismatch] per report,
+        #oldest first
+        self.pending = {role:collections.deque() for role in self.roles}
+
+    def resetCounts(self):
+        self.matched = 0                                #pairs made
+        self.unmatched = {role:0 for role in self.roles}    #reports thrown away without a partner
+        self.addressMismatches = 0                      #reports in time but from the wrong peer
+                                                        #(each counted once)
+
+    #==========================================================================
+    # PAIRING FUNCTIONS
+    #==========================================================================
+    #Add a report (sample dictionary, see DW1000serial.parseRangeLine) from a
+    #role; returns (firstRoleSample, secondRoleSample, timeOffset) if it
+    #completes a pair, otherwise None. Reports must be added in timestamp order
+    def addReport(self,role,sample,timestamp):
+        other = self.roles[1] if (role == self.roles[0]) else self.roles[0]
+
+        self.expire(timestamp)
+
+        #Every pending report is older than this one (and not past the
+        #tolerance), so the newest one from a matching peer is the closest
+        otherPending = self.pending[other]
+        bestIndex = None
+
+        for index in range(len(otherPending)-1,-1,-1):
+            report = otherPending[index]
+
+            if self.peersAgree(role,sample,report[1]):
+                bestIndex = index
+                break
+
+            if not report[2]:
+                report[2] = True
+                self.addressMismatches += 1
+
+        if (bestIndex == None):
+            self.pending[role].append([timestamp,sample,False])
+            return None
+
+        #Reports from before the partner belonged to exchanges this device
+        #missed
+        for _ in range(bestIndex):
+            otherPending.popleft()
+            self.unmatched[other] += 1
+
+        otherTime,otherSample,_ = otherPending.popleft()
+
+        self.learnPeers(role,sample,otherSample)
+        self.matched += 1
+
+        if (role == self.roles[0]):
+            return (sample,otherSample,timestamp - otherTime)
+
+        return (otherSample,sample,otherTime - timestamp)
+
+    #Throw away reports that have waited longer than the tolerance
+    def expire(self,timestamp):
+        oldestTime = timestamp - self.tolerance
+
+        for role,pending in self.pending.items():
+            while pending and (pending[0][0] < oldestTime):
+                pending.popleft()
+                self.unmatched[role] += 1
+
+    #Whether two reports' peer addresses fit the pairs seen so far (reports
+    #without an address always fit)
+    def peersAgree(self,role,sample,otherSample):
+        peer = sample.get("peerAddr")
+        otherPeer = otherSample.get("peerAddr")
+
+        if (peer == None) or (otherPeer == None):
+            return True
+
+        other = self.roles[1] if (role == self.roles[0]) else self.roles[0]
+        knownOther = self.peerPairs[role].get(peer)
+        knownPeer = self.peerPairs[other].get(otherPeer)
+
+        return (knownOther in (None,otherPeer)) and (knownPeer in (None,peer))
+
+    def learnPeers(self,role,sample,otherSample):
+        peer = sample.get("peerAddr")
+        otherPeer = otherSample.get("peerAddr")
+
+        if (peer == None) or (otherPeer == None):
+            return
+
+        other = self.roles[1] if (role == self.roles[0]) else self.roles[0]
+        self.peerPairs[role].setdefault(peer,otherPeer)
+        self.peerPairs[other].setdefault(otherPeer,peer)
+
+    #Fraction of each role's reports that were thrown away without a partner
+    def unmatchedRatios(self):
+        return {role:self.unmatched[role]/float(self.unmatched[role] + self.matched)
+                     if (self.unmatched[role] + self.matched) else 0.0
+                for role in self.roles}
+
+    #==========================================================================
+    # FUSION FUNCTIONS
+    #==========================================================================
+    #Inverse variance weighted range of a pair (or of arrays of pairs along
+    #the last axis); variances default to the roles' range noise. NaN ranges
+    #are left out. Returns (range, variance)
+    def fuse(self,ranges,variances=None):
+        ranges = np.asarray(ranges,dtype=np.float64)
+
+        if (variances is None):
+            variances = np.square(self.rangeStds)
+
+        variances = np.broadcast_to(np.asarray(variances,dtype=np.float64),ranges.shape)
+
+        valid = np.isfinite(ranges) & np.isfinite(variances) & (variances > 0)
+        weights = np.where(valid,1/np.where(valid,variances,1),0)
+        weightSums = weights.sum(axis=-1)
+
+        with np.errstate(invalid="ignore",divide="ignore"):
+            fused = (weights*np.where(valid,ranges,0)).sum(axis=-1)/weightSums
+            fusedVariance = 1/weightSums
+
+        if (fused.ndim == 0):
+            return float(fused),float(fusedVariance)
+
+        return fused,fusedVariance
+
+    #Range variances of quality weighted reports (see DW1000quality.py): a
+    #weight of w counts like 1/w times the role's range noise variance
+    def weightedVariances(self,weights):
+        return np.square(self.rangeStds)/np.asarray(weights,dtype=np.float64)
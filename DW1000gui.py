@@ -39,12 +39,16 @@ AN:
 # IMPORTS
 #==========================================================================
 import ast
+import DW1000filters
+import DW1000render
 import DW1000test
 import os
 import sys
+import time
+
+import numpy as np
 
 from PyQt5 import (QtGui,QtCore,QtWidgets)
-from scipy.stats import norm
 
 #==========================================================================
 # ANTENNA CALIBRATION THREAD
@@ -54,10 +58,11 @@ class distMeasThread(QtCore.QObject):
     Must derive from QObject in order to emit signals, connect slots to other signals, and operate in a QThread.
     """
 
-    sig_done = QtCore.pyqtSignal()  # ask the thread to end on completion
-    sig_msg = QtCore.pyqtSignal(str, str)  # GUI field, GUI string
+    sig_done = QtCore.pyqtSignal(int)  # ask the thread to end on completion (pair ID)
+    sig_msg = QtCore.pyqtSignal(int, str, str)  # pair ID, GUI field, GUI string
+    sig_status = QtCore.pyqtSignal(int, dict)  # pair ID, coalesced progress update (see statusDict)
 
-    def __init__(self, id : int, testInfoDict, plotInfoDict):
+    def __init__(self, id : int, testInfoDict, plotInfoDict, livePlot=None):
         super().__init__()
         self.__id = id
         self.__abort = False
@@ -67,7 +72,15 @@ class distMeasThread(QtCore.QObject):
         self.testInfoDict = testInfoDict  #general test information
         self.anchorDict = {} #array for holding anchor distance values at each distance
         self.tagDict = {} #array for holding tag distance values at each distance
+        self.anchorWeightDict = {} #quality weights of the anchor distance values (see DW1000quality.py)
+        self.tagWeightDict = {} #quality weights of the tag distance values
         self.loopTimeDict = {} #array for holding loop time at each distance
+        self.livePlot = livePlot #live plot widget to stream samples to (None for no live plot)
+        self.statusRate = 10 #maximum number of progress updates sent to the GUI per second
+        self.lastStatusTime = 0 #time the last progress update was sent (perf_counter)
+
+        if (self.livePlot != None):
+            self.DW1000.sampleListeners.append(self.livePlot.pushSample)
 
         #test variables
         self.curDist = self.testInfoDict["startDist"]
@@ -87,106 +100,122 @@ class distMeasThread(QtCore.QObject):
     
             #If there was an issue connecting to the anchor, throw a warning and return
             if not (anchorResult == True):
-                self.sig_msg.emit("errGeneralMsgBox","Could not connect to {0}.".format(anchorResult))
-                self.sig_done.emit()
+                self.sig_msg.emit(self.__id,"errGeneralMsgBox","Could not connect to {0}.".format(anchorResult))
+                self.sig_done.emit(self.__id)
                 return
     
             tagResult = self.DW1000.deviceConnect("tag")
             
             #If there was an issue connecting to the devices, throw a warning and return
             if not (tagResult == True):
-                self.sig_msg.emit("errGeneralMsgBox","Could not connect to {0}.".format(tagResult))
-                self.sig_done.emit()
+                self.sig_msg.emit(self.__id,"errGeneralMsgBox","Could not connect to {0}.".format(tagResult))
+                self.sig_done.emit(self.__id)
                 return
 
             if not (self.DW1000.anchor.setAntennaDelay(self.testInfoDict["anchorAntDelayDec"])):               
                 if not (self.DW1000.anchor.setAntennaDelay(self.testInfoDict["anchorAntDelayDec"])):
-                    self.sig_msg.emit("errGeneralMsgBox","Error setting anchor\n"\
+                    self.sig_msg.emit(self.__id,"errGeneralMsgBox","Error setting anchor\n"\
                                                          "antenna delay value")
-                    self.sig_done.emit()
+                    self.sig_done.emit(self.__id)
                     return
 
             if not (self.DW1000.tag.setAntennaDelay(self.testInfoDict["tagAntDelayDec"])):
                 if not (self.DW1000.tag.setAntennaDelay(self.testInfoDict["tagAntDelayDec"])):            
-                    self.sig_msg.emit("errGeneralMsgBox","Error setting tag\n"\
+                    self.sig_msg.emit(self.__id,"errGeneralMsgBox","Error setting tag\n"\
                                                          "antenna delay value")
-                    self.sig_done.emit()
+                    self.sig_done.emit(self.__id)
                     return 
 
-            self.sig_msg.emit("infoThreadMsgBox","Please move the device to {0} cm\n"\
+            self.sig_msg.emit(self.__id,"infoThreadMsgBox","Please move the device to {0} cm\n"\
                                                  "and press 'OK' to continue.".format(self.testInfoDict["startDist"]))
 
         else:
             result = self.DW1000.fileRead(self.plotInfoDict["fileName"])
 
-            self.sig_msg.emit("statusBar","STATUS: Reading CSV file...")
+            self.sig_msg.emit(self.__id,"statusBar","STATUS: Reading data file...")
             
             if (result == None):
-                self.sig_msg.emit("errGeneralMsgBox","Unexpected value in .csv file!")
-                self.sig_done.emit()
+                self.sig_msg.emit(self.__id,"errGeneralMsgBox","Unexpected value in data file!")
+                self.sig_done.emit(self.__id)
                 return
             
-            try: distDict = ast.literal_eval(result["distDict"])
+            #.csv files store the dictionaries as strings, .rfz files as objects
+            try: distDict = self.literalValue(result["distDict"])
             except:
-                self.sig_msg.emit("errGeneralMsgBox","Unexpected value in .csv file!")
-                self.sig_done.emit()
+                self.sig_msg.emit(self.__id,"errGeneralMsgBox","Unexpected value in data file!")
+                self.sig_done.emit(self.__id)
                 return                
 
-            try: testInfoDict = ast.literal_eval(result["testInfoDict"])
+            try: testInfoDict = self.literalValue(result["testInfoDict"])
             except:
-                self.sig_msg.emit("errGeneralMsgBox","Unexpected value in .csv file!")
-                self.sig_done.emit()
+                self.sig_msg.emit(self.__id,"errGeneralMsgBox","Unexpected value in data file!")
+                self.sig_done.emit(self.__id)
                 return
 
             self.DW1000.testInfoDict = testInfoDict.copy()
 
-            self.sig_msg.emit("statusBar","STATUS: Plotting data...")
-                
-            self.DW1000.makeErrorPlotDist(distDict.copy(),self.plotInfoDict.copy())
-            self.DW1000.makeGaussianPlotDist(distDict.copy(),self.plotInfoDict.copy())
+            self.sig_msg.emit(self.__id,"statusBar","STATUS: Plotting data...")
 
-            if self.plotInfoDict["scaleData"] == True:
-                self.plotInfoDict["scaleData"] = False
-                
-                self.DW1000.makeErrorPlotDist(distDict.copy(),self.plotInfoDict.copy())
-                self.DW1000.makeGaussianPlotDist(distDict.copy(),self.plotInfoDict.copy())
+            futures = self.queuePlots(distDict,testInfoDict)
+
+            #Nothing else to do in this thread, so wait for the plots to finish
+            for future in futures:
+                try: future.result()
+                except Exception as exception:
+                    self.sig_msg.emit(self.__id,"errGeneralMsgBox","Error plotting data:\n{0}".format(exception))
+                    self.sig_done.emit(self.__id)
+                    return
 
-            self.sig_msg.emit("infoGeneralMsgBox","Data plotting complete.")
+            self.sig_msg.emit(self.__id,"infoGeneralMsgBox","Data plotting complete.")
 
-            self.sig_done.emit()
+            self.sig_done.emit(self.__id)
         
     def innerLoop(self):
-        self.sig_msg.emit("statusBar","STATUS: Collecting data...")
+        self.sig_msg.emit(self.__id,"statusBar","STATUS: Collecting data...")
+
+        if (self.livePlot != None):
+            self.livePlot.clear()
 
         while (len(self.DW1000.anchorRangeBuffer) < self.testInfoDict["numSamples"]):
+            if self.__abort:
+                self.DW1000.clearBuffers()
+                self.DW1000.deviceDisconnect("anchor")
+                self.DW1000.deviceDisconnect("tag")
+                self.sig_done.emit(self.__id)
+                return
+
             if not (self.DW1000.distMeasLoop()):
-                self.sig_msg.emit("errGeneralMsgBox","Lost device connection, please try again.")
-                self.sig_msg.emit("testProgressBar",str(0))
-                self.sig_msg.emit("loopProgressBar",str(0))
-                self.sig_msg.emit("loopProgressBar_Label","Loop time remaining: N/A")
+                if self.__abort:
+                    self.DW1000.clearBuffers()
+                    self.sig_done.emit(self.__id)
+                    return
+
+                self.sig_msg.emit(self.__id,"errGeneralMsgBox","Lost device connection, please try again.")
+                self.sig_msg.emit(self.__id,"testProgressBar",str(0))
+                self.sig_msg.emit(self.__id,"loopProgressBar",str(0))
+                self.sig_msg.emit(self.__id,"loopProgressBar_Label","Loop time remaining: N/A")
                 self.DW1000.clearBuffers()
-                self.sig_done.emit()
+                self.sig_done.emit(self.__id)
                 return
 
-            loopProgressVal = int(len(self.DW1000.anchorRangeBuffer)*100/self.testInfoDict["numSamples"])
-            
-            totalNumSamples = (self.testInfoDict["numSteps"]+1)*self.testInfoDict["numSamples"]
-            cumulativeSamples = (self.curDist - self.testInfoDict["startDist"])*self.testInfoDict["numSamples"]/self.testInfoDict["stepDist"]
-            testProgressVal = int((len(self.DW1000.anchorRangeBuffer) + cumulativeSamples)*100/totalNumSamples)
-            
-            self.sig_msg.emit("testProgressBar",str(testProgressVal))                
-            self.sig_msg.emit("loopProgressBar",str(loopProgressVal))
-            self.sig_msg.emit("loopProgressBar_Label","Loop time remaining: {0}".format(self.DW1000.remainTimeStr))
+            self.emitStatus()
+
+        self.emitStatus(force=True)
         
         self.anchorDict["{0} cm".format(self.curDist)] = list(self.DW1000.anchorRangeBuffer)
         self.tagDict["{0} cm".format(self.curDist)] = list(self.DW1000.tagRangeBuffer)
+        self.anchorWeightDict["{0} cm".format(self.curDist)] = list(self.DW1000.anchorWeightBuffer)
+        self.tagWeightDict["{0} cm".format(self.curDist)] = list(self.DW1000.tagWeightBuffer)
         self.loopTimeDict["{0} cm".format(self.curDist)] = list(self.DW1000.loopTimeBuffer)
 
         if self.testInfoDict["testType"] == "distMeas":
-            anchorMu, anchorSigma = norm.fit(sorted(self.anchorDict["{0} cm".format(self.curDist)]))
-            tagMu, tagSigma = norm.fit(sorted(self.tagDict["{0} cm".format(self.curDist)]))
+            #Maximum likelihood normal fit (same as scipy.stats.norm.fit)
+            anchorVals = np.asarray(self.anchorDict["{0} cm".format(self.curDist)])
+            tagVals = np.asarray(self.tagDict["{0} cm".format(self.curDist)])
+            anchorMu, anchorSigma = anchorVals.mean(), anchorVals.std()
+            tagMu, tagSigma = tagVals.mean(), tagVals.std()
     
-            self.sig_msg.emit("infoGeneralMsgBox","At {0} cm:\n"\
+            self.sig_msg.emit(self.__id,"infoGeneralMsgBox","At {0} cm:\n"\
                                                   "Anchor average: {1:.3f} cm\n"\
                                                   "Anchor std dev: {2:.3f} cm\n"\
                                                   "Tag average: {3:.3f} cm\n"\
@@ -200,12 +229,18 @@ class distMeasThread(QtCore.QObject):
         self.curDist += self.testInfoDict["stepDist"] #increase distance
         
         if not (self.curDist > self.testInfoDict["stopDist"]): #If we're at the last distance, don't print a message
-            self.sig_msg.emit("statusBar","STATUS: Data collection at {0} cm complete.".format(self.curDist))
-            self.sig_msg.emit("infoThreadMsgBox","Please move the device to {0} cm\n"\
+            self.sig_msg.emit(self.__id,"statusBar","STATUS: Data collection at {0} cm complete.".format(self.curDist))
+            self.sig_msg.emit(self.__id,"infoThreadMsgBox","Please move the device to {0} cm\n"\
                                                  "and press 'OK' to continue.".format(self.curDist))
         else:
             self.outerLoop()
 
+    #Run the next step of the test if the GUI asked this pair to (see DW1000testGUI.sig_step)
+    @QtCore.pyqtSlot(int)
+    def step(self, id : int):
+        if (id == self.__id) and not self.__abort:
+            self.outerLoop()
+
     def outerLoop(self):
         if (self.curDist <= self.testInfoDict["stopDist"]):
             self.innerLoop()
@@ -213,29 +248,33 @@ class distMeasThread(QtCore.QObject):
             if (self.testInfoDict["testType"] == "antDelayCal"):
                 anchorAntDelayDec,tagAntDelayDec = self.DW1000.getAntDelay((self.testInfoDict["startDist"]/100),
                                                                             self.anchorDict["{0} cm".format(self.testInfoDict["startDist"])],
-                                                                            self.tagDict["{0} cm".format(self.testInfoDict["startDist"])])
+                                                                            self.tagDict["{0} cm".format(self.testInfoDict["startDist"])],
+                                                                            self.anchorWeightDict["{0} cm".format(self.testInfoDict["startDist"])])
 
-                self.sig_msg.emit("infoGeneralMsgBox","Press 'OK' to find optimal \n"\
+                self.sig_msg.emit(self.__id,"infoGeneralMsgBox","Press 'OK' to find optimal \n"\
                                                       "antenna delay value...")
-                self.sig_msg.emit("testProgressBar",str(0))
-                self.sig_msg.emit("loopProgressBar",str(0))
-                self.sig_msg.emit("loopProgressBar_Label","Loop time remaining: N/A")
-                self.sig_msg.emit("statusBar","STATUS: Finding optimal antenna delay value...")
+                self.sig_msg.emit(self.__id,"testProgressBar",str(0))
+                self.sig_msg.emit(self.__id,"loopProgressBar",str(0))
+                self.sig_msg.emit(self.__id,"loopProgressBar_Label","Loop time remaining: N/A")
+                self.sig_msg.emit(self.__id,"statusBar","STATUS: Finding optimal antenna delay value...")
                 
                 anchorAntDelayDec = self.DW1000.antDelayCalLoop(anchorAntDelayDec)
 
-                if (anchorAntDelayDec == None):
-                    self.sig_msg.emit("errGeneralMsgBox","Error calibrating\n"\
+                if (anchorAntDelayDec == None) and self.__abort:
+                    self.sig_done.emit(self.__id)
+                    return
+                elif (anchorAntDelayDec == None):
+                    self.sig_msg.emit(self.__id,"errGeneralMsgBox","Error calibrating\n"\
                                                          "antenna delay")
-                    self.sig_done.emit()
+                    self.sig_done.emit(self.__id)
                     return
                 else:
-                    self.sig_msg.emit("infoGeneralMsgBox","Calibration complete.\n"\
+                    self.sig_msg.emit(self.__id,"infoGeneralMsgBox","Calibration complete.\n"\
                                                           "Anchor antenna delay: {0}\n"\
                                                           "Tag antenna delay: {1}\n".format(anchorAntDelayDec,tagAntDelayDec))                    
 
-                self.sig_msg.emit("anchorDelaySpinBox",str(anchorAntDelayDec))
-                self.sig_msg.emit("tagDelaySpinBox",str(tagAntDelayDec))
+                self.sig_msg.emit(self.__id,"anchorDelaySpinBox",str(anchorAntDelayDec))
+                self.sig_msg.emit(self.__id,"tagDelaySpinBox",str(tagAntDelayDec))
 
                 self.testInfoDict["anchorAntDelayDec"] = anchorAntDelayDec
                 self.testInfoDict["tagAntDelayDec"] = tagAntDelayDec
@@ -243,16 +282,8 @@ class distMeasThread(QtCore.QObject):
             self.DW1000.testInfoDict["device"] = "anchor"
             
             if self.testInfoDict["testType"] == "distMeas":
-                self.sig_msg.emit("statusBar","STATUS: Plotting anchor data...")
-                
-                self.DW1000.makeErrorPlotDist(self.anchorDict.copy(),self.plotInfoDict.copy())
-                self.DW1000.makeGaussianPlotDist(self.anchorDict.copy(),self.plotInfoDict.copy())
-                
-                if self.plotInfoDict["scaleData"] == True:
-                    self.plotInfoDict["scaleData"] = False
-                    self.DW1000.makeErrorPlotDist(self.anchorDict.copy(),self.plotInfoDict.copy())
-                    self.DW1000.makeGaussianPlotDist(self.anchorDict.copy(),self.plotInfoDict.copy())
-                    self.plotInfoDict["scaleData"] = True
+                self.sig_msg.emit(self.__id,"statusBar","STATUS: Queueing anchor plots...")
+                self.queuePlots(self.anchorDict,self.DW1000.testInfoDict,self.anchorWeightDict)
                     
             self.DW1000.fileWrite(self.anchorDict,
                                   self.loopTimeDict)
@@ -260,15 +291,8 @@ class distMeasThread(QtCore.QObject):
             self.DW1000.testInfoDict["device"] = "tag"
             
             if self.testInfoDict["testType"] == "distMeas":
-                self.sig_msg.emit("statusBar","STATUS: Plotting tag data...")
-                
-                self.DW1000.makeErrorPlotDist(self.tagDict.copy(),self.plotInfoDict.copy())
-                self.DW1000.makeGaussianPlotDist(self.tagDict.copy(),self.plotInfoDict.copy())
-                
-                if self.plotInfoDict["scaleData"] == True:
-                    self.plotInfoDict["scaleData"] = False
-                    self.DW1000.makeErrorPlotDist(self.tagDict.copy(),self.plotInfoDict.copy())
-                    self.DW1000.makeGaussianPlotDist(self.tagDict.copy(),self.plotInfoDict.copy())
+                self.sig_msg.emit(self.__id,"statusBar","STATUS: Queueing tag plots...")
+                self.queuePlots(self.tagDict,self.DW1000.testInfoDict,self.tagWeightDict)
                 
             self.DW1000.fileWrite(self.tagDict,
                                   self.loopTimeDict)
@@ -277,12 +301,70 @@ class distMeasThread(QtCore.QObject):
             self.DW1000.deviceDisconnect("tag")
 
             if (self.testInfoDict["testType"] == "distMeas"):
-                self.sig_msg.emit("infoGeneralMsgBox","Distance data collection complete.\n")
+                self.sig_msg.emit(self.__id,"infoGeneralMsgBox","Distance data collection complete.\n")
 
-            self.sig_done.emit()
+            self.sig_done.emit(self.__id)
 
+    #Called directly from the GUI thread (not through a signal) so that a
+    #running loop sees the flag before its next sample; any serial query in
+    #progress returns within one poll interval
     def abort(self):
         self.__abort = True
+        self.DW1000.cancel()
+
+    #Send the progress of the test to the GUI as a single update, at most
+    #statusRate times per second unless forced
+    def emitStatus(self,force=False):
+        now = time.perf_counter()
+
+        if not force and ((now - self.lastStatusTime) < 1.0/self.statusRate):
+            return
+
+        self.lastStatusTime = now
+        self.sig_status.emit(self.__id,self.statusDict())
+
+    #Current progress of the test
+    def statusDict(self):
+        loopProgressVal = int(len(self.DW1000.anchorRangeBuffer)*100/self.testInfoDict["numSamples"])
+        
+        totalNumSamples = (self.testInfoDict["numSteps"]+1)*self.testInfoDict["numSamples"]
+        cumulativeSamples = (self.curDist - self.testInfoDict["startDist"])*self.testInfoDict["numSamples"]/self.testInfoDict["stepDist"]
+        testProgressVal = int((len(self.DW1000.anchorRangeBuffer) + cumulativeSamples)*100/totalNumSamples)
+
+        return {"testProgress":testProgressVal,
+                "loopProgress":loopProgressVal,
+                "remainTime":self.DW1000.remainTimeStr,
+                "serialStats":self.DW1000.serialStatsSummary()}
+
+    #Hand the plots for one device to the render processes, with the quality
+    #weights of its ranges if there are any (files don't keep them); returns
+    #the futures
+    def queuePlots(self,distDict,testInfoDict,weightDict=None):
+        futures = DW1000render.getRenderQueue().submitPlotSet(distDict,
+                                                               self.plotInfoDict,
+                                                               testInfoDict,
+                                                               weightDict)
+
+        for future in futures:
+            future.add_done_callback(self.plotDone)
+
+        return futures
+
+    #Called from the render queue when a plot has been saved (or failed)
+    def plotDone(self,future):
+        try: fileName = future.result()
+        except Exception as exception:
+            self.sig_msg.emit(self.__id,"statusBar","STATUS: Error plotting data ({0})".format(exception))
+            return
+
+        self.sig_msg.emit(self.__id,"statusBar","STATUS: Saved '{0}'".format(fileName))
+
+    #Evaluate a value read from a data file if it is still in string form
+    def literalValue(self,value):
+        if isinstance(value,str):
+            return ast.literal_eval(value)
+
+        return value
 
 #==========================================================================
 # GUI CLASS
@@ -293,9 +375,9 @@ class DW1000testGUI(QtWidgets.QWidget):
     #==========================================================================
     verNum = "0.5.0"
     
-    sig_abort_workers = QtCore.pyqtSignal() #Signal used to abort worker threads
+    sig_step = QtCore.pyqtSignal(int) #Signal used to run the next step of a pair's test (pair ID)
     
-    NUM_THREADS = 1 #Maximum number of threads
+    NUM_THREADS = 4 #Maximum number of threads (one per anchor/tag pair)
 
     #Initialize GUI parent
     def __init__(self):       
@@ -334,6 +416,16 @@ class DW1000testGUI(QtWidgets.QWidget):
                              "tagBaud":115200, #baud rate for tag (add to GUI)
                              "anchorAntDelayDec":32900, #anchor antenna delay in decimal
                              "tagAntDelayDec":0, #tag antenna delay in decimal
+                             "compressData":False, #Whether or not to save data as a compressed .rfz file
+                             "outlierMode":"off", #What to do with range outliers before they are buffered ('drop', 'replace', 'flag' or 'off')
+                             "outlierWindow":21, #Number of recent ranges the outlier median/MAD is taken over
+                             "outlierThreshold":3.0, #Ranges further than this many deviations from the median are outliers
+                             "outlierMinDeviation":5.0, #Smallest deviation (cm) the outlier test uses, so the normal noise of a quiet link isn't rejected
+                             "nlosWeighting":False, #Whether or not to weight ranges by their NLOS quality in the averages and fits
+                             "nlosRangeStd":2.0, #Expected line of sight range noise in cm for the NLOS classifier
+                             "pairTolerance":0.0, #Seconds between anchor and tag reports of the same exchange, e.g. 0.05 (0 to pair the newest reports instead)
+                             "timingCorrection":False, #Whether or not to correct report times for each port's latency and jitter
+                             "framePeriod":0.0, #Firmware range line period in s for the timing correction (0 to estimate it)
                              "enableDebug":False} #Whether or not to enable debug mode
         self.plotInfoDict = {"makeGaussPlot":True, #whether or not to make the gaussian part of the average plot
                              "makeHistPlot":True, #whether or not to make the histogram part of the average plot
@@ -344,7 +436,10 @@ class DW1000testGUI(QtWidgets.QWidget):
                              "useFile":False, #Whether or not to use a file for data plotting
                              "show":False, #Whether or not to display the plot
                              "minTruncDist":5, #lower limit for truncation
-                             "maxTruncDist":5} #upper limit for truncation
+                             "maxTruncDist":5, #upper limit for truncation
+                             "smoothLivePlot":True, #whether or not to draw Kalman filtered ranges on the live plot
+                             "kalmanProcessNoise":100.0, #expected tag acceleration in cm/s^2 (higher follows movement faster)
+                             "kalmanMeasurementNoise":2.0} #expected range noise in cm (higher smooths more)
  
         self.testInfoDict["numSteps"] = (self.testInfoDict["stopDist"] - self.testInfoDict["startDist"])/self.testInfoDict["stepDist"]
 
@@ -366,6 +461,8 @@ class DW1000testGUI(QtWidgets.QWidget):
         self.antDelayMax = 2**16-1  #maximum antenna delay value
         self.antDelayDef = 32900    #reasonable default value for antenna delay
 
+        self.numPairsDef = 1 #default number of anchor/tag pairs to test at once
+
         super().__init__()
         
         if getattr(sys, 'frozen', False):
@@ -379,8 +476,11 @@ class DW1000testGUI(QtWidgets.QWidget):
 
         #Initialize threads
         QtCore.QThread.currentThread().setObjectName('mainThread')  # threads can be named, useful for log output
-        self.__workers_done = None
         self.__threads = None
+        self.__running = set() #IDs of the pairs whose test is still running
+        self.__stopping = [] #(thread, worker) of aborted pairs whose thread hasn't finished yet
+        self.__serialStats = {} #pair ID -> latest serial receive statistics (see updateStatus)
+        self.closeTimeout = 1.0 #longest to wait for worker threads when the GUI is closed, in seconds
     
         self.initWidgets()
 
@@ -397,6 +497,9 @@ class DW1000testGUI(QtWidgets.QWidget):
         self.Vframe2 = QtWidgets.QFrame(self)
         self.Vframe2.setFrameStyle(QtWidgets.QFrame.VLine)
 
+        self.Vframe3 = QtWidgets.QFrame(self)
+        self.Vframe3.setFrameStyle(QtWidgets.QFrame.VLine)
+
         self.mainHframe = QtWidgets.QFrame(self)
         self.mainHframe.setFrameStyle(QtWidgets.QFrame.HLine)
         
@@ -408,13 +511,24 @@ class DW1000testGUI(QtWidgets.QWidget):
 
         #Information widgets
         self.guiStatusBar = QtWidgets.QStatusBar(self)  
+        self.serialStats_Label = QtWidgets.QLabel(self) #serial receive statistics of the running pairs
+        self.guiStatusBar.addPermanentWidget(self.serialStats_Label)
             #Need separate message boxes as the thread box triggers the thread's outer loop
         self.generalMsgBox = QtWidgets.QMessageBox(self)
         
             #Deals with messages involving the thread
         self.threadMsgBox = QtWidgets.QMessageBox(self)
         self.threadMsgBox.buttonClicked.connect(self.workerLoop)
-        self.threadMsgBox.closeEvent = self.msgBoxCloseEvent
+        self.threadMsgBox.closeEvent = lambda event: self.msgBoxCloseEvent(event,0)
+        self.threadMsgBox.setWindowModality(QtCore.Qt.NonModal) #other pairs may need answering too
+
+            #Live range/histogram/RX power plot fed by the measurement thread;
+            #the canvas (and matplotlib) is only loaded when the first test starts
+        self.livePlot = None
+        self.livePlot_Frame = QtWidgets.QWidget(self)
+        self.livePlot_Frame.setMinimumSize(400,600)
+        self.livePlot_Layout = QtWidgets.QVBoxLayout(self.livePlot_Frame)
+        self.livePlot_Layout.setContentsMargins(0,0,0,0)
 
         #Labels
         self.setupSec_Label = QtWidgets.QLabel("<b>Device setup</b>", self)
@@ -438,6 +552,9 @@ class DW1000testGUI(QtWidgets.QWidget):
         self.filePlotSec_Label = QtWidgets.QLabel("<b>Plot from file</b>", self)
         self.filePlotSec_Label.setObjectName('filePlotSec_Label')
 
+        self.pairSec_Label = QtWidgets.QLabel("<b>Additional device pairs</b>", self)
+        self.pairSec_Label.setObjectName('pairSec_Label')
+
         #Buttons
         #Refresh icon to use
         self.refreshIconDir = os.path.join(self.basedir,'refresh.ico')
@@ -467,6 +584,13 @@ class DW1000testGUI(QtWidgets.QWidget):
         self.distMeas_PushButton.clicked.connect(self.startThread) 
         self.distMeas_PushButton.setObjectName("distMeas_PushButton")
 
+        #Button to abort the test of the first pair
+        self.abort_PushButton = QtWidgets.QPushButton("Abort")
+        self.abort_PushButton.setFixedWidth(75)
+        self.abort_PushButton.setObjectName("abort_PushButton")
+        self.abort_PushButton.clicked.connect(lambda: self.abortPair(0))
+        self.abort_PushButton.setEnabled(False)
+
         #Button to select distance file to plot from
         self.filePlot_PushButton = QtWidgets.QPushButton("Browse")
         self.filePlot_PushButton.setFixedWidth(75)
@@ -536,6 +660,30 @@ class DW1000testGUI(QtWidgets.QWidget):
         self.truncData_CheckBox_Label.setObjectName('truncData_CheckBox_Label')
         self.truncData_CheckBox_Label.clicked.connect(lambda: self.configureWidgets({self.truncData_CheckBox_Label.objectName():None}))
         
+        #Check box to save data compressed
+        self.compressData_CheckBox = QtWidgets.QCheckBox()
+        self.compressData_CheckBox.setObjectName('compressData_CheckBox')
+        self.compressData_CheckBox.setChecked(False)
+        self.compressData_CheckBox.setToolTip("Sets whether or not to save test\n"\
+                                              "data as a compressed .rfz file\n"\
+                                              "instead of a .csv file.")
+            #Compress data check box label
+        self.compressData_CheckBox_Label = ExtendedQLabel("Compress saved data", self)
+        self.compressData_CheckBox_Label.setObjectName('compressData_CheckBox_Label')
+        self.compressData_CheckBox_Label.clicked.connect(lambda: self.configureWidgets({self.compressData_CheckBox_Label.objectName():None}))
+        
+        #Check box to draw filtered ranges on the live plot
+        self.smoothLivePlot_CheckBox = QtWidgets.QCheckBox()
+        self.smoothLivePlot_CheckBox.setObjectName('smoothLivePlot_CheckBox')
+        self.smoothLivePlot_CheckBox.setChecked(True)
+        self.smoothLivePlot_CheckBox.setToolTip("Sets whether or not to draw Kalman\n"\
+                                                "filtered ranges over the raw ranges\n"\
+                                                "on the live plot.")
+            #Smooth live plot check box label
+        self.smoothLivePlot_CheckBox_Label = ExtendedQLabel("Smooth live plot", self)
+        self.smoothLivePlot_CheckBox_Label.setObjectName('smoothLivePlot_CheckBox_Label')
+        self.smoothLivePlot_CheckBox_Label.clicked.connect(lambda: self.configureWidgets({self.smoothLivePlot_CheckBox_Label.objectName():None}))
+        
         #Progress bars
         #Loop progress bar 
         self.loopProgressBar = QtWidgets.QProgressBar(self)
@@ -742,10 +890,42 @@ class DW1000testGUI(QtWidgets.QWidget):
         self.tagDelay_SpinBox_Label = QtWidgets.QLabel("Tag delay:", self)
         self.tagDelay_SpinBox_Label.setObjectName('tagDelay_SpinBox_Label')
 
+        #Spinbox for the number of anchor/tag pairs to test at once
+        self.numPairs_SpinBox = QtWidgets.QSpinBox(self)
+        self.numPairs_SpinBox.setMaximumHeight(25)
+        self.numPairs_SpinBox.setMaximumWidth(60)
+        self.numPairs_SpinBox.setObjectName('numPairs_SpinBox')
+        self.numPairs_SpinBox.setRange(1,self.NUM_THREADS)
+        self.numPairs_SpinBox.setValue(self.numPairsDef)
+        self.numPairs_SpinBox.valueChanged.connect(self.showPairWidgets)
+        self.numPairs_SpinBox.setToolTip("Sets the number of anchor/tag\n"\
+                                         "pairs to test at the same time.\n"\
+                                         "Each pair needs its own ports.")
+
+            #number of pairs spinbox label
+        self.numPairs_SpinBox_Label = QtWidgets.QLabel("Device pairs:", self)
+        self.numPairs_SpinBox_Label.setObjectName('numPairs_SpinBox_Label')
+
+        #Widgets for each anchor/tag pair; the first pair uses the widgets above
+        self.pairWidgets = [{"anchorComPort":self.anchorComPort_ComboBox,
+                             "tagComPort":self.tagComPort_ComboBox,
+                             "anchorDelay":self.anchorDelay_SpinBox,
+                             "tagDelay":self.tagDelay_SpinBox,
+                             "testProgressBar":self.testProgressBar,
+                             "loopProgressBar":self.loopProgressBar,
+                             "loopProgressBar_Label":self.loopProgressBar_Label,
+                             "abort_PushButton":self.abort_PushButton,
+                             "threadMsgBox":self.threadMsgBox,
+                             "row":None}]
+
+        for pairId in range(1,self.NUM_THREADS):
+            self.pairWidgets.append(self.initPairWidgets(pairId))
+
         #Initial Stuff
         self.Main = QtWidgets.QGridLayout()     
         self.Main.addWidget(self.Vframe1,0,2,12,1)
         self.Main.addWidget(self.Vframe2,0,5,12,1)
+        self.Main.addWidget(self.Vframe3,0,9,13,1)
 
         #Setup and test section
         #######################################################################
@@ -772,6 +952,11 @@ class DW1000testGUI(QtWidgets.QWidget):
         
         self.Main.addWidget(self.antDelayCal_PushButton,9,0)
         self.Main.addWidget(self.distMeas_PushButton,9,1)
+
+        self.Main.addWidget(self.abort_PushButton,10,1)
+
+        self.Main.addWidget(self.numPairs_SpinBox_Label,11,0)
+        self.Main.addWidget(self.numPairs_SpinBox,11,1)
         
         #Configure section
         #######################################################################
@@ -833,10 +1018,28 @@ class DW1000testGUI(QtWidgets.QWidget):
         self.Main.addWidget(self.filePlotSec_Label,8,6,1,2)
         self.Main.addWidget(self.filePlot_PushButton,9,6,1,2)
 
+        self.Main.addWidget(self.compressData_CheckBox,10,6)
+        self.Main.addWidget(self.compressData_CheckBox_Label,10,7,1,2)
+
+        self.Main.addWidget(self.smoothLivePlot_CheckBox,11,6)
+        self.Main.addWidget(self.smoothLivePlot_CheckBox_Label,11,7,1,2)
+
         self.Main.addWidget(self.mainHframe,12,0,1,9)
 
+        #Live plot
+        self.Main.addWidget(self.livePlot_Frame,0,10,13,1)
+
+        #Additional pairs section
+        #######################################################################
+        self.Main.addWidget(self.pairSec_Label,13,0,1,2)
+
+        for pairId in range(1,self.NUM_THREADS):
+            self.Main.addWidget(self.pairWidgets[pairId]["row"],13+pairId,0,1,11)
+
+        self.showPairWidgets()
+
         #Status bar
-        self.Main.addWidget(self.guiStatusBar,13,0,1,11,alignment = QtCore.Qt.AlignBottom)  
+        self.Main.addWidget(self.guiStatusBar,13+self.NUM_THREADS,0,1,11,alignment = QtCore.Qt.AlignBottom)  
         
         if self.guiOnly == True:  
             self.guiStatusBar.showMessage("***NOTE: DW1000 control disabled***")
@@ -846,9 +1049,84 @@ class DW1000testGUI(QtWidgets.QWidget):
         #Instantiate main widget      
         self.setLayout(self.Main)
 
+    #Make the row of widgets for an additional anchor/tag pair
+    def initPairWidgets(self,pairId):
+        pair = {}
+
+        pair["row"] = QtWidgets.QWidget(self)
+        layout = QtWidgets.QHBoxLayout(pair["row"])
+        layout.setContentsMargins(0,0,0,0)
+
+        pair["anchorComPort"] = QtWidgets.QComboBox(pair["row"])
+        pair["tagComPort"] = QtWidgets.QComboBox(pair["row"])
+
+        for device in ("anchor","tag"):
+            pair["{0}Delay".format(device)] = QtWidgets.QSpinBox(pair["row"])
+            pair["{0}Delay".format(device)].setMaximumHeight(25)
+            pair["{0}Delay".format(device)].setMaximumWidth(60)
+            pair["{0}Delay".format(device)].setRange(self.antDelayMin,self.antDelayMax)
+
+        pair["anchorDelay"].setValue(self.antDelayDef)
+        pair["tagDelay"].setValue(self.antDelayMin)
+
+        pair["testProgressBar"] = QtWidgets.QProgressBar(pair["row"])
+        pair["testProgressBar"].setFixedWidth(150)
+        pair["testProgressBar"].setValue(0)
+
+        pair["loopProgressBar"] = QtWidgets.QProgressBar(pair["row"])
+        pair["loopProgressBar"].setFixedWidth(150)
+        pair["loopProgressBar"].setValue(0)
+
+        pair["loopProgressBar_Label"] = QtWidgets.QLabel("Loop time remaining: N/A", pair["row"])
+        pair["loopProgressBar_Label"].setFixedWidth(175)
+
+        pair["abort_PushButton"] = QtWidgets.QPushButton("Abort",pair["row"])
+        pair["abort_PushButton"].setFixedWidth(75)
+        pair["abort_PushButton"].clicked.connect(lambda: self.abortPair(pairId))
+        pair["abort_PushButton"].setEnabled(False)
+
+        pair["threadMsgBox"] = QtWidgets.QMessageBox(self)
+        pair["threadMsgBox"].buttonClicked.connect(lambda button: self.sig_step.emit(pairId))
+        pair["threadMsgBox"].closeEvent = lambda event: self.msgBoxCloseEvent(event,pairId)
+        pair["threadMsgBox"].setWindowModality(QtCore.Qt.NonModal)
+
+        layout.addWidget(QtWidgets.QLabel("Pair {0}".format(pairId+1),pair["row"]))
+        layout.addWidget(QtWidgets.QLabel("Anchor Port:",pair["row"]))
+        layout.addWidget(pair["anchorComPort"])
+        layout.addWidget(QtWidgets.QLabel("Tag Port:",pair["row"]))
+        layout.addWidget(pair["tagComPort"])
+        layout.addWidget(QtWidgets.QLabel("Anchor delay:",pair["row"]))
+        layout.addWidget(pair["anchorDelay"])
+        layout.addWidget(QtWidgets.QLabel("Tag delay:",pair["row"]))
+        layout.addWidget(pair["tagDelay"])
+        layout.addWidget(pair["testProgressBar"])
+        layout.addWidget(pair["loopProgressBar"])
+        layout.addWidget(pair["loopProgressBar_Label"])
+        layout.addWidget(pair["abort_PushButton"])
+        layout.addStretch()
+
+        return pair
+
     #==========================================================================
     # GUI-RELATED SUPPORTING FUNCTIONS
     #==========================================================================
+    #Only show the widgets for the number of pairs selected
+    def showPairWidgets(self):
+        numPairs = self.numPairs_SpinBox.value()
+
+        self.pairSec_Label.setVisible(numPairs > 1)
+
+        for pairId in range(1,self.NUM_THREADS):
+            self.pairWidgets[pairId]["row"].setVisible(pairId < numPairs)
+
+    #Enable or disable the port and delay widgets of the additional pairs
+    def setPairWidgetsEnabled(self,state):
+        self.numPairs_SpinBox.setEnabled(state)
+
+        for pair in self.pairWidgets[1:]:
+            for key in ("anchorComPort","tagComPort","anchorDelay","tagDelay"):
+                pair[key].setEnabled(state)
+
     #Error-checking for spinboxes
     def spinboxChecker(self):
         widgetInfo = self.widgetInfo()
@@ -943,6 +1221,63 @@ class DW1000testGUI(QtWidgets.QWidget):
         elif field == "statusBar":
             self.guiStatusBar.showMessage(value)
 
+    #Apply a coalesced progress update from a worker (see distMeasThread.statusDict)
+    def updateStatus(self,pairId,statusDict):
+        pair = self.pairWidgets[pairId]
+
+        pair["testProgressBar"].setValue(statusDict["testProgress"])
+        pair["loopProgressBar"].setValue(statusDict["loopProgress"])
+        pair["loopProgressBar_Label"].setText("Loop time remaining: {0}".format(statusDict["remainTime"]))
+
+        #Serial receive statistics of every running pair
+        self.__serialStats[pairId] = statusDict["serialStats"]
+        pairStats = sorted(self.__serialStats.items())
+
+        if (len(pairStats) > 1):
+            self.serialStats_Label.setText("\n".join("Pair {0} - {1}".format(idx+1,stats) for idx,stats in pairStats))
+        else:
+            self.serialStats_Label.setText(pairStats[0][1])
+
+    #Route a message from a worker to the widgets of its pair
+    def workerMsg(self,pairId,field,value):
+        #Anything but status messages from an aborted pair is stale
+        if not (pairId in self.__running) and (field != "statusBar"):
+            return
+
+        pair = self.pairWidgets[pairId]
+        pairLabel = "Pair {0}".format(pairId+1) if (len(self.__threads) > 1) else None
+
+        if (field == "testProgressBar") or (field == "loopProgressBar"):
+            pair[field].setValue(int(value))
+        elif (field == "loopProgressBar_Label"):
+            pair[field].setText(value)
+        elif (field == "anchorDelaySpinBox"):
+            pair["anchorDelay"].setValue(int(value))
+        elif (field == "tagDelaySpinBox"):
+            pair["tagDelay"].setValue(int(value))
+
+        elif (field == "errThreadMsgBox") or (field == "infoThreadMsgBox"):
+            if (field == "errThreadMsgBox"):
+                pair["threadMsgBox"].setIcon(QtWidgets.QMessageBox.Warning)
+                title = "Error"
+            else:
+                pair["threadMsgBox"].setIcon(QtWidgets.QMessageBox.Information)
+                title = "Information"
+
+            if (pairLabel != None):
+                title = "{0} ({1})".format(title,pairLabel)
+
+            pair["threadMsgBox"].setWindowTitle(title)
+            pair["threadMsgBox"].setText(value)
+            pair["threadMsgBox"].show()
+
+        elif (pairLabel != None) and (field == "statusBar"):
+            self.updateGui(field,"{0} - {1}".format(pairLabel,value))
+        elif (pairLabel != None) and field.endswith("MsgBox"):
+            self.updateGui(field,"{0}:\n{1}".format(pairLabel,value))
+        else:
+            self.updateGui(field,value)
+
     #Configure various GUI-related widgets
     def configureWidgets(self,widgetDict):
         for widget,state in widgetDict.items():
@@ -993,6 +1328,7 @@ class DW1000testGUI(QtWidgets.QWidget):
         self.testInfoDict["anchorBaud"] = self.baudRate_ComboBox.currentText()
         self.testInfoDict["tagPort"] = self.tagComPort_ComboBox.currentText()
         self.testInfoDict["tagBaud"] = self.baudRate_ComboBox.currentText()
+        self.testInfoDict["compressData"] = self.compressData_CheckBox.isChecked()
 
         #Plot variables
         self.plotInfoDict["makeGaussPlot"] = self.makeGauss_CheckBox.isChecked()
@@ -1001,6 +1337,7 @@ class DW1000testGUI(QtWidgets.QWidget):
         self.plotInfoDict["truncateData"] = self.truncData_CheckBox.isChecked()
         self.plotInfoDict["minTruncDist"] = self.minTruncDist_SpinBox.value()
         self.plotInfoDict["maxTruncDist"] = self.maxTruncDist_SpinBox.value()
+        self.plotInfoDict["smoothLivePlot"] = self.smoothLivePlot_CheckBox.isChecked()
 
         self.Main.addWidget(self.calDist_SpinBox,1,4)
         
@@ -1041,7 +1378,7 @@ class DW1000testGUI(QtWidgets.QWidget):
             fileName = QtWidgets.QFileDialog.getOpenFileName(self,
                                                              "Select data file", 
                                                              curDir,
-                                                             "CSV files (*.csv)")
+                                                             "Data files (*.csv *.rfz);;CSV files (*.csv);;Compressed files (*.rfz)")
             
             self.plotInfoDict["useFile"] = True
             self.plotInfoDict["fileName"] = fileName[0]
@@ -1058,6 +1395,22 @@ class DW1000testGUI(QtWidgets.QWidget):
 #        if self.plotInfoDict["fileName"] == "": #why is this here?
 #            return
 
+        #Plotting from a file only needs one worker
+        if self.plotInfoDict["useFile"]:
+            numPairs = 1
+        else:
+            numPairs = self.numPairs_SpinBox.value()
+
+        pairInfoDicts = [self.pairTestInfoDict(pairId,numPairs) for pairId in range(numPairs)]
+
+        if not self.plotInfoDict["useFile"]:
+            ports = [pairInfoDict["{0}Port".format(device)] for pairInfoDict in pairInfoDicts for device in ("anchor","tag")]
+
+            if (len(set(ports)) != len(ports)):
+                self.updateGui("errGeneralMsgBox","Each device pair needs its own\n"\
+                                                  "anchor and tag COM ports.")
+                return
+
         self.configureWidgets({self.antDelayCal_PushButton.objectName():False,
                                self.distMeas_PushButton.objectName():False,
                                self.filePlot_PushButton.objectName():False,
@@ -1071,38 +1424,126 @@ class DW1000testGUI(QtWidgets.QWidget):
                                self.anchorDelay_SpinBox_Label.objectName():False,
                                self.tagDelay_SpinBox.objectName():False,
                                self.tagDelay_SpinBox_Label.objectName():False}) #Disable widgets to avoid errors
+        self.setPairWidgetsEnabled(False)
 
-        self.__workers_done = 0
         self.__threads = []
-        for idx in range(self.NUM_THREADS):
+        self.__running = set()
+        self.__serialStats = {}
+        for idx in range(numPairs):
             thread = QtCore.QThread()
-            thread.setObjectName(self.testInfoDict["testType"])
-            worker = distMeasThread(idx,self.testInfoDict,self.plotInfoDict)
+            thread.setObjectName("{0}_pair{1}".format(self.testInfoDict["testType"],idx+1))
+            livePlot = self.getLivePlot() if ((idx == 0) and (self.plotInfoDict["useFile"] == False)) else None
+            worker = distMeasThread(idx,pairInfoDicts[idx],self.plotInfoDict,livePlot)
             self.__threads.append((thread, worker))  # need to store worker too otherwise will be gc'd
+            self.__running.add(idx)
             worker.moveToThread(thread)
 
             # get progress messages from worker:
-            worker.sig_done.connect(self.abortWorkers) #For now, exit all threads when one is finished; we only use one at a time for now
-            worker.sig_msg.connect(self.updateGui)
+            worker.sig_done.connect(self.workerDone)
+            worker.sig_msg.connect(self.workerMsg)
+            worker.sig_status.connect(self.updateStatus)
+
+            # control worker (queued, so the steps run in the worker's thread):
+            self.sig_step.connect(worker.step)
 
-            # control worker:
-            self.sig_abort_workers.connect(worker.abort)
+            self.pairWidgets[idx]["abort_PushButton"].setEnabled(True)
 
             # get read to start worker:
             thread.started.connect(worker.setup)
             thread.start()  # this will emit 'started' and start thread's event loop
 
+    #Create the live plot canvas the first time it is needed
+    def getLivePlot(self):
+        if (self.livePlot == None):
+            import DW1000liveplot
+
+            self.livePlot = DW1000liveplot.DW1000livePlot(self.livePlot_Frame)
+            self.livePlot_Layout.addWidget(self.livePlot)
+
+        #Filter settings may have changed since the last test
+        if self.plotInfoDict["smoothLivePlot"]:
+            self.livePlot.rangeFilter = DW1000filters.DW1000kalmanFilter(numLinks=2,
+                                                                         processNoise=self.plotInfoDict["kalmanProcessNoise"],
+                                                                         measurementNoise=self.plotInfoDict["kalmanMeasurementNoise"])
+        else:
+            self.livePlot.rangeFilter = None
+
+        return self.livePlot
+
+    #Copy of testInfoDict with the ports and delays of one pair
+    def pairTestInfoDict(self,pairId,numPairs):
+        pairInfoDict = dict(self.testInfoDict)
+        pair = self.pairWidgets[pairId]
+
+        pairInfoDict["anchorPort"] = pair["anchorComPort"].currentText()
+        pairInfoDict["tagPort"] = pair["tagComPort"].currentText()
+
+        if (pairInfoDict["testType"] == "distMeas"):
+            pairInfoDict["anchorAntDelayDec"] = pair["anchorDelay"].value()
+            pairInfoDict["tagAntDelayDec"] = pair["tagDelay"].value()
+
+        pairInfoDict["pairName"] = "pair{0}".format(pairId+1) if (numPairs > 1) else ""
+
+        return pairInfoDict
+
+    #Button on the first pair's thread message box clicked
     def workerLoop(self,button):
-        for thread, worker in self.__threads:  # note nice unpacking by Python, avoids indexing        
-            worker.outerLoop()
-        
+        self.sig_step.emit(0)
+
+    #A worker finished (or failed); stop its thread
+    def workerDone(self,pairId):
+        if (pairId in self.__running):
+            self.abortPair(pairId)
+
+    #Stop a single pair's test; the others keep running
+    def abortPair(self,pairId):
+        if not (pairId in self.__running):
+            return
+
+        self.__running.discard(pairId)
+        thread, worker = self.__threads[pairId]
+
+        #Never wait here; the ports are closed in threadFinished once the
+        #worker has noticed the abort (within one serial poll interval)
+        self.__stopping.append((thread, worker))
+        thread.finished.connect(self.threadFinished)
+        worker.abort()  # direct call; a running loop stops at the next sample
+        thread.quit()  # this will quit **as soon as thread event loop unblocks**
+
+        pair = self.pairWidgets[pairId]
+        pair["threadMsgBox"].hide()
+        pair["abort_PushButton"].setEnabled(False)
+        pair["testProgressBar"].setValue(0)
+        pair["loopProgressBar"].setValue(0)
+        pair["loopProgressBar_Label"].setText("Loop time remaining: N/A")
+
+        if not self.__running:
+            self.workersFinished()
+
+    #A stopped worker thread has finished; close its ports and let it go
+    def threadFinished(self):
+        for thread, worker in list(self.__stopping):
+            if thread.isFinished():
+                worker.DW1000.deviceDisconnect("anchor")
+                worker.DW1000.deviceDisconnect("tag")
+                self.__stopping.remove((thread, worker))
+
     #Ask all threads to end
     def abortWorkers(self):
-        self.sig_abort_workers.emit()
-        for thread, worker in self.__threads:  # note nice unpacking by Python, avoids indexing
-            thread.quit()  # this will quit **as soon as thread event loop unblocks**
-            thread.wait()  # <- so you need to wait for it to *actually* quit
+        for pairId in list(self.__running):
+            self.abortPair(pairId)
+
+    #Wait (at most timeout seconds in total) for aborted threads to finish
+    def waitWorkers(self,timeout):
+        deadline = time.perf_counter() + timeout
 
+        for thread, worker in list(self.__stopping):
+            thread.wait(max(0,int((deadline - time.perf_counter())*1000)))
+
+        self.threadFinished()
+
+    #Re-enable the GUI once every pair is done
+    def workersFinished(self):
         self.configureWidgets({self.antDelayCal_PushButton.objectName():True,
                                self.distMeas_PushButton.objectName():True,
                                self.filePlot_PushButton.objectName():True,
@@ -1116,10 +1557,8 @@ class DW1000testGUI(QtWidgets.QWidget):
                                self.anchorDelay_SpinBox_Label.objectName():True,
                                self.tagDelay_SpinBox.objectName():True,
                                self.tagDelay_SpinBox_Label.objectName():True}) #Disable widgets to avoid errors
+        self.setPairWidgetsEnabled(True)
             
-        self.updateGui("testProgressBar",str(0))
-        self.updateGui("loopProgressBar",str(0))
-        self.updateGui("loopProgressBar_Label","Loop time remaining: N/A")
         self.updateGui("statusBar","STATUS: Idle.")
 
     #==========================================================================
@@ -1133,8 +1572,9 @@ class DW1000testGUI(QtWidgets.QWidget):
 
         baudrate = self.baudRate_ComboBox.currentText()
 
-        self.anchorComPort_ComboBox.clear()
-        self.tagComPort_ComboBox.clear()
+        for pair in self.pairWidgets:
+            pair["anchorComPort"].clear()
+            pair["tagComPort"].clear()
         
         #If there are no COM ports detected or only one is found
         if len(comPortList) == 0:
@@ -1181,10 +1621,19 @@ class DW1000testGUI(QtWidgets.QWidget):
                                                    "{1} tag COM port(s) discovered.".format(numAnchors,numTags))
             
             for port,deviceType in comPortListTypes.items():
-                try: eval("self.{0}ComPort_ComboBox.addItem('{1}')".format(deviceType,port))
-                except: continue
+                if not (deviceType in ("anchor","tag")):
+                    continue
+
+                for pair in self.pairWidgets:
+                    pair["{0}ComPort".format(deviceType)].addItem(port)
+
+            #Give each pair a different port by default
+            for pairId,pair in enumerate(self.pairWidgets):
+                for key in ("anchorComPort","tagComPort"):
+                    if (pair[key].count() > pairId):
+                        pair[key].setCurrentIndex(pairId)
 
-    def msgBoxCloseEvent(self,event):
+    def msgBoxCloseEvent(self,event,pairId=0):
         reply = QtWidgets.QMessageBox.question(self,
                                                "Confirm",
                                                "Are you sure you want to\n"\
@@ -1194,7 +1643,7 @@ class DW1000testGUI(QtWidgets.QWidget):
                                                QtWidgets.QMessageBox.Cancel)
         
         if reply == QtWidgets.QMessageBox.Ok:
-            self.abortWorkers()
+            self.abortPair(pairId)
             event.accept()
         else:
             event.ignore()        
@@ -1232,6 +1681,9 @@ class Scroll(QtWidgets.QScrollArea):
         self.setEnabled(True)
         
     def closeEvent(self, event):       
+        self.ex.abortWorkers()
+        self.ex.waitWorkers(self.ex.closeTimeout)
+        DW1000render.getRenderQueue().shutdown(wait=False)
         super(Scroll, self).closeEvent(event)
 
 #==========================================================================
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 LATENCY MEASUREMENT SOFTWARE (x64)
+
+Records monotonic (perf_counter_ns) timestamps at each stage of a sample's
+trip through the software (bytes read, line parsed, sample buffered,
+calibration applied, published) and keeps a latency histogram per stage
+
+NOTES:
+-Each stage's latency is the time since the previous stage of the same
+ sample, so the stages add up to the time the whole sample took. A streamed
+ sample starts when the first byte of its first line was read (see
+ DW1000test.distMeasLoop)
+-Times that belong to one device rather than the sample (e.g. each line's
+ read to parse time) are recorded on their own with record()
+-Histograms use HDR-style log-linear buckets: every power of two is split
+ into the same number of linear sub-buckets, so the relative error is the
+ same (about 3% with the defaults) from microseconds up to minutes with a
+ fixed, small number of buckets
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import json
+import threading
+import time
+
+import numpy as np
+
+#==========================================================================
+# HISTOGRAM CLASS
+#==========================================================================
+class DW1000latencyHistogram(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,subBucketBits=5,maxValueBits=40):
+        self.subBucketCount = 2**subBucketBits      #values below this get a bucket each
+        self.subBucketHalf = self.subBucketCount//2 #linear buckets per power of two above that
+        self.subBucketBits = subBucketBits
+        self.maxValue = 2**maxValueBits - 1         #larger values are clamped (2^40 ns is about 18 minutes)
+
+        self.counts = np.zeros(self.bucketIndex(self.maxValue)+1,dtype=np.int64)
+        self.reset()
+
+    #Bucket for a value in ns
+    def bucketIndex(self,value):
+        if (value < self.subBucketCount):
+            return value
+
+        shift = value.bit_length() - self.subBucketBits
+
+        return (shift+1)*self.subBucketHalf + (value >> shift) - self.subBucketHalf
+
+    #Smallest value in a bucket
+    def bucketLowerBound(self,index):
+        if (index < self.subBucketCount):
+            return index
+
+        shift = index//self.subBucketHalf - 1
+
+        return (index % self.subBucketHalf + self.subBucketHalf) << shift
+
+    #Record a latency in ns
+    def record(self,value):
+        value = min(max(int(value),0),self.maxValue)
+
+        self.counts[self.bucketIndex(value)] += 1
+        self.totalCount += 1
+        self.totalSum += value
+        self.minValue = min(self.minValue,value)
+        self.maxRecorded = max(self.maxRecorded,value)
+
+    def reset(self):
+        self.counts[:] = 0
+        self.totalCount = 0
+        self.totalSum = 0
+        self.minValue = self.maxValue
+        self.maxRecorded = 0
+
+    #Value (ns) below which the given percentage of the recorded values fall
+    def percentile(self,percent):
+        if (self.totalCount == 0):
+            return None
+
+        target = max(1,int(np.ceil(self.totalCount*percent/100.0)))
+        index = int(np.searchsorted(np.cumsum(self.counts),target))
+
+        #Report the middle of the bucket, but never beyond what was recorded
+        lower = self.bucketLowerBound(index)
+        upper = self.bucketLowerBound(index+1)
+
+        return min(max((lower+upper)//2,self.minValue),self.maxRecorded)
+
+    #Summary in microseconds
+    def summary(self,percentiles=(50,90,99,99.9)):
+        if (self.totalCount == 0):
+            return {"count":0}
+
+        summary = {"count":self.totalCount,
+                   "mean":self.totalSum/self.totalCount/1000.0,
+                   "min":self.minValue/1000.0,
+                   "max":self.maxRecorded/1000.0}
+
+        for percent in percentiles:
+            summary["p{0:g}".format(percent)] = self.percentile(percent)/1000.0
+
+        return summary
+
+#==========================================================================
+# RECORDER CLASS
+#==========================================================================
+class DW1000latencyRecorder(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,dumpFile="",dumpInterval=None):
+        self.histograms = {}            #stage name -> histogram, in the order stages were first seen
+        self.lock = threading.Lock()    #report() and dump() may be called from other threads
+        self.lastStamp = None           #timestamp of the previous stage of the current sample
+
+        self.dumpFile = dumpFile            #JSON file for periodic dumps ("" to disable)
+        self.dumpInterval = dumpInterval    #seconds between periodic dumps (None to disable)
+        self.nextDump = None if (dumpInterval == None) else time.perf_counter_ns() + int(dumpInterval*1e9)
+
+    #==========================================================================
+    # RECORDING FUNCTIONS
+    #==========================================================================
+    #Start timing a new sample; returns the start timestamp
+    def beginSample(self,timestamp=None):
+        self.lastStamp = time.perf_counter_ns() if (timestamp == None) else timestamp
+
+        if (self.nextDump != None) and (self.lastStamp >= self.nextDump):
+            self.nextDump = self.lastStamp + int(self.dumpInterval*1e9)
+
+            if self.dumpFile:
+                self.dump(self.dumpFile)
+
+        return self.lastStamp
+
+    #Record that a stage finished (now, or at the given perf_counter_ns time)
+    def stamp(self,stage,timestamp=None):
+        if (self.lastStamp == None):
+            return
+
+        if (timestamp == None):
+            timestamp = time.perf_counter_ns()
+
+        with self.lock:
+            histogram = self.histograms.get(stage)
+
+            if (histogram == None):
+                histogram = self.histograms[stage] = DW1000latencyHistogram()
+
+            histogram.record(timestamp - self.lastStamp)
+
+        self.lastStamp = max(self.lastStamp,timestamp)
+
+    #Record a latency (ns) that isn't part of the stage sequence (e.g. a total)
+    def record(self,name,value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+
+            if (histogram == None):
+                histogram = self.histograms[name] = DW1000latencyHistogram()
+
+            histogram.record(value)
+
+    def reset(self):
+        with self.lock:
+            for histogram in self.histograms.values():
+                histogram.reset()
+
+    #==========================================================================
+    # REPORTING FUNCTIONS
+    #==========================================================================
+    #Per-stage summaries in microseconds
+    def summary(self):
+        with self.lock:
+            return {stage:histogram.summary() for stage,histogram in self.histograms.items()}
+
+    #Per-stage summaries as a table
+    def report(self):
+        lines = ["{0:<16} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10} {6:>10}".format("Stage (us)",
+                                                                                 "Count",
+                                                                                 "Mean",
+                                                                                 "p50",
+                                                                                 "p99",
+                                                                                 "p99.9",
+                                                                                 "Max")]
+
+        for stage,summary in self.summary().items():
+            if (summary["count"] == 0):
+                continue
+
+            lines.append("{0:<16} {1:>8} {2:>10.1f} {3:>10.1f} {4:>10.1f} {5:>10.1f} {6:>10.1f}".format(stage,
+                                                                                                     summary["count"],
+                                                                                                     summary["mean"],
+                                                                                                     summary["p50"],
+                                                                                                     summary["p99"],
+                                                                                                     summary["p99.9"],
+                                                                                                     summary["max"]))
+
+        return "\n".join(lines)
+
+    #Write the summaries and the raw bucket counts to a JSON file
+    def dump(self,fileName):
+        with self.lock:
+            data = {"time":time.time(),
+                    "units":"us",
+                    "stages":{stage:histogram.summary() for stage,histogram in self.histograms.items()},
+                    "buckets":{stage:{str(histogram.bucketLowerBound(index)):int(histogram.counts[index])
+                                      for index in np.flatnonzero(histogram.counts)}
+                               for stage,histogram in self.histograms.items()}}
+
+        with open(fileName,"w") as latencyFile:
+            json.dump(data,latencyFile,indent=1)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 LIVE PLOT WIDGET (x64)
+
+Embedded matplotlib canvas showing the rolling anchor/tag range, a histogram
+of the ranges in the window and the RX power while data is being collected
+
+NOTES:
+-Samples are pushed from the acquisition thread with pushSample(); the canvas
+ only redraws on its own timer, so the drawing cost depends on the frame rate
+ and not on the sample rate
+-Lines are blitted onto a cached background; the full figure is only redrawn
+ when the axis limits have to change
+-Each line is reduced to at most two points (min/max) per horizontal pixel
+-With a range filter set (see DW1000filters.py) the filtered ranges are
+ drawn over the raw ones; the filter runs as samples are pushed
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import collections
+import threading
+
+import numpy as np
+
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
+from PyQt5 import QtCore
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000livePlot(FigureCanvasQTAgg):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,parent=None,windowSamples=2000,frameRate=10,histBins=40,rangeFilter=None):
+        self.windowSamples = windowSamples  #number of samples shown in the rolling window
+        self.frameRate = frameRate          #redraws per second
+        self.histBins = histBins            #number of histogram bins
+        self.limitMargin = 0.1              #fraction of the data span to pad the axis limits with
+        self.rangeFilter = rangeFilter      #filter for the anchor/tag ranges (None to only draw raw ranges)
+
+        #Sample buffers (written from the acquisition thread)
+        self.lock = threading.Lock()
+        self.buffers = {name:collections.deque(maxlen=self.windowSamples)
+                        for name in ("anchorRange","tagRange","anchorRxPower","tagRxPower","anchorFiltered","tagFiltered")}
+        self.newData = False
+        self.background = None
+
+        self.figure = Figure(figsize=(6,8),tight_layout=True)
+        super().__init__(self.figure)
+        self.setParent(parent)
+
+        #Axes
+        self.rangeAxes = self.figure.add_subplot(3,1,1)
+        self.rangeAxes.set_title("Range")
+        self.rangeAxes.set_xlabel("Sample")
+        self.rangeAxes.set_ylabel("Range (cm)")
+        self.rangeAxes.set_xlim(0,self.windowSamples)
+        self.rangeAxes.grid(ls="dotted")
+
+        self.histAxes = self.figure.add_subplot(3,1,2)
+        self.histAxes.set_title("Range histogram")
+        self.histAxes.set_xlabel("Range (cm)")
+        self.histAxes.set_ylabel("Count")
+        self.histAxes.grid(ls="dotted")
+
+        self.rxAxes = self.figure.add_subplot(3,1,3)
+        self.rxAxes.set_title("RX power")
+        self.rxAxes.set_xlabel("Sample")
+        self.rxAxes.set_ylabel("RX power (dBm)")
+        self.rxAxes.set_xlim(0,self.windowSamples)
+        self.rxAxes.grid(ls="dotted")
+
+        #Lines (animated, so they are left out of the cached background)
+        self.lines = {"anchorRange":self.rangeAxes.plot([],[],color="r",label="Anchor",animated=True)[0],
+                      "tagRange":self.rangeAxes.plot([],[],color="b",label="Tag",animated=True)[0],
+                      "anchorFiltered":self.rangeAxes.plot([],[],color="darkred",ls="--",label="Anchor (filtered)",animated=True)[0],
+                      "tagFiltered":self.rangeAxes.plot([],[],color="darkblue",ls="--",label="Tag (filtered)",animated=True)[0],
+                      "anchorHist":self.histAxes.plot([],[],color="r",drawstyle="steps-mid",animated=True)[0],
+                      "tagHist":self.histAxes.plot([],[],color="b",drawstyle="steps-mid",animated=True)[0],
+                      "anchorRxPower":self.rxAxes.plot([],[],color="r",animated=True)[0],
+                      "tagRxPower":self.rxAxes.plot([],[],color="b",animated=True)[0]}
+
+        self.rangeAxes.legend(loc="upper right")
+
+        self.mpl_connect("draw_event",self.onDraw)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(int(1000/self.frameRate))
+
+    #==========================================================================
+    # DATA FUNCTIONS
+    #==========================================================================
+    #Add a sample (see DW1000test.distMeasLoop); safe to call from any thread
+    def pushSample(self,sample):
+        if (self.rangeFilter != None):
+            sample = dict(sample)
+            sample["anchorFiltered"],sample["tagFiltered"] = self.rangeFilter.update((sample["anchorRange"],sample["tagRange"]),
+                                                                                    sample["time"])
+
+        with self.lock:
+            for name,buffer in self.buffers.items():
+                value = sample.get(name)
+                buffer.append(np.nan if (value == None) else value)
+
+            self.newData = True
+
+    #Remove all samples from the plot
+    def clear(self):
+        with self.lock:
+            for buffer in self.buffers.values():
+                buffer.clear()
+
+            if (self.rangeFilter != None):
+                self.rangeFilter.reset()
+
+            self.newData = True
+
+    #Copy the buffers out while holding the lock
+    def snapshot(self):
+        with self.lock:
+            if not self.newData:
+                return None
+
+            self.newData = False
+
+            return {name:np.array(buffer,dtype=np.float64) for name,buffer in self.buffers.items()}
+
+    #Reduce a line to a min/max pair per horizontal pixel
+    def decimate(self,values,pixels):
+        xVals = np.arange(len(values))
+
+        if (pixels < 1) or (len(values) <= 2*pixels):
+            return xVals,values
+
+        bucket = int(np.ceil(len(values)/float(pixels)))
+        numBuckets = len(values)//bucket
+        trimmed = values[:numBuckets*bucket].reshape(numBuckets,bucket)
+
+        with np.errstate(invalid="ignore"):
+            reduced = np.empty((numBuckets,2))
+            reduced[:,0] = np.fmin.reduce(trimmed,axis=1)
+            reduced[:,1] = np.fmax.reduce(trimmed,axis=1)
+
+        xReduced = np.repeat(np.arange(numBuckets)*bucket,2) + np.tile([0,bucket//2],numBuckets)
+
+        return (np.concatenate((xReduced,xVals[numBuckets*bucket:])),
+                np.concatenate((reduced.ravel(),values[numBuckets*bucket:])))
+
+    #==========================================================================
+    # DRAWING FUNCTIONS
+    #==========================================================================
+    #Cache the static parts of the figure after every full redraw
+    def onDraw(self,event):
+        self.background = self.copy_from_bbox(self.figure.bbox)
+        self.drawLines()
+
+    #Timer callback: update the lines and blit them
+    def refresh(self):
+        data = self.snapshot()
+
+        if (data == None):
+            return
+
+        pixels = int(self.rangeAxes.bbox.width)
+        limitsChanged = False
+
+        for name in ("anchorRange","tagRange","anchorRxPower","tagRxPower","anchorFiltered","tagFiltered"):
+            xVals,yVals = self.decimate(data[name],pixels)
+            self.lines[name].set_data(xVals,yVals)
+
+        limitsChanged |= self.updateLimits(self.rangeAxes,"y",(data["anchorRange"],data["tagRange"]))
+        limitsChanged |= self.updateLimits(self.rxAxes,"y",(data["anchorRxPower"],data["tagRxPower"]))
+
+        #Histogram over the current range axis limits
+        binEdges = np.linspace(*self.rangeAxes.get_ylim(),num=self.histBins+1)
+        binCenters = (binEdges[:-1]+binEdges[1:])/2
+        maxCount = 0
+
+        for name in ("anchor","tag"):
+            values = data["{0}Range".format(name)]
+            counts = np.histogram(values[np.isfinite(values)],bins=binEdges)[0]
+            self.lines["{0}Hist".format(name)].set_data(binCenters,counts)
+            maxCount = max(maxCount,counts.max())
+
+        if (tuple(self.histAxes.get_xlim()) != (binEdges[0],binEdges[-1])):
+            self.histAxes.set_xlim(binEdges[0],binEdges[-1])
+            limitsChanged = True
+
+        histUpperLim = self.histAxes.get_ylim()[1]
+
+        if (maxCount > histUpperLim) or (maxCount < histUpperLim/4):
+            self.histAxes.set_ylim(0,max(maxCount,1)*(1+self.limitMargin))
+            limitsChanged = True
+
+        if limitsChanged or (self.background == None):
+            self.draw_idle()    #onDraw will draw the lines
+            return
+
+        self.restore_region(self.background)
+        self.drawLines()
+        self.blit(self.figure.bbox)
+
+    def drawLines(self):
+        for line in self.lines.values():
+            line.axes.draw_artist(line)
+
+    #Grow the axis limits if the data doesn't fit, or shrink them if the data
+    #only covers a small part of the axis; returns True if the limits changed
+    def updateLimits(self,axes,axis,valueArrays):
+        values = np.concatenate([vals[np.isfinite(vals)] for vals in valueArrays])
+
+        if (len(values) == 0):
+            return False
+
+        dataMin = values.min()
+        dataMax = values.max()
+        span = max(dataMax-dataMin,1.0)
+
+        lowerLim,upperLim = axes.get_ylim() if (axis == "y") else axes.get_xlim()
+        tooSmall = (dataMin < lowerLim) or (dataMax > upperLim)
+        tooLarge = (upperLim-lowerLim) > 4*(span*(1+2*self.limitMargin))
+
+        if not (tooSmall or tooLarge):
+            return False
+
+        newLimits = (dataMin-span*self.limitMargin,dataMax+span*self.limitMargin)
+
+        if (axis == "y"):
+            axes.set_ylim(*newLimits)
+        else:
+            axes.set_xlim(*newLimits)
+
+        return True
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 ROTATING DATA LOGGER (x64)
+
+Writes streamed samples to plain-text segment files that are rotated on age
+or size. Closed segments are compressed to .rfz files (see DW1000compress) on
+a background thread and old segments are deleted according to a retention
+policy, so disk and memory use stay bounded during unattended captures
+
+NOTES:
+-Memory use is fixed: one open segment file, a bounded queue of closed
+ segment names and one chunk of samples in the compressor
+-If the compressor falls behind and its queue fills up, closed segments are
+ kept as .csv files and still count towards the retention limits
+-.rfz files can't hold NaN or infinite values, so rows with them are left
+ out of the compressed segment (see rowsSkipped)
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import csv
+import DW1000compress
+import glob
+import math
+import os
+import queue
+import threading
+import time
+
+from datetime import datetime
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000rotatingLogger(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,
+                 directory,
+                 columns=("anchor","tag"),
+                 prefix="DW1000_stream",
+                 rotateSeconds=3600,
+                 rotateBytes=16*2**20,
+                 maxSegments=168,
+                 maxTotalBytes=None,
+                 compress=True,
+                 method="zlib",
+                 resolution=0.01,
+                 timeResolution=1e-4,
+                 chunkSize=4096,
+                 queueSize=16):
+        self.directory = directory          #directory to write segments to
+        self.columns = list(columns)        #names of the value columns (time is always first)
+        self.prefix = prefix                #segment file name prefix
+        self.rotateSeconds = rotateSeconds  #maximum segment age in seconds (None to disable)
+        self.rotateBytes = rotateBytes      #maximum segment size in bytes (None to disable)
+        self.maxSegments = maxSegments      #number of closed segments to keep (None to keep all)
+        self.maxTotalBytes = maxTotalBytes  #total size of closed segments to keep (None to disable)
+        self.compress = compress            #whether or not to compress closed segments
+        self.method = method                #compression method for closed segments
+        self.resolution = resolution        #quantization step for value columns
+        self.timeResolution = timeResolution #quantization step for the time column in seconds
+        self.chunkSize = chunkSize          #samples per compressed chunk
+
+        #Counters
+        self.segmentIndex = 0               #index of the open segment
+        self.samplesWritten = 0             #samples written since the logger was created
+        self.segmentsCompressed = 0         #segments compressed by the background thread
+        self.segmentsDeleted = 0            #segments removed by the retention policy
+        self.compressSkipped = 0            #segments left uncompressed because the queue was full
+        self.rowsSkipped = 0                #malformed or non-finite rows left out of compressed segments
+
+        self.segmentFile = None
+        self.segmentName = None
+        self.segmentBytes = 0
+        self.segmentStart = 0
+        self.pendingNames = set()           #segments queued for or undergoing compression
+                                            #(changed under retentionLock)
+
+        self.retentionLock = threading.Lock()
+        self.compressQueue = queue.Queue(maxsize=queueSize)
+        self.compressThread = None
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        if self.compress:
+            self.compressThread = threading.Thread(target=self.compressLoop,
+                                                   name="DW1000logger compressor")
+            self.compressThread.daemon = True
+            self.compressThread.start()
+
+        self.openSegment()
+
+    #==========================================================================
+    # WRITING FUNCTIONS
+    #==========================================================================
+    #Write one sample row; rotates the segment when it gets too old or too large
+    def publish(self,timestamp,values):
+        row = [repr(float(timestamp))] + [repr(float(value)) for value in values]
+        line = ",".join(row) + "\n"
+
+        self.segmentFile.write(line)
+        self.segmentBytes += len(line)
+        self.samplesWritten += 1
+
+        if (((self.rotateBytes != None) and (self.segmentBytes >= self.rotateBytes)) or
+            ((self.rotateSeconds != None) and (time.monotonic() - self.segmentStart >= self.rotateSeconds))):
+            self.rotate()
+
+    #Close the open segment, hand it to the compressor and start a new one
+    def rotate(self):
+        closedName = self.closeSegment()
+        self.segmentIndex += 1
+        self.openSegment()
+
+        self.queueSegment(closedName)
+
+    #Close the logger; waits for queued segments to be compressed
+    def close(self,timeout=None):
+        closedName = self.closeSegment()
+
+        if (closedName != None):
+            self.queueSegment(closedName)
+
+        if (self.compressThread != None):
+            self.compressQueue.put(None)   #stop sentinel
+            self.compressThread.join(timeout)
+            self.compressThread = None
+
+    #==========================================================================
+    # SEGMENT FUNCTIONS
+    #==========================================================================
+    def openSegment(self):
+        a = datetime.now()
+        self.segmentName = os.path.join(self.directory,
+                                        "{0}_{1}_{2:06d}.csv".format(self.prefix,
+                                                                     a.strftime("%Y-%m-%d_%H-%M-%S"),
+                                                                     self.segmentIndex))
+        self.segmentFile = open(self.segmentName,"w")
+        self.segmentFile.write(",".join(["time"] + self.columns) + "\n")
+        self.segmentBytes = 0
+        self.segmentStart = time.monotonic()
+
+    #Close the open segment and return its file name
+    def closeSegment(self):
+        if (self.segmentFile == None):
+            return None
+
+        self.segmentFile.close()
+        self.segmentFile = None
+
+        return self.segmentName
+
+    def queueSegment(self,fileName):
+        if self.compress:
+            #Marked pending before it's queued and until it's compressed, so
+            #retention never sees it between the two
+            with self.retentionLock:
+                self.pendingNames.add(fileName)
+
+            try:
+                self.compressQueue.put_nowait(fileName)
+                return
+            except queue.Full:
+                self.compressSkipped += 1
+
+                with self.retentionLock:
+                    self.pendingNames.discard(fileName)
+
+        self.applyRetention()
+
+    #==========================================================================
+    # BACKGROUND COMPRESSION FUNCTIONS
+    #==========================================================================
+    def compressLoop(self):
+        while True:
+            fileName = self.compressQueue.get()
+
+            if (fileName == None):
+                break
+
+            try:
+                self.compressSegment(fileName)
+                self.segmentsCompressed += 1
+            except Exception as exception:
+                print("[DW1000logger]: Could not compress {0}: {1}".format(fileName,exception))
+
+            with self.retentionLock:
+                self.pendingNames.discard(fileName)
+
+            self.applyRetention()
+
+    #Stream a closed .csv segment into a .rfz file one chunk at a time; rows
+    #that can't be stored (malformed or non-finite) are skipped and counted.
+    #If it fails, the partial .rfz is removed and the .csv is kept
+    def compressSegment(self,fileName):
+        compressedName = os.path.splitext(fileName)[0] + ".rfz"
+        tmpName = compressedName + ".tmp"
+
+        try:
+            with open(fileName,"r") as segmentFile:
+                reader = csv.reader(segmentFile)
+                header = next(reader)
+
+                with DW1000compress.DW1000sessionWriter(tmpName,
+                                                        resolution=self.resolution,
+                                                        method=self.method,
+                                                        chunkSize=self.chunkSize) as writer:
+                    writer.setResolution(header[0],self.timeResolution)
+                    writer.writeMeta("columns",header)
+
+                    for row in reader:
+                        if (len(row) != len(header)):
+                            continue    #partial last line
+
+                        try: values = [float(value) for value in row]
+                        except ValueError:
+                            values = None
+
+                        if (values == None) or not all(math.isfinite(value) for value in values):
+                            self.rowsSkipped += 1
+                            continue
+
+                        for name,value in zip(header,values):
+                            writer.append(name,value)
+
+            os.replace(tmpName,compressedName)
+        except BaseException:
+            try: os.remove(tmpName)
+            except OSError:
+                pass
+
+            raise
+
+        os.remove(fileName)
+
+    #==========================================================================
+    # RETENTION FUNCTIONS
+    #==========================================================================
+    #Closed segment files, oldest first (names start with the time stamp)
+    def closedSegments(self):
+        pattern = os.path.join(self.directory,"{0}_*".format(glob.escape(self.prefix)))
+
+        return sorted(fileName for fileName in glob.glob(pattern)
+                      if (fileName.endswith(".csv") or fileName.endswith(".rfz")) and
+                         (fileName != self.segmentName))
+
+    #Delete the oldest closed segments until the limits are met
+    def applyRetention(self):
+        with self.retentionLock:
+            fileNames = self.closedSegments()
+            sizes = []
+
+            for fileName in fileNames:
+                try: sizes.append(os.path.getsize(fileName))
+                except OSError: sizes.append(0)
+
+            numSegments = len(fileNames)
+            totalBytes = sum(sizes)
+
+            for fileName,size in zip(fileNames,sizes):
+                tooMany = (self.maxSegments != None) and (numSegments > self.maxSegments)
+                tooLarge = (self.maxTotalBytes != None) and (totalBytes > self.maxTotalBytes)
+
+                if not (tooMany or tooLarge):
+                    break
+
+                #Never delete a segment that is waiting for or undergoing compression
+                if fileName.endswith(".csv") and (fileName in self.pendingNames):
+                    continue
+
+                try:
+                    os.remove(fileName)
+                    self.segmentsDeleted += 1
+                except OSError:
+                    continue
+
+                numSegments -= 1
+                totalBytes -= size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        self.close()
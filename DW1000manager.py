@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 DEVICE MANAGER SOFTWARE (x64)
+
+Owns any number of DW1000 serial devices and reads all of them from a single
+event loop, keeping a store of the most recent samples of each device
+
+NOTES:
+-The event loop runs in the caller's thread (poll(), nextSamples()), so a
+ device can still be sent commands (e.g. setAntennaDelay) between polls
+ without a background reader stealing the replies
+-Serial ports with a file descriptor (Linux, macOS) are waited on with a
+ selector; otherwise (e.g. COM ports on Windows, emulated ports) every device
+ is polled with non-blocking reads
+-A device's role is whatever it was added with, or failing that the device
+ type ("t:" field) of its first range line
+-Samples are timed by readNs, when their bytes arrived (their "time" is
+ the wall clock at readNs). Raw captures record exactly that, so a replay
+ (see DW1000replay.py) times, orders and pairs its samples the same way the
+ live session did; parsedNs (when the line was parsed) only says which
+ samples have been handed out and how long parsing took
+-With timingCorrection, samples also get the time their line left the
+ device (correctedNs on the perf_counter_ns clock, correctedTime on the
+ time.time() clock), estimated per device from its frame cadence (see
+ DW1000timing.py)
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import collections
+import selectors
+import threading
+import time
+
+import DW1000serial
+import DW1000timing
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000manager(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,historySize=1000,idleInterval=0.001,cancelEvent=None,timingCorrection=False,framePeriod=None):
+        self.historySize = historySize      #samples kept per device
+        self.timingCorrection = timingCorrection    #whether or not to correct sample times for port latency
+        self.framePeriod = framePeriod      #firmware range line period (s) for the timing correction;
+                                            #estimated per device if None
+        self.idleInterval = idleInterval    #sleep between polls when no device can be waited on
+        self.pollInterval = 0.01            #longest a single wait blocks, in seconds; bounds how
+                                            #long a cancel is noticed
+        self.cancelEvent = threading.Event() if (cancelEvent == None) else cancelEvent
+
+        self.devices = collections.OrderedDict()    #name -> DW1000serial.DW1000
+        self.roles = {}             #name -> role (None until discovered)
+        self.stores = {}            #name -> most recent samples
+        self.sampleCounts = {}      #name -> samples received since the device was added
+        self.consumedNs = {}        #name -> parsedNs of the last sample handed out by nextSamples
+        self.timing = {}            #name -> DW1000timing.DW1000cadenceEstimator (with timingCorrection)
+
+        self.selector = selectors.DefaultSelector()
+        self.unselectable = set()   #names of devices without a file descriptor
+
+    #==========================================================================
+    # DEVICE FUNCTIONS
+    #==========================================================================
+    #Manage a connected device (DW1000serial.DW1000 with an open port)
+    def addDevice(self,device,name=None,role=None):
+        if (name == None):
+            name = getattr(device.ser,"port",None) or "device{0}".format(len(self.devices))
+
+        if (name in self.devices):
+            self.removeDevice(name)
+
+        self.devices[name] = device
+        self.roles[name] = role
+        self.stores[name] = collections.deque(maxlen=self.historySize)
+        self.sampleCounts[name] = 0
+        self.consumedNs[name] = 0
+
+        if self.timingCorrection:
+            self.timing[name] = DW1000timing.DW1000cadenceEstimator(nominalPeriod=self.framePeriod)
+
+        fileno = device.fileno()
+
+        if (fileno == None):
+            self.unselectable.add(name)
+        else:
+            self.selector.register(fileno,selectors.EVENT_READ,name)
+
+        return name
+
+    #Connect to a device on a serial port and manage it
+    def connect(self,port,baudrate=115200,role=None):
+        device = DW1000serial.DW1000()
+        device.cancelEvent = self.cancelEvent
+
+        if not device.connectToDUT(selPort=port,baudrate=baudrate):
+            return None
+
+        if not device.ser.isOpen():
+            device.openDW1000port()
+
+        return self.addDevice(device,name=port,role=role)
+
+    #Stop managing a device (the port is left as it is)
+    def removeDevice(self,name):
+        if not (name in self.devices):
+            return
+
+        if (name in self.unselectable):
+            self.unselectable.discard(name)
+        else:
+            try: self.selector.unregister(self.devices[name].fileno())
+            except (KeyError,ValueError,TypeError):
+                pass
+
+        for table in (self.devices,self.roles,self.stores,self.sampleCounts,self.consumedNs):
+            del table[name]
+
+        self.timing.pop(name,None)
+
+    #Names of the devices with a role
+    def devicesWithRole(self,role):
+        return [name for name,deviceRole in self.roles.items() if (deviceRole == role)]
+
+    #Poll until every device has a role; returns the roles, or None if the
+    #timeout expires first
+    def discoverRoles(self,timeout=5.0):
+        deadline = time.perf_counter() + timeout
+
+        while (None in self.roles.values()):
+            remaining = deadline - time.perf_counter()
+
+            if (remaining <= 0) or self.cancelEvent.is_set():
+                return None
+
+            self.poll(min(remaining,self.pollInterval))
+
+        return dict(self.roles)
+
+    def close(self):
+        for name in list(self.devices):
+            self.removeDevice(name)
+
+        self.selector.close()
+
+    #==========================================================================
+    # EVENT LOOP FUNCTIONS
+    #==========================================================================
+    #Wait up to timeout seconds for data, then read every device that has
+    #some; returns the number of new samples
+    def poll(self,timeout=0.0):
+        newSamples = 0
+
+        for name in self.readableDevices(timeout):
+            device = self.devices[name]
+
+            try: device.readAvailable()
+            except Exception as exception:
+                device.debugPrint("ERROR: Problem reading from {0} ({1})".format(name,exception))
+                continue
+
+            while True:
+                newLine = device.bufferedLine()
+
+                if (newLine == None):
+                    break
+
+                if self.handleLine(name,device,newLine):
+                    newSamples += 1
+
+        return newSamples
+
+    #Names of the devices that may have data waiting
+    def readableDevices(self,timeout):
+        if not self.unselectable:
+            if not self.devices:
+                self.cancelEvent.wait(timeout)
+                return []
+
+            return [key.data for key,events in self.selector.select(timeout)]
+
+        #Some devices can't be waited on: check every device until one has
+        #data or the timeout expires
+        deadline = time.perf_counter() + timeout
+
+        while True:
+            readable = [key.data for key,events in self.selector.select(0)] if (len(self.unselectable) < len(self.devices)) else []
+
+            for name in self.unselectable:
+                try:
+                    if self.devices[name].ser.in_waiting:
+                        readable.append(name)
+                except Exception:
+                    readable.append(name)   #let poll() report the problem
+
+            if readable or (time.perf_counter() >= deadline) or self.cancelEvent.is_set():
+                return readable
+
+            time.sleep(min(self.idleInterval,max(0,deadline - time.perf_counter())))
+
+    #Parse a line and add it to the device's store; returns True for a sample
+    def handleLine(self,name,device,newLine):
+        if not (device.rangeStr in newLine):
+            return False
+
+        sample = device.parseRangeLine(newLine)
+
+        if (sample == None):
+            return False
+
+        sample["parsedNs"] = device.clockNs()
+
+        if (device.lastReadNs == None):
+            sample["readNs"] = sample["parsedNs"]
+            sample["time"] = device.wallClock()
+        else:
+            sample["readNs"] = device.lastReadNs    #see DW1000latency.py
+            sample["time"] = device.wallClock() - (sample["parsedNs"] - sample["readNs"])/1e9
+
+        #When the line left the device, going by the port's frame cadence (see
+        #DW1000timing.py); the bytes arrived at readNs, less the time they
+        #took to send
+        if (name in self.timing):
+            baudrate = getattr(device.ser,"baudrate",None)
+            transmitTime = len(newLine)*10.0/baudrate if baudrate else 0.0
+            correctedNs = int(self.timing[name].update(sample["readNs"]/1e9,transmitTime)*1e9)
+            sample["correctedNs"] = correctedNs
+            sample["correctedTime"] = sample["time"] - (sample["readNs"] - correctedNs)/1e9
+
+        if (self.roles[name] == None) and sample["deviceType"]:
+            self.roles[name] = sample["deviceType"].lower()
+
+        device.lastSample = sample
+        self.stores[name].append(sample)
+        self.sampleCounts[name] += 1
+
+        return True
+
+    #==========================================================================
+    # SAMPLE FUNCTIONS
+    #==========================================================================
+    #Wait until every named device has a sample newer than the last one handed
+    #out for it (and than its last flushInput) and return the newest of each
+    #as a dictionary; returns None on timeout or cancel
+    def nextSamples(self,names,timeout=5.0):
+        deadline = time.perf_counter() + timeout
+
+        while True:
+            samples = {}
+
+            for name in names:
+                store = self.stores[name]
+                oldestNs = max(self.consumedNs[name],self.devices[name].lastFlushNs)
+
+                if store and (store[-1]["parsedNs"] > oldestNs):
+                    samples[name] = store[-1]
+
+            if (len(samples) == len(names)):
+                for name,sample in samples.items():
+                    self.consumedNs[name] = sample["parsedNs"]
+
+                return samples
+
+            remaining = deadline - time.perf_counter()
+
+            if self.cancelEvent.is_set():
+                return None
+
+            if (remaining <= 0):
+                for name in names:
+                    if not (name in samples):
+                        self.devices[name].counters["timeouts"] += 1
+                return None
+
+            self.poll(min(remaining,self.pollInterval))
+
+    #Every sample of a device newer than the last one handed out for it (and
+    #than its last flushInput), oldest first; doesn't poll
+    def takeSamples(self,name):
+        store = self.stores[name]
+        oldestNs = max(self.consumedNs[name],self.devices[name].lastFlushNs)
+        samples = []
+
+        for sample in reversed(store):
+            if (sample["parsedNs"] <= oldestNs):
+                break
+
+            samples.append(sample)
+
+        if samples:
+            self.consumedNs[name] = samples[0]["parsedNs"]
+
+        samples.reverse()
+
+        return samples
+
+    #Most recent sample of a device, or None
+    def latest(self,name):
+        store = self.stores[name]
+
+        return store[-1] if store else None
+
+    #Stored samples of a device, oldest first
+    def history(self,name):
+        return list(self.stores[name])
+
+    #Throw away everything received by every device
+    def flush(self):
+        for name,device in self.devices.items():
+            device.flushInput()
+            self.stores[name].clear()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 RANGE PIPELINE SOFTWARE (x64)
+
+Takes each sample distMeasLoop produces through calibration and out to the
+configured outputs. The live streamer (DW1000stream_continuous.py) and the
+replay (DW1000replay.py) both run it, so a replay goes through the same steps
+as the session it came from
+
+STEPS:
+-Capture: the raw ranges and their time are appended to the session file
+ (testInfoDict "captureFile"), with the fits used to scale them
+-Calibration: the ranges are scaled by the anchor and tag fits and corrected
+ for the orientation (DW1000test.correctAngle)
+-Smoothing: the Kalman filter, if testInfoDict "kalmanFilter" is set
+-Outputs: shared memory ("shmName"), pub/sub ("pubsubAddress"), rotating logs
+ ("logDir") and any other outputs given (anything with publish(timestamp,
+ values) and close())
+
+NOTES:
+-Everything is stamped with the sample's own time (DW1000test.lastSampleTime:
+ when its line left the anchor with the timing correction on, otherwise when
+ it arrived), so replayed outputs get the recorded times
+-Outputs left empty in the testInfoDict are skipped, and settings it
+ doesn't have are taken from outputDefaults
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import csv
+
+import numpy as np
+
+import DW1000compress
+import DW1000filters
+import DW1000logger
+import DW1000pubsub
+import DW1000shm
+
+#==========================================================================
+# DEFAULTS
+#==========================================================================
+#Output settings used when the testInfoDict doesn't have them (e.g. one from
+#the GUI or an older recording; see DW1000stream_continuous.py calInfoDict)
+outputDefaults = {"captureFile":"",
+                  "captureMethod":"zlib",
+                  "logDir":"",
+                  "logRotateSeconds":3600,
+                  "logRotateBytes":16*2**20,
+                  "logMaxSegments":168,
+                  "logMaxBytes":2*2**30,
+                  "pubsubAddress":"",
+                  "pubsubQueueSize":1024,
+                  "shmName":"",
+                  "shmSlots":4096,
+                  "kalmanFilter":False,
+                  "kalmanProcessNoise":100.0,
+                  "kalmanMeasurementNoise":2.0}
+
+#==========================================================================
+# PIPELINE CLASS
+#==========================================================================
+class DW1000rangePipeline(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,DW1000,anchorFitDict,tagFitDict,testInfoDict=None,outputs=None):
+        self.DW1000 = DW1000
+        self.anchorFitDict = anchorFitDict  #fit ("m", "b") the anchor ranges are scaled with
+        self.tagFitDict = tagFitDict        #fit ("m", "b") the tag ranges are scaled with
+        self.testInfoDict = DW1000.testInfoDict if (testInfoDict == None) else testInfoDict
+        self.outputs = [] if (outputs == None) else list(outputs)   #outputs the scaled ranges are published to
+        self.numSamples = 0
+
+        testInfoDict = dict(outputDefaults,**self.testInfoDict)
+
+        #Record raw ranges (with the fit used to scale them) if a capture file was given
+        self.captureWriter = None
+
+        if testInfoDict["captureFile"]:
+            self.captureWriter = DW1000compress.DW1000sessionWriter(testInfoDict["captureFile"],
+                                                                    resolution=DW1000.rangeResolution,
+                                                                    method=testInfoDict["captureMethod"])
+            self.captureWriter.setResolution("time",1e-4) #seconds
+            self.captureWriter.writeMeta("testInfoDict",self.testInfoDict)
+            self.captureWriter.writeMeta("anchorFit",{"m":float(anchorFitDict["m"]),"b":float(anchorFitDict["b"])})
+            self.captureWriter.writeMeta("tagFit",{"m":float(tagFitDict["m"]),"b":float(tagFitDict["b"])})
+
+        #Publish scaled ranges to readers on this host (see DW1000shm.py)
+        if testInfoDict["shmName"]:
+            self.outputs.append(DW1000shm.DW1000shmWriter(testInfoDict["shmName"],
+                                                          columns=("anchor","tag"),
+                                                          numSlots=testInfoDict["shmSlots"]))
+
+        #Publish scaled ranges to local subscribers (see DW1000pubsub.py)
+        if testInfoDict["pubsubAddress"]:
+            self.outputs.append(DW1000pubsub.DW1000pubsubServer(testInfoDict["pubsubAddress"],
+                                                                columns=("anchor","tag"),
+                                                                queueSize=testInfoDict["pubsubQueueSize"]))
+
+        #Unattended capture: rotate, compress and expire log segments in the background
+        if testInfoDict["logDir"]:
+            self.outputs.append(DW1000logger.DW1000rotatingLogger(testInfoDict["logDir"],
+                                                                  columns=("anchor","tag"),
+                                                                  rotateSeconds=testInfoDict["logRotateSeconds"],
+                                                                  rotateBytes=testInfoDict["logRotateBytes"],
+                                                                  maxSegments=testInfoDict["logMaxSegments"],
+                                                                  maxTotalBytes=testInfoDict["logMaxBytes"],
+                                                                  method=testInfoDict["captureMethod"],
+                                                                  resolution=DW1000.rangeResolution))
+
+        #Smooth the scaled ranges with one sample of lag (see DW1000filters.py)
+        self.rangeFilter = None
+
+        if testInfoDict["kalmanFilter"]:
+            self.rangeFilter = DW1000filters.DW1000kalmanFilter(numLinks=2,
+                                                                processNoise=testInfoDict["kalmanProcessNoise"],
+                                                                measurementNoise=testInfoDict["kalmanMeasurementNoise"])
+
+    #Take the sample distMeasLoop just buffered through the pipeline; returns
+    #its time and the scaled (and smoothed) anchor and tag ranges
+    def process(self):
+        DW1000 = self.DW1000
+        sampleTime = DW1000.lastSampleTime
+        anchorRange = DW1000.anchorRangeBuffer[-1]
+        tagRange = DW1000.tagRangeBuffer[-1]
+
+        if self.captureWriter:
+            self.captureWriter.append("time",sampleTime)
+            self.captureWriter.append("anchor",anchorRange)
+            self.captureWriter.append("tag",tagRange)
+
+        anchorDist = DW1000.scaleLinearValue(anchorRange,
+                                             self.anchorFitDict["m"],
+                                             self.anchorFitDict["b"])
+        tagDist = DW1000.scaleLinearValue(tagRange,
+                                          self.tagFitDict["m"],
+                                          self.tagFitDict["b"])
+        anchorDist,tagDist = DW1000.correctAngle(np.array((anchorDist,tagDist)))
+        DW1000.latency.stamp("calibrated")
+
+        if self.rangeFilter:
+            anchorDist,tagDist = self.rangeFilter.update((anchorDist,tagDist),sampleTime)
+            DW1000.latency.stamp("filtered")
+
+        for output in self.outputs:
+            output.publish(sampleTime,(anchorDist,tagDist))
+        DW1000.latency.stamp("published")
+
+        self.numSamples += 1
+
+        return sampleTime,anchorDist,tagDist
+
+    #Close the capture file and every output
+    def close(self):
+        if self.captureWriter:
+            self.captureWriter.close()
+            self.captureWriter = None
+
+        for output in self.outputs:
+            output.close()
+
+        self.outputs = []
+
+#==========================================================================
+# CSV OUTPUT CLASS
+#==========================================================================
+#Writes the published samples to a .csv file (time and one column per value)
+class DW1000csvOutput(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,fileName,columns=("anchor","tag")):
+        self.outputFile = open(fileName,"w",newline="")
+        self.writer = csv.writer(self.outputFile)
+        self.writer.writerow(("time",) + tuple(columns))
+
+    def publish(self,timestamp,values):
+        self.writer.writerow((repr(timestamp),) + tuple(repr(float(value)) for value in values))
+
+    def close(self):
+        if not self.outputFile.closed:
+            self.outputFile.close()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 POSITION SOLVING SOFTWARE (x64)
+
+Finds the position of a tag (and its covariance) from calibrated ranges to
+anchors at known coordinates
+
+METHOD:
+-Initial guess: linearized least squares; subtracting the first anchor's
+ range equation from the others leaves a linear system in the position
+-Refinement: a few Gauss-Newton iterations on the range residuals, weighted
+ by the range variance of each anchor
+-Covariance: (J^T W J)^-1 at the solution, where J is the Jacobian of the
+ ranges with respect to the position and W the range weights
+
+NOTES:
+-Units are whatever the anchor coordinates and ranges are in (cm for the
+ rest of this software)
+-Missing ranges (NaN) are allowed; an epoch needs at least one more range
+ than there are dimensions, from anchors that aren't all in a line (2D) or
+ plane (3D), to have a unique solution
+-solveBatch() solves many epochs with the same numpy calls, for offline
+ reprocessing; solve() is the low latency version for a single epoch
+-Both take optional quality weights per range (see DW1000quality.py), which
+ scale the range weights so that likely NLOS ranges pull on the solution less
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import numpy as np
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000positionSolver(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,anchors,rangeStd=5.0,iterations=5,tolerance=1e-3,anchorNames=None):
+        self.anchors = np.asarray(anchors,dtype=np.float64)    #one row of coordinates per anchor
+        self.anchorNames = anchorNames  #device names of the anchors, in the same order (see rangesFromSamples)
+        self.numAnchors,self.numDims = self.anchors.shape
+        self.iterations = iterations    #most Gauss-Newton iterations per epoch
+        self.tolerance = tolerance      #stop iterating once the position moves less than this
+        self.maxCondition = 1e12        #normal matrices worse conditioned than this have no unique solution
+        self.geometryCache = {}         #anchors heard (bytes of the mask) -> whether they span the space
+
+        if (self.numAnchors <= self.numDims):
+            raise ValueError("Need at least {0} anchors for a {1}D position".format(self.numDims+1,self.numDims))
+
+        #Range standard deviation per anchor
+        self.rangeStd = np.broadcast_to(np.asarray(rangeStd,dtype=np.float64),(self.numAnchors,)).copy()
+        self.weights = 1/self.rangeStd**2
+
+        #The linearized system only depends on the anchors, so its pseudo-
+        #inverse is computed once for epochs with every range present
+        self.linearA = 2*(self.anchors[1:] - self.anchors[0])
+        self.anchorNormsSq = np.sum(self.anchors**2,axis=1)
+        self.linearPinv = np.linalg.pinv(self.linearA)
+
+    #==========================================================================
+    # SINGLE EPOCH FUNCTIONS
+    #==========================================================================
+    #Position and covariance from one set of ranges (NaN for missing ones);
+    #returns (None, None) if there isn't a unique solution (too few ranges, or
+    #the anchors heard are in a line). Passing the last position as the
+    #initial guess usually saves a few iterations
+    def solve(self,ranges,initial=None,qualityWeights=None):
+        ranges = np.asarray(ranges,dtype=np.float64)
+        valid = np.isfinite(ranges)
+        weights = self.weights
+
+        if (qualityWeights is not None):
+            weights = weights*np.asarray(qualityWeights,dtype=np.float64)
+            valid &= weights > 0
+
+        if valid.all():
+            anchors = self.anchors
+        elif (np.count_nonzero(valid) > self.numDims):
+            anchors = self.anchors[valid]
+            weights = weights[valid]
+            ranges = ranges[valid]
+        else:
+            return None,None
+
+        if not self.spansSpace(valid):
+            return None,None
+
+        if (initial is None):
+            position = self.linearSolve(ranges,anchors,valid.all())
+        else:
+            position = np.array(initial,dtype=np.float64)
+
+        #The normal matrix of the last iteration is used for the covariance;
+        #the position moved less than the tolerance since it was computed
+        for _ in range(self.iterations):
+            diffs = position - anchors
+            predicted = np.maximum(np.sqrt(np.einsum("ij,ij->i",diffs,diffs)),1e-9)
+            jacobian = diffs/predicted[:,None]
+            weightedJacobian = jacobian*weights[:,None]
+
+            normalMatrix = jacobian.T @ weightedJacobian
+
+            if not (np.linalg.cond(normalMatrix) < self.maxCondition):  #also catches NaN
+                return None,None
+
+            covariance = np.linalg.inv(normalMatrix)
+            step = covariance @ (weightedJacobian.T @ (ranges - predicted))
+            position += step
+
+            if (np.abs(step).max() < self.tolerance):
+                break
+
+        return position,covariance
+
+    #Linearized least squares initial guess
+    def linearSolve(self,ranges,anchors,allValid=True):
+        if allValid:
+            rhs = (self.anchorNormsSq[1:] - self.anchorNormsSq[0]) - (ranges[1:]**2 - ranges[0]**2)
+            return self.linearPinv @ rhs
+
+        normsSq = np.sum(anchors**2,axis=1)
+        rhs = (normsSq[1:] - normsSq[0]) - (ranges[1:]**2 - ranges[0]**2)
+
+        return np.linalg.lstsq(2*(anchors[1:] - anchors[0]),rhs,rcond=None)[0]
+
+    #==========================================================================
+    # BATCH FUNCTIONS
+    #==========================================================================
+    #Positions (M x dims) and covariances (M x dims x dims) for M epochs of
+    #ranges (M x anchors, NaN for missing ones) and optional quality weights
+    #(the same shape); epochs without a unique solution come back as NaN
+    def solveBatch(self,ranges,qualityWeights=None):
+        ranges = np.atleast_2d(np.asarray(ranges,dtype=np.float64))
+        valid = np.isfinite(ranges)
+        weights = np.broadcast_to(self.weights,ranges.shape)
+
+        if (qualityWeights is not None):
+            weights = weights*np.atleast_2d(np.asarray(qualityWeights,dtype=np.float64))
+            valid &= weights > 0
+
+        solvable = np.count_nonzero(valid,axis=1) > self.numDims
+
+        for mask in np.unique(valid[solvable],axis=0):
+            if not self.spansSpace(mask):
+                solvable &= ~(valid == mask).all(axis=1)
+        weights = np.where(valid,weights,0.0)     #missing ranges get no weight
+        filledRanges = np.where(valid,ranges,0.0)
+
+        #Initial guess: the shared pseudo-inverse where every range is there,
+        #otherwise the weighted centroid of the anchors that were heard
+        complete = valid.all(axis=1)
+        positions = (weights @ self.anchors)/np.maximum(weights.sum(axis=1),1e-12)[:,None]
+
+        if complete.any():
+            completeRanges = filledRanges[complete]
+            rhs = ((self.anchorNormsSq[1:] - self.anchorNormsSq[0])
+                   - (completeRanges[:,1:]**2 - completeRanges[:,:1]**2))
+            positions[complete] = rhs @ self.linearPinv.T
+
+        #Gauss-Newton on every epoch at once
+        eye = np.eye(self.numDims)*1e-12    #keeps unsolvable epochs from making the solve fail
+
+        for _ in range(self.iterations):
+            jacobian,predicted = self.batchJacobian(positions)
+            weightedJacobian = jacobian*weights[:,:,None]
+
+            normalMatrix = np.einsum("mni,mnj->mij",jacobian,weightedJacobian) + eye
+            gradient = np.einsum("mni,mn->mi",weightedJacobian,filledRanges - predicted)
+            steps = np.linalg.solve(normalMatrix,gradient[:,:,None])[:,:,0]
+            positions += steps
+
+            if (np.max(np.abs(steps[solvable]),initial=0) < self.tolerance):
+                break
+
+        jacobian,predicted = self.batchJacobian(positions)
+        normalMatrix = np.einsum("mni,mnj->mij",jacobian,jacobian*weights[:,:,None]) + eye
+        covariances = np.linalg.inv(normalMatrix)
+
+        positions[~solvable] = np.nan
+        covariances[~solvable] = np.nan
+
+        return positions,covariances
+
+    #Whether the anchors heard (a mask in anchor order) span the space, i.e.
+    #aren't all in a line (2D) or plane (3D)
+    def spansSpace(self,valid):
+        key = np.asarray(valid,dtype=bool).tobytes()
+
+        try: return self.geometryCache[key]
+        except KeyError:
+            anchors = self.anchors[np.asarray(valid,dtype=bool)]
+            spans = (len(anchors) > self.numDims) and (np.linalg.matrix_rank(anchors[1:] - anchors[0]) == self.numDims)
+            self.geometryCache[key] = spans
+
+            return spans
+
+    #Unit vectors from each anchor to each position, and the predicted ranges
+    def batchJacobian(self,positions):
+        diffs = positions[:,None,:] - self.anchors[None,:,:]
+        predicted = np.maximum(np.sqrt(np.einsum("mni,mni->mn",diffs,diffs)),1e-9)
+
+        return diffs/predicted[:,:,None],predicted
+
+    #==========================================================================
+    # HELPER FUNCTIONS
+    #==========================================================================
+    #Ranges in anchor order from samples keyed by device name (e.g. from
+    #DW1000manager.nextSamples); anchors without a sample are NaN
+    def rangesFromSamples(self,samples):
+        return np.array([samples[name]["range"] if (name in samples) else np.nan
+                         for name in self.anchorNames],dtype=np.float64)
+
+    #Ranges from every anchor to a position (for simulations and residuals)
+    def rangesTo(self,position):
+        return np.sqrt(np.sum((self.anchors - np.asarray(position,dtype=np.float64))**2,axis=1))
+
+    #Semi-axes (1 sigma) and orientation of the 2D error ellipse of a covariance
+    def errorEllipse(self,covariance):
+        eigenValues,eigenVectors = np.linalg.eigh(np.asarray(covariance)[:2,:2])
+        angle = np.degrees(np.arctan2(eigenVectors[1,1],eigenVectors[0,1]))
+
+        return np.sqrt(eigenValues[1]),np.sqrt(eigenValues[0]),angle
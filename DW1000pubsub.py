@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 LIVE RANGE PUBLISHING SOFTWARE (x64)
+
+Publishes streamed samples to any number of local subscribers over a Unix
+domain socket (or localhost TCP where Unix sockets aren't available) using a
+small framed binary protocol
+
+Can also be run from the command line to print the samples being published:
+    python DW1000pubsub.py [ADDRESS]
+
+PROTOCOL:
+-Every frame is a header (frame type, payload length) followed by the payload
+     -Columns frame: UTF-8 JSON list of the value column names; sent once
+      when a subscriber connects
+     -Sample frame: sequence number, timestamp and one float64 per column
+-Sequence numbers increase by one per published sample, so a subscriber can
+ tell how many samples it missed from the gaps
+
+NOTES:
+-publish() never blocks on a subscriber; each subscriber has a bounded queue
+ and the oldest frames are dropped when a slow subscriber lets it fill up.
+ The columns frame is sent ahead of the queue, so it is never dropped
+-All socket I/O happens on one background thread
+-A new server only replaces an existing Unix socket if nothing answers on
+ it (the server that made it didn't shut down cleanly); otherwise it raises
+ FileExistsError rather than cut off the live server's subscribers
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import collections
+import json
+import os
+import selectors
+import socket
+import struct
+import sys
+import tempfile
+import threading
+
+#==========================================================================
+# CONSTANTS
+#==========================================================================
+frameHeader = struct.Struct("<BI")      #frame type, payload length
+sampleHeader = struct.Struct("<Qd")     #sequence number, timestamp
+
+columnsFrameType = 1
+sampleFrameType = 2
+
+defaultTcpAddress = ("127.0.0.1",50100)
+
+#Default address: a Unix socket in the temp directory where supported,
+#localhost TCP otherwise
+def defaultAddress():
+    if hasattr(socket,"AF_UNIX"):
+        return os.path.join(tempfile.gettempdir(),"DW1000pubsub.sock")
+
+    return defaultTcpAddress
+
+#Convert an address string ("host:port" or a socket path) to an address
+def parseAddress(address):
+    if not isinstance(address,str):
+        return address
+
+    host,sep,port = address.rpartition(":")
+
+    if sep and port.isdigit() and not (os.sep in port):
+        return (host or defaultTcpAddress[0],int(port))
+
+    return address
+
+#Socket family for an address
+def addressFamily(address):
+    if isinstance(address,tuple):
+        return socket.AF_INET
+
+    return socket.AF_UNIX
+
+#Remove a Unix socket left behind by a server that didn't shut down cleanly;
+#raises FileExistsError if a server is still listening on it
+def removeStaleSocket(address):
+    if not os.path.exists(address):
+        return
+
+    probe = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+
+    try:
+        probe.connect(address)
+    except ConnectionRefusedError:
+        os.remove(address)      #nothing listening; left over from a previous run
+        return
+    finally:
+        probe.close()
+
+    raise FileExistsError("A server is already publishing on {0}".format(address))
+
+#==========================================================================
+# SERVER CLASS
+#==========================================================================
+class DW1000pubsubServer(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,address=None,columns=("anchor","tag"),queueSize=1024,sendBatch=64):
+        self.address = parseAddress(address) if (address != None) else defaultAddress()
+        self.columns = list(columns)    #names of the value columns
+        self.queueSize = queueSize      #frames queued per subscriber before the oldest are dropped
+        self.sendBatch = sendBatch      #most frames joined into a single send call
+
+        self.sampleStruct = struct.Struct("<{0}d".format(len(self.columns)))
+        self.columnsFrame = self.makeFrame(columnsFrameType,json.dumps(self.columns).encode("utf-8"))
+
+        #Counters
+        self.sequence = 0               #sequence number of the next sample
+        self.framesDropped = 0          #frames dropped across all subscribers
+        self.subscribersServed = 0      #subscribers that have connected since the server started
+
+        self.subscribers = {}           #socket -> subscriber state
+        self.lock = threading.Lock()    #protects the subscribers dictionary
+        self.running = True
+
+        #Listening socket
+        family = addressFamily(self.address)
+
+        if (family == socket.AF_UNIX):
+            removeStaleSocket(self.address)
+
+        self.listenSocket = socket.socket(family,socket.SOCK_STREAM)
+
+        if (family == socket.AF_INET):
+            self.listenSocket.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+
+        self.listenSocket.bind(self.address)
+        self.listenSocket.listen(8)
+        self.listenSocket.setblocking(False)
+
+        #Wakes the I/O thread when there is something new to send
+        self.wakeReceive,self.wakeSend = socket.socketpair()
+        self.wakeReceive.setblocking(False)
+        self.wakeSend.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listenSocket,selectors.EVENT_READ,"accept")
+        self.selector.register(self.wakeReceive,selectors.EVENT_READ,"wake")
+
+        self.ioThread = threading.Thread(target=self.ioLoop,name="DW1000pubsub server")
+        self.ioThread.daemon = True
+        self.ioThread.start()
+
+    #==========================================================================
+    # PUBLISHING FUNCTIONS
+    #==========================================================================
+    #Queue a sample for every subscriber; never blocks on a subscriber
+    def publish(self,timestamp,values):
+        frame = self.makeFrame(sampleFrameType,
+                               sampleHeader.pack(self.sequence,timestamp) + self.sampleStruct.pack(*values))
+        self.sequence += 1
+
+        with self.lock:
+            subscribers = list(self.subscribers.values())
+
+        if not subscribers:
+            return
+
+        for subscriber in subscribers:
+            if (len(subscriber["queue"]) == self.queueSize):
+                subscriber["dropped"] += 1
+                self.framesDropped += 1
+
+            subscriber["queue"].append(frame)   #a full deque drops its oldest frame
+
+        self.wake()
+
+    def makeFrame(self,frameType,payload):
+        return frameHeader.pack(frameType,len(payload)) + payload
+
+    def wake(self):
+        try: self.wakeSend.send(b"\x00")
+        except (BlockingIOError,OSError):
+            pass    #a wake-up is already pending
+
+    #Number of connected subscribers
+    def numSubscribers(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    #Stop the server and disconnect every subscriber
+    def close(self,timeout=1.0):
+        if not self.running:
+            return
+
+        self.running = False
+        self.wake()
+        self.ioThread.join(timeout)
+
+        with self.lock:
+            for sock in list(self.subscribers):
+                sock.close()
+
+            self.subscribers.clear()
+
+        self.selector.close()
+        self.listenSocket.close()
+        self.wakeReceive.close()
+        self.wakeSend.close()
+
+        if (addressFamily(self.address) == socket.AF_UNIX):
+            try: os.remove(self.address)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        self.close()
+
+    #==========================================================================
+    # I/O THREAD FUNCTIONS
+    #==========================================================================
+    def ioLoop(self):
+        while self.running:
+            for key,events in self.selector.select():
+                if (key.data == "accept"):
+                    self.acceptSubscriber()
+                elif (key.data == "wake"):
+                    try:
+                        while self.wakeReceive.recv(4096):
+                            pass
+                    except (BlockingIOError,OSError):
+                        pass
+                elif (events & selectors.EVENT_READ):
+                    self.readSubscriber(key.fileobj)
+
+            with self.lock:
+                subscribers = list(self.subscribers.items())
+
+            for sock,subscriber in subscribers:
+                self.flushSubscriber(sock,subscriber)
+
+    def acceptSubscriber(self):
+        try: sock,_ = self.listenSocket.accept()
+        except (BlockingIOError,OSError):
+            return
+
+        sock.setblocking(False)
+
+        if (addressFamily(self.address) == socket.AF_INET):
+            sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+
+        #The columns frame starts out as the pending bytes rather than in the
+        #queue, so samples published before the first send can't push it out
+        subscriber = {"queue":collections.deque(maxlen=self.queueSize),
+                      "pending":self.columnsFrame,  #part of a frame that didn't fit in the last send
+                      "dropped":0,
+                      "writing":False}   #whether or not we're waiting for the socket to drain
+
+        with self.lock:
+            self.subscribers[sock] = subscriber
+
+        self.subscribersServed += 1
+        self.selector.register(sock,selectors.EVENT_READ,"subscriber")
+
+    #Subscribers don't send anything; a readable socket means it was closed
+    def readSubscriber(self,sock):
+        try: data = sock.recv(4096)
+        except (BlockingIOError,InterruptedError):
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self.dropSubscriber(sock)
+
+    #Send as much of a subscriber's queue as the socket will take
+    def flushSubscriber(self,sock,subscriber):
+        queue = subscriber["queue"]
+
+        while subscriber["pending"] or queue:
+            if not subscriber["pending"]:
+                frames = []
+                try:
+                    while queue and (len(frames) < self.sendBatch):
+                        frames.append(queue.popleft())
+                except IndexError:
+                    pass
+                subscriber["pending"] = b"".join(frames)
+
+            try: sent = sock.send(subscriber["pending"])
+            except (BlockingIOError,InterruptedError):
+                sent = 0
+            except OSError:
+                self.dropSubscriber(sock)
+                return
+
+            subscriber["pending"] = subscriber["pending"][sent:]
+
+            if subscriber["pending"]:
+                break   #socket buffer is full
+
+        #Only watch for writability while there is a backlog
+        writing = bool(subscriber["pending"] or queue)
+
+        if (writing != subscriber["writing"]):
+            subscriber["writing"] = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self.selector.modify(sock,events,"subscriber")
+
+    def dropSubscriber(self,sock):
+        with self.lock:
+            self.subscribers.pop(sock,None)
+
+        try: self.selector.unregister(sock)
+        except (KeyError,ValueError):
+            pass
+
+        sock.close()
+
+#==========================================================================
+# CLIENT CLASS
+#==========================================================================
+class DW1000pubsubClient(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,address=None,timeout=None):
+        self.address = parseAddress(address) if (address != None) else defaultAddress()
+        self.columns = None             #column names sent by the server
+        self.sampleStruct = None
+        self.buffer = bytearray()       #received bytes that don't form a complete frame yet
+        self.lastSequence = None
+        self.samplesMissed = 0          #samples dropped by the server or lost to a late connect
+
+        self.sock = socket.socket(addressFamily(self.address),socket.SOCK_STREAM)
+        self.sock.connect(self.address)
+        self.sock.settimeout(timeout)
+
+        if (addressFamily(self.address) == socket.AF_INET):
+            self.sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+
+    #Return the next sample as (sequence, timestamp, values), or None if the
+    #timeout expires; raises ConnectionError if the server goes away
+    def receive(self):
+        while True:
+            frame = self.nextFrame()
+
+            if (frame == None):
+                try: data = self.sock.recv(65536)
+                except socket.timeout:
+                    return None
+
+                if not data:
+                    raise ConnectionError("Publisher closed the connection")
+
+                self.buffer.extend(data)
+                continue
+
+            frameType,payload = frame
+
+            if (frameType == columnsFrameType):
+                self.columns = json.loads(payload.decode("utf-8"))
+                self.sampleStruct = struct.Struct("<{0}d".format(len(self.columns)))
+            elif (frameType == sampleFrameType) and (self.sampleStruct != None):
+                sequence,timestamp = sampleHeader.unpack_from(payload)
+                values = self.sampleStruct.unpack_from(payload,sampleHeader.size)
+
+                if (self.lastSequence != None) and (sequence > self.lastSequence + 1):
+                    self.samplesMissed += sequence - self.lastSequence - 1
+
+                self.lastSequence = sequence
+
+                return sequence,timestamp,values
+
+    #Remove one complete frame from the buffer
+    def nextFrame(self):
+        if (len(self.buffer) < frameHeader.size):
+            return None
+
+        frameType,payloadLen = frameHeader.unpack_from(self.buffer)
+        frameLen = frameHeader.size + payloadLen
+
+        if (len(self.buffer) < frameLen):
+            return None
+
+        payload = bytes(self.buffer[frameHeader.size:frameLen])
+        del self.buffer[:frameLen]
+
+        return frameType,payload
+
+    def __iter__(self):
+        while True:
+            sample = self.receive()
+
+            if (sample != None):
+                yield sample
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        self.close()
+
+#==========================================================================
+# MAIN CODE
+#==========================================================================
+if __name__ == '__main__':
+    address = sys.argv[1] if (len(sys.argv) > 1) else None
+
+    with DW1000pubsubClient(address) as client:
+        try:
+            for sequence,timestamp,values in client:
+                print("{0} {1:.4f} {2}".format(sequence,
+                                               timestamp,
+                                               " ".join("{0}: {1:.2f} cm".format(name,value)
+                                                        for name,value in zip(client.columns,values))))
+        except (KeyboardInterrupt,ConnectionError):
+            pass
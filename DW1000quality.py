@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 RANGE QUALITY SOFTWARE (x64)
+
+Online non-line-of-sight (NLOS) classifier giving every range sample a
+quality weight between 0 and 1. The calibration fits, averages and position
+solver weight samples with it, so blocked or reflected paths count for less
+than direct ones
+
+METHOD (per link, each factor between 0 and 1):
+-Residual: distance from the median of the recent ranges in units of their
+ (MAD based) standard deviation, weighted like a Cauchy distribution
+-RX power: a blocked direct path arrives weaker than the path loss model
+ expects for the measured range; the model's reference power is learned
+ from the samples that look like line of sight
+-Variance: the spread of the recent ranges against the expected range
+ noise; multipath makes the range jump around even when the median is fine
+The weight is the product of the three. The variance factor is shared by
+every sample in the window (it says how much to trust the link right now,
+e.g. against other anchors), so a sample is counted as NLOS when the product
+of its own residual and power factors is below nlosWeight
+
+NOTES:
+-Windows use DW1000filters.DW1000slidingWindow, so every sample costs the
+ same no matter how large the window is
+-Ranges are in cm and RX power in dBm (as parsed by DW1000serial)
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import math
+
+import numpy as np
+
+import DW1000filters
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000nlosClassifier(object):
+    verNum = "0.0.0"
+
+    #Constants
+    madScale = 1.4826       #MAD to standard deviation for normally distributed ranges
+    minWeight = 1e-6        #weights never reach 0 so weighted averages are always defined
+
+    #Object initialization
+    def __init__(self,
+                 numLinks=2,
+                 windowSize=21,
+                 rangeStd=2.0,
+                 residualScale=2.0,
+                 pathLossExponent=2.0,
+                 powerTolerance=4.0,
+                 powerScale=3.0,
+                 powerSmoothing=0.02,
+                 nlosWeight=0.5,
+                 minSamples=5):
+        self.numLinks = numLinks
+        self.windowSize = windowSize            #recent ranges the residual and variance are taken over
+        self.rangeStd = rangeStd                #expected line of sight range noise (cm)
+        self.residualScale = residualScale      #residual (in standard deviations) that halves the weight
+        self.pathLossExponent = pathLossExponent    #2 for free space
+        self.powerTolerance = powerTolerance    #power deficit (dB) allowed before the weight drops
+        self.powerScale = powerScale            #further deficit (dB) that divides the weight by e
+        self.powerSmoothing = powerSmoothing    #how quickly the reference power follows line of sight samples
+        self.nlosWeight = nlosWeight            #samples whose residual and power factors are below
+                                                #this are counted as NLOS
+        self.minSamples = minSamples            #ranges needed in the window before the residual and
+                                                #variance are used
+
+        self.refPowers = [None]*numLinks        #learned RX power at 1 m per link (dBm)
+        self.varianceWeights = [1.0]*numLinks   #last variance factor per link; also used while a
+                                                #window fills up after a reset
+        self.reset()
+        self.resetCounts()
+
+    #Forget the recent ranges (e.g. after the tag moved); the learned
+    #reference power and variance factor are kept, they belong to the devices
+    #and the environment
+    def reset(self):
+        self.windows = [DW1000filters.DW1000slidingWindow(self.windowSize) for _ in range(self.numLinks)]
+        self.sums = [0.0]*self.numLinks         #running sums of the window ranges,
+        self.sumSquares = [0.0]*self.numLinks   #about the first range to keep them small
+        self.offsets = [None]*self.numLinks
+        self.lastWeights = [1.0]*self.numLinks
+        self.lastNlos = [False]*self.numLinks
+
+    def resetCounts(self):
+        self.checked = [0]*self.numLinks    #samples seen per link
+        self.nlosCount = [0]*self.numLinks  #samples classified as NLOS per link
+
+    #==========================================================================
+    # CLASSIFICATION FUNCTIONS
+    #==========================================================================
+    #Quality weight for a range and RX power per link (NaN range or None power
+    #for none); returns the weights (NaN for links without a range)
+    def update(self,ranges,rxPowers=None):
+        weights = []
+
+        for index,rangeVal in enumerate(ranges):
+            rxPower = None if (rxPowers == None) else rxPowers[index]
+
+            if not (rangeVal == rangeVal):   #NaN
+                weights.append(np.nan)
+                continue
+
+            weights.append(self.updateLink(index,rangeVal,rxPower))
+
+        return np.array(weights,dtype=np.float64)
+
+    def updateLink(self,index,rangeVal,rxPower=None):
+        window = self.windows[index]
+        residualWeight = 1.0
+
+        if (len(window) >= self.minSamples):
+            median = window.median()
+            std = max(self.madScale*window.mad(median),self.rangeStd)
+            residual = (rangeVal - median)/(self.residualScale*std)
+            residualWeight = 1/(1 + residual*residual)
+            self.varianceWeights[index] = min(1.0,self.rangeStd**2/max(self.windowVariance(index),1e-12))
+
+        varianceWeight = self.varianceWeights[index]
+
+        powerWeight = 1.0
+
+        if (rxPower != None):
+            #Power the path loss model expects at this range, referred to 1 m
+            spreading = 10*self.pathLossExponent*math.log10(max(rangeVal,1.0)/100)
+            refPower = self.refPowers[index]
+
+            if (refPower == None):
+                refPower = self.refPowers[index] = rxPower + spreading
+            elif (residualWeight > 0.5):
+                self.refPowers[index] = refPower + self.powerSmoothing*(rxPower + spreading - refPower)
+
+            deficit = (refPower - spreading) - rxPower
+            powerWeight = math.exp(-max(0.0,deficit - self.powerTolerance)/self.powerScale)
+
+        self.pushRange(index,rangeVal)
+
+        sampleWeight = residualWeight*powerWeight
+        weight = max(sampleWeight*varianceWeight,self.minWeight)
+        nlos = sampleWeight < self.nlosWeight
+
+        self.checked[index] += 1
+        self.nlosCount[index] += nlos
+        self.lastWeights[index] = weight
+        self.lastNlos[index] = nlos
+
+        return weight
+
+    #Add a range to a link's window, keeping the running sums in step
+    def pushRange(self,index,rangeVal):
+        if (self.offsets[index] == None):
+            self.offsets[index] = rangeVal
+
+        value = rangeVal - self.offsets[index]
+        oldest = self.windows[index].push(rangeVal)
+
+        if (oldest != None):
+            oldest -= self.offsets[index]
+            self.sums[index] -= oldest
+            self.sumSquares[index] -= oldest*oldest
+
+        self.sums[index] += value
+        self.sumSquares[index] += value*value
+
+    #Sample variance of a link's window
+    def windowVariance(self,index):
+        count = len(self.windows[index])
+
+        if (count < 2):
+            return 0.0
+
+        return max(self.sumSquares[index] - self.sums[index]**2/count,0.0)/(count - 1)
+
+    #Fraction of each link's samples classified as NLOS
+    def nlosRatios(self):
+        return [nlos/float(checked) if checked else 0.0
+                for nlos,checked in zip(self.nlosCount,self.checked)]
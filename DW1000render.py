@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 PLOT RENDERING SOFTWARE (x64)
+
+Renders the DW1000test error and Gaussian plots in a pool of worker processes
+using the Agg backend so that acquisition never waits on matplotlib. Each
+submitted plot returns a concurrent.futures.Future whose result is the name of
+the saved figure
+
+Can also be run from the command line to re-plot archived data files in
+parallel:
+    python DW1000render.py [--scale] [--workers N] FILE [FILE ...]
+
+NOTES:
+-Plots that are meant to be shown on screen (plotInfoDict["show"]) are still
+ rendered in the calling process
+-Worker processes are started with the 'spawn' method so that they are safe
+ to create from a Qt application
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import argparse
+import ast
+import multiprocessing
+import sys
+
+from concurrent.futures import (Future,ProcessPoolExecutor)
+
+#==========================================================================
+# WORKER PROCESS FUNCTIONS
+#==========================================================================
+workerDW1000 = None  #DW1000test instance reused by every plot in a worker process
+
+#Force the non-interactive backend before pyplot is imported in a worker
+def renderInit():
+    import matplotlib
+    matplotlib.use("Agg")
+
+#Render a single plot and return the name of the saved figure; weightDict
+#holds the quality weights of the ranges (see DW1000test.linearCurveFit)
+def renderPlot(plotType,distDict,plotInfoDict,testInfoDict,weightDict=None):
+    global workerDW1000
+
+    import DW1000test
+
+    if (workerDW1000 == None):
+        workerDW1000 = DW1000test.DW1000test(testInfoDict=testInfoDict)
+
+    workerDW1000.testInfoDict = testInfoDict
+
+    if (plotType == "error"):
+        fileName = workerDW1000.makeErrorPlotDist(distDict,plotInfoDict,weightDict=weightDict)
+    elif (plotType == "gaussian"):
+        fileName = workerDW1000.makeGaussianPlotDist(distDict,plotInfoDict,weightDict=weightDict)
+    else:
+        raise ValueError("Unknown plot type '{0}'".format(plotType))
+
+    if not plotInfoDict["show"]:
+        import matplotlib.pyplot as plt
+        plt.close("all")
+
+    return fileName
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000renderQueue(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,maxWorkers=None):
+        self.maxWorkers = maxWorkers    #number of worker processes (None for one per core)
+        self.executor = None            #created on first use
+
+    #Start the worker processes if they aren't running yet
+    def getExecutor(self):
+        if (self.executor == None):
+            self.executor = ProcessPoolExecutor(max_workers=self.maxWorkers,
+                                                mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=renderInit)
+
+        return self.executor
+
+    #Queue a single plot; plotType is either "error" or "gaussian"
+    def submit(self,plotType,distDict,plotInfoDict,testInfoDict,weightDict=None):
+        #Dictionaries are copied so that later changes by the caller don't leak in
+        distDict = dict(distDict)
+        plotInfoDict = dict(plotInfoDict)
+        testInfoDict = dict(testInfoDict)
+        weightDict = None if (weightDict == None) else dict(weightDict)
+
+        if plotInfoDict["show"]:
+            future = Future()
+
+            try: future.set_result(renderPlot(plotType,distDict,plotInfoDict,testInfoDict,weightDict))
+            except Exception as exception:
+                future.set_exception(exception)
+
+            return future
+
+        return self.getExecutor().submit(renderPlot,plotType,distDict,plotInfoDict,testInfoDict,weightDict)
+
+    #Queue the error and Gaussian plots for one device; if the data is to be
+    #scaled, the unscaled versions are queued as well
+    def submitPlotSet(self,distDict,plotInfoDict,testInfoDict,weightDict=None):
+        futures = [self.submit("error",distDict,plotInfoDict,testInfoDict,weightDict),
+                   self.submit("gaussian",distDict,plotInfoDict,testInfoDict,weightDict)]
+
+        if (plotInfoDict["scaleData"] == True):
+            unscaledInfoDict = dict(plotInfoDict,scaleData=False)
+            futures.append(self.submit("error",distDict,unscaledInfoDict,testInfoDict,weightDict))
+            futures.append(self.submit("gaussian",distDict,unscaledInfoDict,testInfoDict,weightDict))
+
+        return futures
+
+    #Stop the worker processes
+    def shutdown(self,wait=True):
+        if (self.executor != None):
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+#==========================================================================
+# SHARED QUEUE
+#==========================================================================
+renderQueue = None
+
+#Get the render queue shared by everything in this process
+def getRenderQueue():
+    global renderQueue
+
+    if (renderQueue == None):
+        renderQueue = DW1000renderQueue()
+
+    return renderQueue
+
+#==========================================================================
+# MAIN CODE
+#==========================================================================
+if __name__ == '__main__':
+    import DW1000test
+
+    parser = argparse.ArgumentParser(description="Re-plot archived DW1000 data files in parallel")
+    parser.add_argument("files",nargs="+",help=".csv or .rfz data files")
+    parser.add_argument("--scale",action="store_true",help="also make plots scaled to the curve fit")
+    parser.add_argument("--workers",type=int,default=None,help="number of worker processes")
+    args = parser.parse_args()
+
+    plotInfoDict = {"makeGaussPlot":True,
+                    "makeHistPlot":True,
+                    "makeRefPlot":True,
+                    "scaleData":args.scale,
+                    "truncateData":False,
+                    "fileName":"",
+                    "useFile":True,
+                    "show":False,
+                    "minTruncDist":5,
+                    "maxTruncDist":5}
+
+    reader = DW1000test.DW1000test()
+    queue = DW1000renderQueue(maxWorkers=args.workers)
+    futures = []
+
+    for fileName in args.files:
+        result = reader.fileRead(fileName)
+
+        if (result == None):
+            print("Could not read {0}".format(fileName))
+            continue
+
+        distDict = result["distDict"]
+        testInfoDict = result["testInfoDict"]
+
+        if isinstance(distDict,str):
+            try:
+                distDict = ast.literal_eval(distDict)
+                testInfoDict = ast.literal_eval(testInfoDict)
+            except Exception:
+                print("Unexpected value in {0}".format(fileName))
+                continue
+
+        futures.extend(queue.submitPlotSet(distDict,plotInfoDict,testInfoDict))
+
+    failed = 0
+    for future in futures:
+        try: print("Saved {0}".format(future.result()))
+        except Exception as exception:
+            print("ERROR: {0}".format(exception))
+            failed += 1
+
+    queue.shutdown()
+    sys.exit(1 if failed else 0)
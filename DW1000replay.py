@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 REPLAY SOFTWARE (x64)
+
+Replays recorded sessions through the same parser, buffers, calibration,
+filters and outputs that run live, in place of the serial ports, so field
+problems can be reproduced and the real pipeline profiled without hardware
+
+    python DW1000replay.py <session .rfz file> [--speed S] [--output file.csv]
+    python DW1000replay.py <anchor .dwraw file> <tag .dwraw file> [--speed S]
+
+Each replayed sample goes through DW1000pipeline (calibration, the Kalman
+filter if the session used it, and the outputs); --capture, --log-dir,
+--pubsub and --shm send it to the same outputs the streamer has
+
+SOURCES:
+-Raw captures (.dwraw): every chunk of bytes a port received and when it
+ arrived, recorded by DW1000serial while live (set its recorder to a
+ DW1000rawRecorder, or see DW1000test.startRawCapture); these replay
+ exactly what the parser saw. The recorder can keep metadata (e.g. the
+ testInfoDict and fits, as for session files) in the file's header
+-Session files (.rfz): the time, anchor and tag columns written by
+ DW1000stream_continuous.py; range lines are rebuilt from them (no peer
+ address or RX power, and the ranges have already been through the outlier
+ filter once)
+
+SPEED:
+-1.0 replays in real time, 10.0 ten times faster, and 0 as fast as the
+ pipeline will go (every read moves the replay on to the next recorded
+ chunk, so nothing waits)
+-Devices are given the recording's clocks: samples get the receive times
+ that were recorded, whatever the speed. A read never returns more than
+ one recorded chunk (each was one read live), so every line gets the
+ receive time it had live. As fast as possible, the chunks are read in the
+ same order every time, so a replay gives the same results every time it
+ is run; at other speeds the reads can group the chunks differently from
+ run to run
+
+NOTES:
+-The replayed ports answer the antenna delay commands the way the devices
+ would, but the recorded ranges don't change with the delay
+-DW1000replay.finished() says when everything has been read; distMeasLoop
+ waits for its read timeout if it's called after that
+-The replay clock's time source and sleep function can be swapped (e.g. for
+ a simulated clock in tests)
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import argparse
+import bisect
+import collections
+import json
+import struct
+import sys
+import time
+
+#==========================================================================
+# RAW CAPTURE FORMAT
+#==========================================================================
+#File: magic, header length (uint32) and a JSON header, then one record per
+#received chunk: receive time in ns (int64), length (uint32) and the bytes
+captureMagic = b"DW1000RAW\x01"
+lengthStruct = struct.Struct("<I")
+recordStruct = struct.Struct("<qI")
+
+#==========================================================================
+# RECORDER CLASS
+#==========================================================================
+class DW1000rawRecorder(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,fileName,role=None,port=None,baudrate=None,meta=None):
+        self.fileName = fileName
+        self.bytesRecorded = 0
+        self.chunksRecorded = 0
+
+        #The receive times are perf_counter_ns; keep where that clock was
+        #against the wall clock so the recording's sample times can be rebuilt
+        header = json.dumps({"verNum":self.verNum,
+                             "role":role,
+                             "port":port,
+                             "baudrate":baudrate,
+                             "startNs":time.perf_counter_ns(),
+                             "startTime":time.time(),
+                             "meta":{} if (meta == None) else meta}).encode()
+
+        self.captureFile = open(fileName,"wb")
+        self.captureFile.write(captureMagic + lengthStruct.pack(len(header)) + header)
+
+    #Record a chunk of received bytes (see DW1000serial.receive)
+    def record(self,timestampNs,data):
+        self.captureFile.write(recordStruct.pack(timestampNs,len(data)))
+        self.captureFile.write(data)
+        self.bytesRecorded += len(data)
+        self.chunksRecorded += 1
+
+    def close(self):
+        if not self.captureFile.closed:
+            self.captureFile.close()
+
+#==========================================================================
+# SOURCE FUNCTIONS
+#==========================================================================
+#Read a raw capture; returns the header, the receive times (ns) and the chunks
+def readRawCapture(fileName):
+    with open(fileName,"rb") as captureFile:
+        if (captureFile.read(len(captureMagic)) != captureMagic):
+            raise ValueError("{0} isn't a DW1000 raw capture".format(fileName))
+
+        headerLength, = lengthStruct.unpack(captureFile.read(lengthStruct.size))
+        header = json.loads(captureFile.read(headerLength).decode())
+        data = captureFile.read()
+
+    times = []
+    chunks = []
+    offset = 0
+
+    while (offset + recordStruct.size <= len(data)):
+        timestampNs,length = recordStruct.unpack_from(data,offset)
+        offset += recordStruct.size
+
+        if (offset + length > len(data)):
+            break   #capture cut off part way through a chunk
+
+        times.append(timestampNs)
+        chunks.append(data[offset:offset+length])
+        offset += length
+
+    return header,times,chunks
+
+#Rebuild the range lines of a session file (see DW1000stream_continuous.py);
+#returns the session's metadata and each role's times (ns) and lines
+def readSession(fileName):
+    import DW1000compress
+
+    with DW1000compress.DW1000sessionReader(fileName) as reader:
+        times = reader.readColumn("time")
+        ranges = {role:reader.readColumn(role) for role in ("anchor","tag")}
+        meta = {name:reader.readMeta(name) for name in ("testInfoDict","anchorFit","tagFit")
+                if (name in reader.meta)}
+
+    timesNs = [int(round(sampleTime*1e9)) for sampleTime in times]
+    lines = {role:["t:{0} d:{1:.4f}\r\n".format(role,rangeVal/100).encode() for rangeVal in ranges[role]]
+             for role in ranges}
+
+    return meta,timesNs,lines
+
+#==========================================================================
+# CLOCK CLASS
+#==========================================================================
+class DW1000replayClock(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,speed=1.0,clockNs=time.perf_counter_ns,sleep=time.sleep):
+        self.speed = speed          #recorded seconds per real second (0 or None for as fast as possible)
+        self.clockNs = clockNs      #real time source
+        self.sleep = sleep          #real sleep function
+        self.ports = []
+
+        self.startNs = None         #recorded time the replay starts from
+        self.realStartNs = None     #real time the replay started
+        self.virtualNs = None       #recorded time reached when replaying as fast as possible
+
+    def addPort(self,port):
+        self.ports.append(port)
+
+    def maxSpeed(self):
+        return not self.speed
+
+    #Start the replay at the first recorded chunk of any port
+    def start(self):
+        firstTimes = [port.times[0] for port in self.ports if port.times]
+        self.startNs = min(firstTimes) if firstTimes else 0
+        self.realStartNs = self.clockNs()
+        self.virtualNs = self.startNs - 1
+
+    #Recorded time the replay has reached
+    def now(self):
+        if (self.startNs == None):
+            self.start()
+
+        if self.maxSpeed():
+            return self.virtualNs
+
+        return self.startNs + int((self.clockNs() - self.realStartNs)*self.speed)
+
+    #As fast as possible: move on to the next recorded chunk of any port;
+    #returns False when there are none left
+    def advance(self):
+        if (self.startNs == None):
+            self.start()
+
+        nextTimes = [port.nextTime() for port in self.ports if (port.nextTime() != None)]
+
+        if not nextTimes:
+            return False
+
+        self.virtualNs = max(self.virtualNs,min(nextTimes))
+
+        return True
+
+    #Sleep until a recorded time is reached or the timeout (real seconds)
+    #expires
+    def wait(self,untilNs,timeout):
+        if self.maxSpeed():
+            return
+
+        self.sleep(max(0,min(timeout,(untilNs - self.now())/(self.speed*1e9))))
+
+#==========================================================================
+# PORT CLASS
+#==========================================================================
+class DW1000replayPort(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,clock,times,chunks,wallOffsetNs=0,baudrate=None):
+        self.clock = clock
+        self.times = times              #recorded receive time of each chunk (ns), ascending
+        self.chunks = chunks            #recorded bytes
+        self.wallOffsetNs = wallOffsetNs    #recorded time + this = wall clock time (ns)
+        self.baudrate = baudrate        #baud rate of the recorded port (None if unknown)
+        self.timeout = 0.01             #same meaning as pyserial; how long an empty read blocks
+
+        self.nextIndex = 0              #next chunk to release
+        self.lastChunkNs = None         #recorded time of the chunk read last
+        self.released = collections.deque()     #[bytes, recorded time] of the chunks released but not read
+        self.commandBuffer = bytearray()
+        self.antDelay = 0
+        self.isOpened = True
+
+        clock.addPort(self)
+
+    #==========================================================================
+    # REPLAY FUNCTIONS
+    #==========================================================================
+    #Recorded time of the next chunk, or None if they have all been released
+    def nextTime(self):
+        if (self.nextIndex < len(self.times)):
+            return self.times[self.nextIndex]
+
+        return None
+
+    #Release every chunk the replay has reached
+    def release(self):
+        endIndex = bisect.bisect_right(self.times,self.clock.now(),self.nextIndex)
+
+        for index in range(self.nextIndex,endIndex):
+            self.released.append([self.chunks[index],self.times[index]])
+
+        self.nextIndex = max(self.nextIndex,endIndex)
+
+    def finished(self):
+        return (self.nextIndex >= len(self.times)) and not self.released
+
+    #Recorded receive time of the bytes read last, or of the last ones thrown
+    #away (DW1000serial.clockNs)
+    def receivedNs(self):
+        if (self.lastChunkNs == None):
+            return self.clock.now()
+
+        return self.lastChunkNs
+
+    #Recorded wall clock time of the bytes read last (DW1000serial.wallClock)
+    def receivedTime(self):
+        return (self.receivedNs() + self.wallOffsetNs)/1e9
+
+    #==========================================================================
+    # SERIAL PORT FUNCTIONS
+    #==========================================================================
+    #Bytes left of the oldest chunk released; later chunks wait for the reads
+    #after it
+    @property
+    def in_waiting(self):
+        self.release()
+
+        if not self.released and self.clock.maxSpeed() and self.clock.advance():
+            self.release()
+
+        return len(self.released[0][0]) if self.released else 0
+
+    #Read from the oldest chunk released (at most the rest of it)
+    def read(self,size=1):
+        self.release()
+
+        if not self.released:
+            if self.clock.maxSpeed():
+                if self.clock.advance():
+                    self.release()
+            elif (self.nextTime() != None):
+                self.clock.wait(self.nextTime(),self.timeout)
+                self.release()
+            else:
+                self.clock.sleep(self.timeout)
+
+        if not self.released:
+            return b""
+
+        chunk = self.released[0]
+        data = bytes(chunk[0][:size])
+        self.lastChunkNs = chunk[1]
+
+        if (size >= len(chunk[0])):
+            self.released.popleft()
+        else:
+            chunk[0] = chunk[0][size:]
+
+        return data
+
+    #Answer the antenna delay commands like the firmware (see
+    #DW1000emulator.py); the recorded ranges don't change with it
+    def write(self,data):
+        self.commandBuffer.extend(data.replace(b"\n",b"\r"))
+
+        while (b"\r" in self.commandBuffer):
+            index = self.commandBuffer.index(b"\r")
+            command = self.commandBuffer[:index].decode(errors="ignore").strip().split(",")
+            del self.commandBuffer[:index+1]
+
+            if (command[:2] == ["get","antDelay"]):
+                self.released.append(["antDelay: {0}\r\n".format(self.antDelay).encode(),self.receivedNs()])
+            elif (command[:2] == ["set","antDelay"]) and (len(command) == 3):
+                try: self.antDelay = int(command[2])
+                except ValueError:
+                    pass
+
+        return len(data)
+
+    def reset_input_buffer(self):
+        if self.released:
+            self.lastChunkNs = max(self.receivedNs(),self.released[-1][1])
+            self.released.clear()
+
+    def isOpen(self):
+        return self.isOpened
+
+    def open(self):
+        self.isOpened = True
+
+    def close(self):
+        self.isOpened = False
+
+#==========================================================================
+# REPLAY CLASS
+#==========================================================================
+class DW1000replay(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,ports,clock,meta=None):
+        self.ports = ports      #role -> DW1000replayPort
+        self.clock = clock
+        self.meta = {} if (meta == None) else meta  #session metadata (testInfoDict, anchorFit, tagFit)
+
+    #Replay one raw capture per role ({"anchor":fileName,"tag":fileName})
+    @classmethod
+    def fromRawCaptures(cls,fileNames,speed=1.0,clockNs=time.perf_counter_ns,sleep=time.sleep):
+        clock = DW1000replayClock(speed,clockNs,sleep)
+        ports = {}
+        meta = {}
+
+        for role,fileName in fileNames.items():
+            header,times,chunks = readRawCapture(fileName)
+            wallOffsetNs = int(round(header["startTime"]*1e9)) - header["startNs"]
+            ports[role] = DW1000replayPort(clock,times,chunks,wallOffsetNs,header.get("baudrate"))
+            meta = meta or header.get("meta",{})
+
+        return cls(ports,clock,meta)
+
+    #Replay a session file
+    @classmethod
+    def fromSession(cls,fileName,speed=1.0,clockNs=time.perf_counter_ns,sleep=time.sleep):
+        clock = DW1000replayClock(speed,clockNs,sleep)
+        meta,times,lines = readSession(fileName)
+        ports = {role:DW1000replayPort(clock,times,lines[role]) for role in lines}
+
+        return cls(ports,clock,meta)
+
+    #Connect a DW1000test object to the replay instead of serial ports
+    def attach(self,DW1000):
+        for role,port in self.ports.items():
+            device = DW1000.devices[role]
+            device.ser = port
+            device.clockNs = port.receivedNs
+            device.wallClock = port.receivedTime
+            device.readbackTimeout = 0.0    #the replay answers commands immediately
+            DW1000.deviceConnect(role)
+
+        #Recorded receive times aren't on the clock the stages are timed with
+        DW1000.liveTiming = False
+
+    #Whether every recorded chunk has been read
+    def finished(self):
+        return all(port.finished() for port in self.ports.values())
+
+    #Recorded seconds covered by the replay
+    def duration(self):
+        times = [port.times[index] for port in self.ports.values() if port.times for index in (0,-1)]
+
+        return (max(times) - min(times))/1e9 if times else 0.0
+
+#==========================================================================
+# MAIN
+#==========================================================================
+if __name__ == "__main__":
+    import DW1000pipeline
+    import DW1000test
+
+    parser = argparse.ArgumentParser(description="Replay a recorded DW1000 session through the streaming pipeline")
+    parser.add_argument("files",nargs="+",help="session .rfz file, or anchor and tag .dwraw captures")
+    parser.add_argument("--speed",type=float,default=0.0,help="recorded seconds per second (0 for as fast as possible)")
+    parser.add_argument("--output",default="",help=".csv file to write the replayed ranges to")
+    parser.add_argument("--capture",default="",help=".rfz session file to record the replayed raw ranges to")
+    parser.add_argument("--log-dir",default="",help="directory for rotating logs of the replayed ranges")
+    parser.add_argument("--pubsub",default="",help="Unix socket path or host:port to publish the replayed ranges on")
+    parser.add_argument("--shm",default="",help="shared memory ring buffer to publish the replayed ranges in")
+    args = parser.parse_args()
+
+    try:
+        if (len(args.files) == 1):
+            replay = DW1000replay.fromSession(args.files[0],speed=args.speed)
+        else:
+            replay = DW1000replay.fromRawCaptures({"anchor":args.files[0],"tag":args.files[1]},speed=args.speed)
+    except (IOError,OSError,ValueError,KeyError) as error:
+        print("ERROR: Could not read the recording ({0})".format(error))
+        sys.exit(1)
+
+    testInfoDict = replay.meta.get("testInfoDict")
+    DW1000 = DW1000test.DW1000test(testInfoDict=dict(testInfoDict) if testInfoDict else None)
+    testInfoDict = DW1000.testInfoDict
+    anchorFitDict = replay.meta.get("anchorFit",{"m":1.0,"b":0.0})
+    tagFitDict = replay.meta.get("tagFit",{"m":1.0,"b":0.0})
+    replay.attach(DW1000)
+
+    #The recorded outputs belonged to the live session; the replay only
+    #writes to the ones given on the command line
+    testInfoDict.update(captureFile=args.capture,
+                        logDir=args.log_dir,
+                        pubsubAddress=args.pubsub,
+                        shmName=args.shm)
+
+    outputs = [DW1000pipeline.DW1000csvOutput(args.output)] if args.output else []
+    rangePipeline = DW1000pipeline.DW1000rangePipeline(DW1000,anchorFitDict,tagFitDict,testInfoDict,outputs)
+    startTime = time.perf_counter()
+
+    try:
+        while not replay.finished():
+            if not (DW1000.distMeasLoop()):
+                break
+
+            rangePipeline.process()
+    finally:
+        rangePipeline.close()
+
+    elapsedTime = time.perf_counter() - startTime
+    numSamples = rangePipeline.numSamples
+
+    print("Replayed {0} samples ({1:.1f} s recorded) in {2:.2f} s: {3:.0f} samples/s, {4:.1f}x real time".format(numSamples,
+                                                                                                        replay.duration(),
+                                                                                                        elapsedTime,
+                                                                                                        numSamples/max(elapsedTime,1e-9),
+                                                                                                        replay.duration()/max(elapsedTime,1e-9)))
+    print(DW1000.serialStatsSummary())
+    print(DW1000.latency.report())
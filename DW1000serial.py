@@ -19,6 +19,7 @@ AN:
 #==========================================================================
 import inspect
 import serial
+import threading
 import time
 
 from serial.tools import list_ports
@@ -37,6 +38,8 @@ class DW1000(object):
         self.readbackTimeout = 0.5          #how long to wait after writing a command to read the response
         self.openTimeout = 2                #serial open timeout in seconds
         self.readTimeout = 5                #serial read timeout in seconds
+        self.pollInterval = 0.01            #longest a single serial read blocks, in seconds; bounds how
+                                            #long a cancel() takes to be noticed
         
         #strings printed to serial
         self.antDelayStr = "antDelay: "     #string printed to UART when requesting the antenna delay value
@@ -51,6 +54,18 @@ class DW1000(object):
         
         #other
         self.printDebug = False             #Whether or not to print the debug data to the console
+        self.lastSample = None              #all fields of the most recent range line (see parseRangeLine)
+        self.rxBuffer = bytearray()         #received bytes that don't form a complete line yet
+        self.lastReadNs = None              #perf_counter_ns of the last serial read that returned data
+        self.lastFlushNs = 0                #perf_counter_ns of the last flushInput
+        self.clockNs = time.perf_counter_ns #clocks receive times are taken from (a recording's clocks
+        self.wallClock = time.time          #when replaying, see DW1000replay.py)
+        self.recorder = None                #records every received byte if set (see DW1000replay.py)
+        self.cancelEvent = threading.Event() #set to make blocking queries return None (see cancel)
+
+        #Receive counters (see getStats)
+        self.counters = {}
+        self.resetStats()
 
     #==========================================================================
     # CONNECTIVITY FUNCTIONS
@@ -99,7 +114,7 @@ class DW1000(object):
         self.commonPrint("Initializing DUT serial connection...")
 
         try:
-            ser = serial.Serial(port, baudrate, timeout=self.openTimeout)
+            ser = serial.Serial(port, baudrate, timeout=self.pollInterval, write_timeout=self.openTimeout)
         except Exception as exception:
             self.commonPrint("Could not initialize the serial port...")
             self.commonPrint("ERROR: {0}".format(exception))
@@ -147,13 +162,10 @@ class DW1000(object):
         
         self.debugPrint("Parsing peer address...")
         
-        try:
-            self.ser.readline()  #Clear the input buffer
+        try: self.flushInput()
         except:
             self.debugPrint("ERROR: Not connected to DUT!")  
-            return None        
-
-        self.ser.reset_input_buffer()   #flush the contents of the input buffer
+            return None
 
         startTime = datetime.now()
        
@@ -161,13 +173,21 @@ class DW1000(object):
             elapsedTime = (datetime.now() - startTime).total_seconds()
             
             if (elapsedTime > timeout):
+                self.counters["timeouts"] += 1
                 self.debugPrint("ERROR: Timeout expired waiting for peer address")
                 return None
+
+            if self.cancelEvent.is_set():
+                self.debugPrint("Cancelled waiting for peer address")
+                return None
             
-            try: newLine = self.ser.readline().decode(errors="ignore")
+            try: newLine = self.pollLine()
             except:
                 self.debugPrint("ERROR: Problem reading peer address")
                 return None
+
+            if (newLine == None):
+                continue
             
             if (self.peerAddrStr in newLine):
                 try: tmp = newLine.split(self.peerAddrStr)[1]
@@ -190,13 +210,10 @@ class DW1000(object):
         
         self.debugPrint("Parsing devce type...")
         
-        try:
-            self.ser.readline()  #Clear the input buffer
+        try: self.flushInput()
         except:
             self.debugPrint("ERROR: Not connected to DUT!")  
-            return None        
-
-        self.ser.reset_input_buffer()   #flush the contents of the input buffer
+            return None
 
         startTime = datetime.now()
        
@@ -204,13 +221,21 @@ class DW1000(object):
             elapsedTime = (datetime.now() - startTime).total_seconds()
             
             if (elapsedTime > timeout):
+                self.counters["timeouts"] += 1
                 self.debugPrint("ERROR: Timeout expired waiting for device type")
                 return None
+
+            if self.cancelEvent.is_set():
+                self.debugPrint("Cancelled waiting for device type")
+                return None
             
-            try: newLine = self.ser.readline().decode(errors="ignore")
+            try: newLine = self.pollLine()
             except:
                 self.debugPrint("ERROR: Problem reading device type")
                 return None
+
+            if (newLine == None):
+                continue
             
             if (self.deviceTypeStr in newLine):
                 try: tmp = newLine.split(self.deviceTypeStr)[1]
@@ -233,13 +258,10 @@ class DW1000(object):
         
         self.debugPrint("Parsing RX power value...")
         
-        try:
-            self.ser.readline()  #Clear the input buffer
+        try: self.flushInput()
         except:
             self.debugPrint("ERROR: Not connected to DUT!")  
-            return None        
-
-        self.ser.reset_input_buffer()   #flush the contents of the input buffer
+            return None
 
         startTime = datetime.now()
        
@@ -247,20 +269,30 @@ class DW1000(object):
             elapsedTime = (datetime.now() - startTime).total_seconds()
             
             if (elapsedTime > timeout):
+                self.counters["timeouts"] += 1
                 self.debugPrint("ERROR: Timeout expired waiting for RX power value")
                 return None
+
+            if self.cancelEvent.is_set():
+                self.debugPrint("Cancelled waiting for RX power value")
+                return None
             
-            try: newLine = self.ser.readline().decode(errors="ignore")
+            try: newLine = self.pollLine()
             except:
                 self.debugPrint("ERROR: Problem reading RX power value")
                 return None
+
+            if (newLine == None):
+                continue
             
             if (self.rxPowerStr in newLine):
                 try: tmp = newLine.split(self.rxPowerStr)[1]
                 except: continue
                 
                 try: rxPowerVal = float(tmp.split(" ")[0])
-                except: continue
+                except:
+                    self.counters["parseFailures"] += 1
+                    continue
                 
                 self.debugPrint("RX power is {0} dBm".format(rxPowerVal))
                 self.debugPrint("RX power query complete.")
@@ -276,13 +308,10 @@ class DW1000(object):
         
         self.debugPrint("Parsing range value...")
         
-        try:
-            self.ser.readline()  #Clear the input buffer
+        try: self.flushInput()
         except:
             self.debugPrint("ERROR: Not connected to DUT!")  
-            return None        
-
-        self.ser.reset_input_buffer()   #flush the contents of the input buffer
+            return None
 
         startTime = datetime.now()
        
@@ -290,19 +319,33 @@ class DW1000(object):
             elapsedTime = (datetime.now() - startTime).total_seconds()
             
             if (elapsedTime > timeout):
+                self.counters["timeouts"] += 1
                 self.debugPrint("ERROR: Timeout expired waiting for range value")
                 return None
-            try: newLine = self.ser.readline().decode(errors="ignore")
+
+            if self.cancelEvent.is_set():
+                self.debugPrint("Cancelled waiting for range value")
+                return None
+
+            try: newLine = self.pollLine()
             except:
                 self.debugPrint("ERROR: Problem reading range value")
                 return None
+
+            if (newLine == None):
+                continue
             
             if (self.rangeStr in newLine):
-                try: tmp = newLine.split(self.rangeStr)[1]
-                except: continue
-                
-                try: rangeVal = float(tmp.split(" ")[0])*100
-                except: continue
+                sample = self.parseRangeLine(newLine)
+
+                if (sample == None):
+                    continue
+
+                sample["readNs"] = self.lastReadNs      #see DW1000latency.py
+                sample["parsedNs"] = self.clockNs()
+
+                rangeVal = sample["range"]
+                self.lastSample = sample
                 
                 self.debugPrint("Range is {0} cm".format(rangeVal))
                 self.debugPrint("Range query complete.")
@@ -311,6 +354,35 @@ class DW1000(object):
 
         return rangeVal
 
+    #Parse every field of a streamed range line (device type, peer address,
+    #range in cm and RX power in dBm); fields missing from the line are None.
+    #Returns None if the line has no valid range value
+    def parseRangeLine(self,newLine):
+        sample = {"deviceType":None,
+                  "peerAddr":None,
+                  "range":None,
+                  "rxPower":None}
+
+        for key,fieldStr in (("deviceType",self.deviceTypeStr),
+                             ("peerAddr",self.peerAddrStr),
+                             ("range",self.rangeStr),
+                             ("rxPower",self.rxPowerStr)):
+            if (fieldStr in newLine):
+                try: sample[key] = newLine.split(fieldStr)[1].split(" ")[0].strip()
+                except: continue
+
+        try: sample["range"] = float(sample["range"])*100
+        except:
+            self.counters["parseFailures"] += 1
+            return None
+
+        try: sample["rxPower"] = float(sample["rxPower"])
+        except: sample["rxPower"] = None
+
+        self.counters["framesParsed"] += 1
+
+        return sample
+
     #Set the antenna delay
     def getAntennaDelay(self,timeout=None):
         if (timeout == None):
@@ -318,16 +390,16 @@ class DW1000(object):
         
         self.debugPrint("Getting antenna delay...")
         
-        try:
-            self.ser.readline()  #Clear the input buffer
+        try: self.flushInput()
         except:
             self.debugPrint("ERROR: Not connected to DUT!")  
             return None
-        
-        self.ser.reset_input_buffer()   #flush the contents of the input buffer
+
         self.sendMessage("get,antDelay\r")
 
-        time.sleep(self.readbackTimeout)
+        if self.cancelEvent.wait(self.readbackTimeout):
+            self.debugPrint("Cancelled waiting for antenna delay value")
+            return None
         
         startTime = datetime.now()
        
@@ -335,13 +407,21 @@ class DW1000(object):
             elapsedTime = (datetime.now() - startTime).total_seconds()
             
             if (elapsedTime > timeout):
+                self.counters["timeouts"] += 1
                 self.debugPrint("ERROR: Timeout expired waiting for antenna delay value check")
                 return None
+
+            if self.cancelEvent.is_set():
+                self.debugPrint("Cancelled waiting for antenna delay value check")
+                return None
             
-            try: newLine = self.ser.readline().decode(errors="ignore")
+            try: newLine = self.pollLine()
             except:
                 self.debugPrint("ERROR: Problem getting antenna delay value")
                 return None
+
+            if (newLine == None):
+                continue
             
             if (self.antDelayStr in newLine):
                 try: antDelayParsed = newLine.split(self.antDelayStr)[1]
@@ -372,13 +452,10 @@ class DW1000(object):
 
         self.debugPrint("Setting antenna delay value to {0}...".format(value))
         
-        try:
-            self.ser.readline()  #Clear the input buffer
+        try: self.flushInput()
         except:
             self.debugPrint("ERROR: Not connected to DUT!")  
             return None
-        
-        self.ser.reset_input_buffer()   #flush the contents of the input buffer
         self.sendMessage("set,antDelay,{0}\r".format(value))
        
         antDelayVal = self.getAntennaDelay()
@@ -392,20 +469,137 @@ class DW1000(object):
             
         return True        
 
+    #Return the next complete line from the serial port, or None if there
+    #isn't one yet; never blocks for more than pollInterval
+    def pollLine(self):
+        newLine = self.bufferedLine()
+
+        if (newLine == None):
+            self.receive(self.ser.read(max(1,self.ser.in_waiting)))
+            newLine = self.bufferedLine()
+
+        return newLine
+
+    #Read whatever the serial port already has without blocking (see
+    #DW1000manager); returns the number of bytes read
+    def readAvailable(self):
+        waiting = self.ser.in_waiting
+
+        if not waiting:
+            return 0
+
+        return self.receive(self.ser.read(waiting))
+
+    #Add received bytes to the line buffer
+    def receive(self,data):
+        if data:
+            self.lastReadNs = self.clockNs()   #when the last bytes of the buffered lines arrived
+            self.rxBuffer.extend(data)
+            self.counters["bytesReceived"] += len(data)
+
+            if (self.recorder != None):
+                self.recorder.record(self.lastReadNs,data)
+
+        return len(data)
+
+    #Remove the next complete line from the line buffer, or return None
+    def bufferedLine(self):
+        index = self.rxBuffer.find(b"\n")
+
+        if (index < 0):
+            return None
+
+        newLine = bytes(self.rxBuffer[:index+1])
+        del self.rxBuffer[:index+1]
+        self.counters["linesReceived"] += 1
+
+        return newLine.decode(errors="ignore")
+
+    #File descriptor of the serial port for selectors, or None if it can't
+    #be waited on (e.g. COM ports on Windows)
+    def fileno(self):
+        try: return self.ser.fileno()
+        except:
+            return None
+
+    #Throw away everything received so far, counting the complete lines lost
+    #(bytes still in flight when the buffer is reset can't be counted)
+    def flushInput(self):
+        discarded = bytes(self.rxBuffer)
+        waiting = self.ser.in_waiting
+
+        if waiting:
+            data = self.ser.read(waiting)
+            self.counters["bytesReceived"] += len(data)
+            discarded += data
+
+            if (self.recorder != None) and data:
+                self.recorder.record(self.clockNs(),data)
+
+        self.ser.reset_input_buffer()   #flush the contents of the input buffer
+        del self.rxBuffer[:]
+        self.lastFlushNs = self.clockNs()
+
+        self.counters["bytesDiscarded"] += len(discarded)
+        self.counters["framesDiscarded"] += discarded.count(b"\n")
+
+    #Counters since the last resetStats() and the rates derived from them
+    def getStats(self):
+        stats = dict(self.counters)
+        elapsedTime = max(time.perf_counter() - self.statsStartTime,1e-9)
+        linesSeen = stats["linesReceived"] + stats["framesDiscarded"]
+
+        stats["seconds"] = elapsedTime
+        stats["bytesPerSec"] = stats["bytesReceived"]/elapsedTime
+        stats["linesPerSec"] = stats["linesReceived"]/elapsedTime
+        stats["framesPerSec"] = stats["framesParsed"]/elapsedTime
+        stats["discardedPerSec"] = stats["framesDiscarded"]/elapsedTime
+        stats["discardRatio"] = (stats["framesDiscarded"]/linesSeen) if linesSeen else 0.0
+
+        return stats
+
+    def resetStats(self):
+        for name in ("bytesReceived",     #bytes read from the serial port
+                     "linesReceived",     #complete lines handed to the queries
+                     "framesParsed",      #range lines parsed successfully
+                     "framesDiscarded",   #complete lines thrown away by flushInput
+                     "bytesDiscarded",    #bytes thrown away by flushInput
+                     "parseFailures",     #lines with a field that couldn't be parsed
+                     "timeouts"):         #queries that timed out
+            self.counters[name] = 0
+
+        self.statsStartTime = time.perf_counter()
+
+    #One-line summary of getStats() for status displays
+    def statsSummary(self,stats=None):
+        if (stats == None):
+            stats = self.getStats()
+
+        return "{0:.1f} frames/s, {1:.0f} B/s, {2:.0%} discarded, {3} parse errors, {4} timeouts".format(stats["framesPerSec"],
+                                                                                                       stats["bytesPerSec"],
+                                                                                                       stats["discardRatio"],
+                                                                                                       stats["parseFailures"],
+                                                                                                       stats["timeouts"])
+
+    #Make any query that is waiting on the device return None within
+    #pollInterval; stays in effect until resetCancel() is called
+    def cancel(self):
+        self.cancelEvent.set()
+
+    def resetCancel(self):
+        self.cancelEvent.clear()
+
     #Send a message over the serial port
     #NOTE: each command is of the form [get|set],[command][,value] and ends
     #      with either a line feed or carriage return
     def sendMessage(self,string):
         self.debugPrint("Sending command '{0}'...".format(string))
         
-        try:
-            self.ser.readline()  #Clear the input buffer
+        try: self.flushInput()
         except:
             self.debugPrint("ERROR: Not connected to DUT!")  
             return None
         
-        self.ser.reset_input_buffer()   #flush the contents of the input buffer
-        
         for char in string:
             self.ser.write(char.encode())
 
@@ -447,15 +641,13 @@ class DW1000(object):
             self.commonPrint("Debug output disabled.")
 
     #Function to print debug messages
+    #NOTE: only the caller's frame is inspected, and only when debugging is
+    #      enabled; walking the whole stack costs far more than a range read
     def debugPrint(self,string):
-        (frame,
-         filename,
-         line_number,
-         function_name,
-         lines,
-         index) = inspect.getouterframes(inspect.currentframe())[1]
-
         if (self.printDebug == True):
+            callerFrame = inspect.currentframe().f_back
+            filename = callerFrame.f_code.co_filename
+            line_number = callerFrame.f_lineno
             a = datetime.now()
             print("{0} {1} [Notice: {2}]: {3}".format(filename.split("\\")[-1],
                                                        line_number,
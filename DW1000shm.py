@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 SHARED MEMORY RING BUFFER SOFTWARE (x64)
+
+Publishes streamed samples into a multiprocessing.shared_memory ring buffer
+so that readers in other processes on the same host can see them without any
+socket copies or locks
+
+LAYOUT:
+-Header (int64): magic, version, number of slots, number of columns, write
+ sequence (number of samples written so far), column name length, writer's
+ process ID
+-Column names as UTF-8 JSON
+-Slot sequence numbers (int64, one per slot)
+-Timestamps (float64, one per slot)
+-Values (float64, one row of columns per slot)
+
+NOTES:
+-There is exactly one writer. A new writer only replaces an existing block
+ if the process that wrote it has gone (it didn't shut down cleanly);
+ otherwise it raises FileExistsError rather than cut off the live writer's
+ readers
+-Each slot is guarded by its sequence number
+ (set to -1 while the slot is being written), so a reader can tell if a slot
+ was overwritten while it was copying it out
+-A reader that falls more than a whole ring behind the writer counts the
+ samples it missed as an overrun and skips ahead to the oldest sample left
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import json
+import os
+import time
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+#==========================================================================
+# CONSTANTS
+#==========================================================================
+shmMagic = 0x44573130   #"DW10"
+shmVersion = 1
+
+#Header indices
+headerMagic = 0
+headerVersion = 1
+headerNumSlots = 2
+headerNumColumns = 3
+headerWriteSeq = 4
+headerNamesLen = 5
+headerOwnerPid = 6
+headerLen = 8
+
+namesSize = 256     #bytes reserved for the column names
+
+ownedBlocks = set() #names of the blocks created by writers in this process
+
+#==========================================================================
+# LAYOUT FUNCTIONS
+#==========================================================================
+#Size of the shared memory block in bytes
+def ringSize(numSlots,numColumns):
+    return 8*headerLen + namesSize + 8*numSlots*(2+numColumns)
+
+#Numpy views onto the shared memory block
+def ringViews(buf,numSlots,numColumns):
+    offset = 8*headerLen + namesSize
+    header = np.ndarray((headerLen,),dtype=np.int64,buffer=buf)
+    names = np.ndarray((namesSize,),dtype=np.uint8,buffer=buf,offset=8*headerLen)
+    slotSeqs = np.ndarray((numSlots,),dtype=np.int64,buffer=buf,offset=offset)
+    offset += 8*numSlots
+    timestamps = np.ndarray((numSlots,),dtype=np.float64,buffer=buf,offset=offset)
+    offset += 8*numSlots
+    values = np.ndarray((numSlots,numColumns),dtype=np.float64,buffer=buf,offset=offset)
+
+    return header,names,slotSeqs,timestamps,values
+
+#Whether a process is still running
+def processAlive(pid):
+    if (pid <= 0):
+        return False
+
+    #os.kill(pid,0) would terminate the process on Windows
+    if (os.name == "nt"):
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000,False,pid)     #PROCESS_QUERY_LIMITED_INFORMATION
+
+        if not handle:
+            return (kernel32.GetLastError() == 5)   #access denied: it exists
+
+        exitCode = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle,ctypes.byref(exitCode))
+        kernel32.CloseHandle(handle)
+
+        return (exitCode.value == 259)  #STILL_ACTIVE
+
+    try: os.kill(pid,0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+#Process ID of the writer of an existing block (0 if it doesn't say)
+def blockOwner(shm):
+    if (shm.size < 8*headerLen):
+        return 0
+
+    header = np.ndarray((headerLen,),dtype=np.int64,buffer=shm.buf)
+    ownerPid = int(header[headerOwnerPid])
+    del header
+
+    return ownerPid
+
+#==========================================================================
+# WRITER CLASS
+#==========================================================================
+class DW1000shmWriter(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,name,columns=("anchor","tag"),numSlots=4096):
+        self.name = name                #shared memory block name readers attach to
+        self.columns = list(columns)    #names of the value columns
+        self.numSlots = numSlots        #samples kept in the ring
+
+        namesBytes = json.dumps(self.columns).encode("utf-8")
+
+        if (len(namesBytes) > namesSize):
+            raise ValueError("Column names take more than {0} bytes".format(namesSize))
+
+        #Replace a block left over from a writer that didn't shut down
+        #cleanly, but never one whose writer is still running
+        try:
+            existing = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            existing = None
+
+        if (existing != None):
+            ownerPid = blockOwner(existing)
+
+            if (self.name in ownedBlocks) or processAlive(ownerPid):
+                existing.close()
+                raise FileExistsError("Shared memory block '{0}' is in use by process {1}".format(self.name,ownerPid))
+
+            existing.close()
+            existing.unlink()
+
+        self.shm = shared_memory.SharedMemory(name=self.name,
+                                              create=True,
+                                              size=ringSize(self.numSlots,len(self.columns)))
+
+        (self.header,
+         names,
+         self.slotSeqs,
+         self.timestamps,
+         self.values) = ringViews(self.shm.buf,self.numSlots,len(self.columns))
+
+        ownedBlocks.add(self.name)
+
+        self.header[headerOwnerPid] = os.getpid()
+        self.slotSeqs[:] = -1
+        names[:len(namesBytes)] = np.frombuffer(namesBytes,dtype=np.uint8)
+        self.header[headerNumSlots] = self.numSlots
+        self.header[headerNumColumns] = len(self.columns)
+        self.header[headerWriteSeq] = 0
+        self.header[headerNamesLen] = len(namesBytes)
+        self.header[headerVersion] = shmVersion
+        self.header[headerMagic] = shmMagic     #written last; readers wait for it
+
+        self.sequence = 0   #sequence number of the next sample
+
+    #==========================================================================
+    # PUBLISHING FUNCTIONS
+    #==========================================================================
+    #Write a sample into the next slot
+    def publish(self,timestamp,values):
+        slot = self.sequence % self.numSlots
+
+        self.slotSeqs[slot] = -1    #mark the slot as being written
+        self.timestamps[slot] = timestamp
+        self.values[slot] = values
+        self.slotSeqs[slot] = self.sequence
+
+        self.sequence += 1
+        self.header[headerWriteSeq] = self.sequence
+
+    #Sample listener for DW1000test.sampleListeners; publishes the columns
+    #named after the sample dictionary keys (e.g. "anchorRange") with the
+    #sample's own time
+    def pushSample(self,sample):
+        values = [np.nan if (sample.get(name) == None) else sample[name] for name in self.columns]
+
+        self.publish(sample.get("correctedTime",sample["time"]),values)
+
+    #Release the shared memory block
+    def close(self):
+        if (self.shm == None):
+            return
+
+        #Drop our views first; the block can't be closed while they exist
+        self.header = self.slotSeqs = self.timestamps = self.values = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+        ownedBlocks.discard(self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        self.close()
+
+#==========================================================================
+# READER CLASS
+#==========================================================================
+class DW1000shmReader(object):
+    verNum = "0.0.0"
+
+    #Object initialization; waits up to timeout seconds for the writer
+    def __init__(self,name,timeout=5.0,fromStart=False):
+        self.name = name
+        self.shm = self.attach(timeout)
+
+        #Only the header is mapped until we know the ring dimensions
+        header = np.ndarray((headerLen,),dtype=np.int64,buffer=self.shm.buf)
+        deadline = time.monotonic() + timeout
+
+        while (header[headerMagic] != shmMagic):
+            if (time.monotonic() > deadline):
+                del header
+                self.shm.close()
+                raise TimeoutError("Shared memory block '{0}' was never initialized".format(self.name))
+            time.sleep(0.001)
+
+        if (header[headerVersion] != shmVersion):
+            version = int(header[headerVersion])
+            del header
+            self.shm.close()
+            raise ValueError("Unsupported ring buffer version {0}".format(version))
+
+        self.numSlots = int(header[headerNumSlots])
+        numColumns = int(header[headerNumColumns])
+        del header
+
+        #Zero-copy views; the slot arrays may change under you at any time,
+        #use read() for consistent samples
+        (self.header,
+         names,
+         self.slotSeqs,
+         self.timestamps,
+         self.values) = ringViews(self.shm.buf,self.numSlots,numColumns)
+
+        self.columns = json.loads(names[:self.header[headerNamesLen]].tobytes().decode("utf-8"))
+
+        #Counters
+        self.nextSeq = 0 if fromStart else int(self.header[headerWriteSeq])  #next sequence to read
+        self.overruns = 0           #times the writer lapped this reader
+        self.samplesMissed = 0      #samples lost to overruns
+
+    def attach(self,timeout):
+        deadline = time.monotonic() + timeout
+
+        while True:
+            try: shm = shared_memory.SharedMemory(name=self.name)
+            except FileNotFoundError:
+                if (time.monotonic() > deadline):
+                    raise
+                time.sleep(0.01)
+                continue
+
+            #Python < 3.13 registers attached blocks with the resource
+            #tracker, which would unlink the writer's block when we exit
+            if (self.name in ownedBlocks):
+                return shm
+
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name,"shared_memory")
+            except (ImportError,AttributeError,KeyError):
+                pass
+
+            return shm
+
+    #==========================================================================
+    # READING FUNCTIONS
+    #==========================================================================
+    #Number of samples written that haven't been read yet
+    def available(self):
+        return int(self.header[headerWriteSeq]) - self.nextSeq
+
+    #Copy out every sample written since the last read (at most maxSamples)
+    #as (sequences, timestamps, values) arrays
+    def read(self,maxSamples=None):
+        writeSeq = int(self.header[headerWriteSeq])
+
+        #Lapped by the writer: skip to the oldest sample still in the ring
+        if (writeSeq - self.nextSeq > self.numSlots):
+            self.overruns += 1
+            self.samplesMissed += writeSeq - self.numSlots - self.nextSeq
+            self.nextSeq = writeSeq - self.numSlots
+
+        stopSeq = writeSeq if (maxSamples == None) else min(writeSeq,self.nextSeq + maxSamples)
+        sequences = np.arange(self.nextSeq,stopSeq,dtype=np.int64)
+        slots = sequences % self.numSlots
+
+        seqsBefore = self.slotSeqs[slots]
+        timestamps = self.timestamps[slots]
+        values = self.values[slots]
+        seqsAfter = self.slotSeqs[slots]
+
+        #Slots the writer got to while we were copying them
+        valid = (seqsBefore == sequences) & (seqsAfter == sequences)
+
+        if not valid.all():
+            self.overruns += 1
+            self.samplesMissed += int(np.count_nonzero(~valid))
+            sequences = sequences[valid]
+            timestamps = timestamps[valid]
+            values = values[valid]
+
+        self.nextSeq = stopSeq
+
+        return sequences,timestamps,values
+
+    #Wait for new samples; returns them like read(), or empty arrays if the
+    #timeout expires
+    def poll(self,timeout=None,interval=0.0005,maxSamples=None):
+        deadline = None if (timeout == None) else time.monotonic() + timeout
+
+        while (self.available() <= 0):
+            if (deadline != None) and (time.monotonic() > deadline):
+                break
+            time.sleep(interval)
+
+        return self.read(maxSamples)
+
+    #Most recent sample as (sequence, timestamp, values), or None
+    def latest(self):
+        for _ in range(3):
+            sequence = int(self.header[headerWriteSeq]) - 1
+
+            if (sequence < 0):
+                return None
+
+            slot = sequence % self.numSlots
+            timestamp = float(self.timestamps[slot])
+            values = self.values[slot].copy()
+
+            if (self.slotSeqs[slot] == sequence):
+                return sequence,timestamp,values
+
+        return None
+
+    #Detach from the shared memory block (the writer owns it)
+    def close(self):
+        if (self.shm == None):
+            return
+
+        self.header = self.slotSeqs = self.timestamps = self.values = None
+        self.shm.close()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        self.close()
@@ -17,6 +17,7 @@ AN:
 -First usable version
 """
 
+import DW1000filters
 import DW1000test
 import sys
 import numpy as np
@@ -30,6 +31,20 @@ calInfoDict = {"testType":"antDelayCal",
                "tagPort":"COM15", #COM port for tag (add to GUI)
                "anchorBaud":9600,  #baud rate for anchor (add to GUI)
                "tagBaud":9600, #baud rate for tag (add to GUI)
+               "outlierMode":"off", #What to do with range outliers before they are buffered ('drop', 'replace', 'flag' or 'off')
+               "outlierWindow":21, #Number of recent ranges the outlier median/MAD is taken over
+               "outlierThreshold":3.0, #Ranges further than this many deviations from the median are outliers
+               "outlierMinDeviation":5.0, #Smallest deviation (cm) the outlier test uses, so the normal noise of a quiet link isn't rejected
+               "nlosWeighting":False, #Whether or not to weight ranges by their NLOS quality in the averages and fits
+               "nlosRangeStd":2.0, #Expected line of sight range noise in cm for the NLOS classifier
+               "pairTolerance":0.0, #Seconds between anchor and tag reports of the same exchange, e.g. 0.05 (0 to pair the newest reports instead)
+               "timingCorrection":False, #Whether or not to correct report times for each port's latency and jitter
+               "framePeriod":0.0, #Firmware range line period in s for the timing correction (0 to estimate it)
+               "angleCorrectionFile":"", #Range x angle correction table (.npz) from DW1000angle.py (leave empty to disable); inert until something calls DW1000.setOrientation, which nothing in this software does yet
+               "maxOrientationAge":1.0, #Seconds an orientation estimate (DW1000.setOrientation) is used for
+               "kalmanFilter":False, #Whether or not to smooth the scaled ranges with a Kalman filter before output
+               "kalmanProcessNoise":100.0, #Expected tag acceleration in cm/s^2 (higher follows movement faster)
+               "kalmanMeasurementNoise":2.0, #Expected range noise in cm (higher smooths more)
                "enableDebug":False} #Whether or not to enable debug mode
 plotInfoDict = {"makeGaussPlot":True, #whether or not to make the gaussian part of the average plot
                 "makeHistPlot":True, #whether or not to make the histogram part of the average plot
@@ -46,6 +61,8 @@ calInfoDict["numSteps"] = (calInfoDict["stopDist"] - calInfoDict["startDist"])/c
 
 anchorDict = {}
 tagDict = {}
+anchorWeightDict = {} #quality weights of the ranges in anchorDict (see DW1000quality.py)
+tagWeightDict = {}
 
 #anchorDist = {}
 #tagDist = {}
@@ -86,7 +103,8 @@ while (len(DW1000.anchorRangeBuffer) < calInfoDict["numSamples"]):
 
 anchorAntDelayDec,tagAntDelayDec = DW1000.getAntDelay((calInfoDict["startDist"]/100),
                                                        DW1000.anchorRangeBuffer,
-                                                       DW1000.tagRangeBuffer)
+                                                       DW1000.tagRangeBuffer,
+                                                       DW1000.anchorWeightBuffer)
 
 calInfoDict["anchorAntDelayDec"] = anchorAntDelayDec
 calInfoDict["tagAntDelayDec"] = tagAntDelayDec
@@ -113,33 +131,43 @@ for curDist in range(calInfoDict["startDist"],
     
     anchorDict["{0} cm".format(curDist)] = list(DW1000.anchorRangeBuffer)
     tagDict["{0} cm".format(curDist)] = list(DW1000.tagRangeBuffer)
+    anchorWeightDict["{0} cm".format(curDist)] = list(DW1000.anchorWeightBuffer)
+    tagWeightDict["{0} cm".format(curDist)] = list(DW1000.tagWeightBuffer)
     DW1000.clearBuffers() #clear buffers for next loop
  
-anchorFitDict = DW1000.linearCurveFit(anchorDict.copy())
-tagFitDict = DW1000.linearCurveFit(tagDict.copy())
+anchorFitDict = DW1000.linearCurveFit(anchorDict.copy(),weightDict=anchorWeightDict)
+tagFitDict = DW1000.linearCurveFit(tagDict.copy(),weightDict=tagWeightDict)
 
 DW1000.testInfoDict["device"] = "anchor"
 
-DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy())
-DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy())
+DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
+DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
 
 if plotInfoDict["scaleData"] == True:
     plotInfoDict["scaleData"] = False
-    DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy())
-    DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy())
+    DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
+    DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
     plotInfoDict["scaleData"] = True
 
 DW1000.testInfoDict["device"] = "tag"
 
-DW1000.makeErrorPlotDist(tagDict.copy(),plotInfoDict.copy())
-DW1000.makeGaussianPlotDist(tagDict.copy(),plotInfoDict.copy())
+DW1000.makeErrorPlotDist(tagDict.copy(),plotInfoDict.copy(),weightDict=tagWeightDict)
+DW1000.makeGaussianPlotDist(tagDict.copy(),plotInfoDict.copy(),weightDict=tagWeightDict)
 
 if plotInfoDict["scaleData"] == True:
     plotInfoDict["scaleData"] = False
-    DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy())
-    DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy())
+    DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
+    DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
     plotInfoDict["scaleData"] = True
 
+#Smooth the scaled ranges with one sample of lag (see DW1000filters.py)
+rangeFilter = None
+
+if calInfoDict["kalmanFilter"]:
+    rangeFilter = DW1000filters.DW1000kalmanFilter(numLinks=2,
+                                                   processNoise=calInfoDict["kalmanProcessNoise"],
+                                                   measurementNoise=calInfoDict["kalmanMeasurementNoise"])
+
 while True:
     try:
         if not (DW1000.distMeasLoop()):
@@ -168,6 +196,10 @@ while True:
         tagDist = DW1000.scaleLinearValue(tagDist,
                                           tagFitDict["m"],
                                           tagFitDict["b"])
+        anchorDist,tagDist = DW1000.correctAngle(np.array((anchorDist,tagDist)))
+
+        if rangeFilter:
+            anchorDist,tagDist = rangeFilter.update((anchorDist,tagDist),DW1000.lastSampleTime)
 
         print("Anchor distance: {0} cm".format(anchorDist))
         print("Tag distance: {0} cm".format(tagDist))
@@ -17,8 +17,12 @@ AN:
 -First usable version
 """
 
+import DW1000latency
+import DW1000pipeline
 import DW1000test
+import signal
 import sys
+import time
 import numpy as np
 
 calInfoDict = {"testType":"antDelayCal",
@@ -32,6 +36,35 @@ calInfoDict = {"testType":"antDelayCal",
                "tagPort":"COM15", #COM port for tag (add to GUI)
                "anchorBaud":9600,  #baud rate for anchor (add to GUI)
                "tagBaud":9600, #baud rate for tag (add to GUI)
+               "captureFile":"", #Compressed .rfz file to record raw streamed ranges to (leave empty to disable)
+               "captureMethod":"zlib", #Compression used for the capture file ('zlib' or 'lzma')
+               "rawCapturePrefix":"", #Record the raw serial bytes to <prefix>_anchor.dwraw and <prefix>_tag.dwraw for DW1000replay.py (leave empty to disable)
+               "logDir":"", #Directory for rotating, size-bounded logs of scaled ranges (leave empty to disable)
+               "logRotateSeconds":3600, #Start a new log segment after this many seconds
+               "logRotateBytes":16*2**20, #Start a new log segment after this many bytes
+               "logMaxSegments":168, #Number of closed log segments to keep (a week of hourly segments)
+               "logMaxBytes":2*2**30, #Maximum disk space used by closed log segments
+               "pubsubAddress":"", #Unix socket path or "host:port" to publish scaled ranges on (leave empty to disable)
+               "pubsubQueueSize":1024, #Samples queued per subscriber before the oldest are dropped
+               "shmName":"", #Shared memory ring buffer to publish scaled ranges in (leave empty to disable)
+               "shmSlots":4096, #Number of samples kept in the shared memory ring buffer
+               "latencyFile":"", #JSON file to dump per-stage latency histograms to (leave empty to disable)
+               "latencyDumpSeconds":60, #Seconds between latency histogram dumps
+               "statsSeconds":10, #Seconds between serial receive statistics printouts
+               "outlierMode":"off", #What to do with range outliers before they are buffered ('drop', 'replace', 'flag' or 'off')
+               "outlierWindow":21, #Number of recent ranges the outlier median/MAD is taken over
+               "outlierThreshold":3.0, #Ranges further than this many deviations from the median are outliers
+               "outlierMinDeviation":5.0, #Smallest deviation (cm) the outlier test uses, so the normal noise of a quiet link isn't rejected
+               "nlosWeighting":False, #Whether or not to weight ranges by their NLOS quality in the averages and fits
+               "nlosRangeStd":2.0, #Expected line of sight range noise in cm for the NLOS classifier
+               "pairTolerance":0.0, #Seconds between anchor and tag reports of the same exchange, e.g. 0.05 (0 to pair the newest reports instead)
+               "timingCorrection":False, #Whether or not to correct report times for each port's latency and jitter
+               "framePeriod":0.0, #Firmware range line period in s for the timing correction (0 to estimate it)
+               "angleCorrectionFile":"", #Range x angle correction table (.npz) from DW1000angle.py (leave empty to disable); inert until something calls DW1000.setOrientation, which nothing in this software does yet
+               "maxOrientationAge":1.0, #Seconds an orientation estimate (DW1000.setOrientation) is used for
+               "kalmanFilter":False, #Whether or not to smooth the scaled ranges with a Kalman filter before output
+               "kalmanProcessNoise":100.0, #Expected tag acceleration in cm/s^2 (higher follows movement faster)
+               "kalmanMeasurementNoise":2.0, #Expected range noise in cm (higher smooths more)
                "enableDebug":False} #Whether or not to enable debug mode
 plotInfoDict = {"makeGaussPlot":True, #whether or not to make the gaussian part of the average plot
                 "makeHistPlot":True, #whether or not to make the histogram part of the average plot
@@ -48,11 +81,19 @@ calInfoDict["numSteps"] = (calInfoDict["stopDist"] - calInfoDict["startDist"])/c
 
 anchorDict = {}
 tagDict = {}
+anchorWeightDict = {} #quality weights of the ranges in anchorDict (see DW1000quality.py)
+tagWeightDict = {}
 
 #anchorDist = {}
 #tagDist = {}
 
 DW1000 = DW1000test.DW1000test(testInfoDict=calInfoDict)
+DW1000.latency = DW1000latency.DW1000latencyRecorder(dumpFile=calInfoDict["latencyFile"],
+                                                     dumpInterval=calInfoDict["latencyDumpSeconds"])
+
+#Print the latency histograms on demand (kill -USR1 <pid>)
+if hasattr(signal,"SIGUSR1"):
+    signal.signal(signal.SIGUSR1,lambda signum,frame: print(DW1000.latency.report()))
 curDist = 0
 
 anchorResult = DW1000.deviceConnect("anchor")
@@ -88,7 +129,8 @@ while (len(DW1000.anchorRangeBuffer) < calInfoDict["numCalSamples"]):
 
 anchorAntDelayDec,tagAntDelayDec = DW1000.getAntDelay((calInfoDict["startDist"]/100),
                                                        DW1000.anchorRangeBuffer,
-                                                       DW1000.tagRangeBuffer)
+                                                       DW1000.tagRangeBuffer,
+                                                       DW1000.anchorWeightBuffer)
 
 calInfoDict["anchorAntDelayDec"] = anchorAntDelayDec
 calInfoDict["tagAntDelayDec"] = tagAntDelayDec
@@ -115,37 +157,62 @@ for curDist in range(calInfoDict["startDist"],
     
     anchorDict["{0} cm".format(curDist)] = list(DW1000.anchorRangeBuffer)
     tagDict["{0} cm".format(curDist)] = list(DW1000.tagRangeBuffer)
+    anchorWeightDict["{0} cm".format(curDist)] = list(DW1000.anchorWeightBuffer)
+    tagWeightDict["{0} cm".format(curDist)] = list(DW1000.tagWeightBuffer)
     DW1000.clearBuffers() #clear buffers for next loop
  
-anchorFitDict = DW1000.linearCurveFit(anchorDict.copy())
-tagFitDict = DW1000.linearCurveFit(tagDict.copy())
+anchorFitDict = DW1000.linearCurveFit(anchorDict.copy(),weightDict=anchorWeightDict)
+tagFitDict = DW1000.linearCurveFit(tagDict.copy(),weightDict=tagWeightDict)
 
 DW1000.testInfoDict["device"] = "anchor"
 
-DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy())
-DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy())
+DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
+DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
 
 if plotInfoDict["scaleData"] == True:
     plotInfoDict["scaleData"] = False
-    DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy())
-    DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy())
+    DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
+    DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
     plotInfoDict["scaleData"] = True
 
 DW1000.testInfoDict["device"] = "tag"
 
-DW1000.makeErrorPlotDist(tagDict.copy(),plotInfoDict.copy())
-DW1000.makeGaussianPlotDist(tagDict.copy(),plotInfoDict.copy())
+DW1000.makeErrorPlotDist(tagDict.copy(),plotInfoDict.copy(),weightDict=tagWeightDict)
+DW1000.makeGaussianPlotDist(tagDict.copy(),plotInfoDict.copy(),weightDict=tagWeightDict)
 
 if plotInfoDict["scaleData"] == True:
     plotInfoDict["scaleData"] = False
-    DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy())
-    DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy())
+    DW1000.makeErrorPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
+    DW1000.makeGaussianPlotDist(anchorDict.copy(),plotInfoDict.copy(),weightDict=anchorWeightDict)
     plotInfoDict["scaleData"] = True
 
+#Raw serial capture for replaying the session (see DW1000replay.py)
+if calInfoDict["rawCapturePrefix"]:
+    DW1000.startRawCapture(calInfoDict["rawCapturePrefix"],
+                           meta={"testInfoDict":calInfoDict,
+                                 "anchorFit":{"m":float(anchorFitDict["m"]),"b":float(anchorFitDict["b"])},
+                                 "tagFit":{"m":float(tagFitDict["m"]),"b":float(tagFitDict["b"])}})
+
+#Capture, calibrate, smooth and publish each sample to the outputs set in
+#calInfoDict (see DW1000pipeline.py)
+rangePipeline = DW1000pipeline.DW1000rangePipeline(DW1000,anchorFitDict,tagFitDict,calInfoDict)
+
+#Close any open output files
+def closeOutputs():
+    print(DW1000.serialStatsSummary())
+    print(DW1000.latency.report())
+    if calInfoDict["latencyFile"]:
+        DW1000.latency.dump(calInfoDict["latencyFile"])
+    rangePipeline.close()
+    DW1000.stopRawCapture()
+
+nextStatsTime = time.time() + calInfoDict["statsSeconds"]
+
 while True:
     try:
         if not (DW1000.distMeasLoop()):
             print("ERROR READING DISTANCES")
+            closeOutputs()
             sys.exit()
 
 #        anchorDist["N/A"] = DW1000.anchorRangeBuffer[-1]        
@@ -161,18 +228,15 @@ while True:
 #        print("Anchor distance: {0} cm".format(anchorDist["N/A"]))
 #        print("Tag distance: {0} cm".format(tagDist["N/A"]))
 
-        anchorDist = DW1000.anchorRangeBuffer[-1]
-        tagDist = DW1000.tagRangeBuffer[-1]
-        
-        anchorDist = DW1000.scaleLinearValue(anchorDist,
-                                             anchorFitDict["m"],
-                                             anchorFitDict["b"])
-        tagDist = DW1000.scaleLinearValue(tagDist,
-                                          tagFitDict["m"],
-                                          tagFitDict["b"])
+        sampleTime,anchorDist,tagDist = rangePipeline.process()
 
         print("Anchor distance: {0} cm".format(anchorDist))
         print("Tag distance: {0} cm".format(tagDist))
 
+        if (time.time() >= nextStatsTime):
+            nextStatsTime += calInfoDict["statsSeconds"]
+            print(DW1000.serialStatsSummary())
+
     except KeyboardInterrupt:
+        closeOutputs()
         sys.exit()
\ No newline at end of file
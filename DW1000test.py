@@ -19,33 +19,146 @@ AN:
 #==========================================================================
 import collections
 import csv
+import DW1000compress
+import DW1000filters
+import DW1000fusion
+import DW1000latency
+import DW1000manager
+import DW1000quality
 import DW1000serial
+import hashlib
 import inspect
 import sys
+import threading
+import time
+import warnings
 
 import math
-import matplotlib.pyplot as plt
 import numpy as np
 
-from scipy.stats import norm
-from scipy.optimize import curve_fit
 from serial.tools import list_ports
 from datetime import datetime
 
-plt.ioff()  #Don't show plots until plt.show() is called
+#==========================================================================
+# LAZY IMPORTS
+#==========================================================================
+#matplotlib and scipy take longer to import than everything else combined and
+#are only needed for plotting and curve fitting, so they are loaded on first
+#use; streaming and the GUI can start without them
+plt = None
+csvLimitSet = False
+
+#Import pyplot the first time a plot is made
+def loadPyplot():
+    global plt
+
+    if (plt == None):
+        import matplotlib.pyplot
+        plt = matplotlib.pyplot
+        plt.ioff()  #Don't show plots until plt.show() is called
+        plt.close("all")    #Close any existing plots
+
+    return plt
+
+#Raise the csv field size limit (data files store whole dictionaries in one
+#field) the first time a .csv file is read
+def setCsvFieldSizeLimit():
+    global csvLimitSet
+
+    if csvLimitSet:
+        return
+
+    maxInt = sys.maxsize
+    decrement = True
+
+    while decrement:
+        # decrease the maxInt value by factor 10 
+        # as long as the OverflowError occurs.
+        decrement = False
+        try:
+            csv.field_size_limit(maxInt)
+        except OverflowError:
+            maxInt = int(maxInt/10)
+            decrement = True
+
+    csvLimitSet = True
+
+#==========================================================================
+# CURVE FIT CACHE CLASS
+#==========================================================================
+#Least-recently-used cache of linearCurveFit results, keyed by a hash of the
+#distance data, the quality weights and the truncation settings. A single instance is shared by
+#every DW1000test object so that the plots and the live scaler always use
+#identical coefficients for the same data
+class DW1000fitCache(object):
+    #Object initialization
+    def __init__(self,maxSize=32):
+        self.maxSize = maxSize      #maximum number of fits to keep
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    #Hash the distance data, the weights (if any) and (if used) the truncation
+    #limits
+    def makeKey(self,distDict,plotInfoDict=None,weightDict=None):
+        digest = hashlib.blake2b(digest_size=16)
+
+        for actualDist in sorted(distDict.keys()):
+            digest.update(actualDist.encode("utf-8"))
+            digest.update(b"\x00")
+            digest.update(np.asarray(distDict[actualDist],dtype=np.float64).tobytes())
+            digest.update(b"\x00")
+
+            if (weightDict != None):
+                digest.update(b"w")
+                digest.update(np.asarray(weightDict[actualDist],dtype=np.float64).tobytes())
+                digest.update(b"\x00")
+
+        if (plotInfoDict != None) and (plotInfoDict["truncateData"] == True):
+            truncInfo = (plotInfoDict["minTruncDist"],plotInfoDict["maxTruncDist"])
+        else:
+            truncInfo = None
+
+        return (digest.hexdigest(),truncInfo)
+
+    def get(self,key):
+        with self.lock:
+            try: fitDict = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        return self.copyFit(fitDict)
+
+    def put(self,key,fitDict):
+        with self.lock:
+            self.entries[key] = self.copyFit(fitDict)
+            self.entries.move_to_end(key)
+
+            while (len(self.entries) > self.maxSize):
+                self.entries.popitem(last=False)
 
-maxInt = sys.maxsize
-decrement = True
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
 
-while decrement:
-    # decrease the maxInt value by factor 10 
-    # as long as the OverflowError occurs.
-    decrement = False
-    try:
-        csv.field_size_limit(maxInt)
-    except OverflowError:
-        maxInt = int(maxInt/10)
-        decrement = True
+    #Copy the mutable parts of a fit so callers can't alter cached entries
+    def copyFit(self,fitDict):
+        fitDict = dict(fitDict)
+        fitDict["nOpt"] = np.array(fitDict["nOpt"])
+        fitDict["nSigma"] = np.array(fitDict["nSigma"])
+        fitDict["actualDistVals"] = list(fitDict["actualDistVals"])
+        fitDict["refDistVals"] = list(fitDict["refDistVals"])
+
+        return fitDict
+
+fitCache = DW1000fitCache()
 
 #==========================================================================
 # CLASS
@@ -61,9 +174,6 @@ class DW1000test(object):
     speedOfLightCm = speedOfLight*100
     antDelayLSB = 1/(499.2e6*128) #LSB of antenna delay reg. value; about 15.65 ps
     maxAntDelaySec = antDelayLSB*2**16  #maximum antenna delay in seconds
-    
-    #Close any existing plots
-    plt.close("all")
 
     #Object initialization        
     def __init__(self,testInfoDict=None):    
@@ -84,6 +194,17 @@ class DW1000test(object):
                                  "tagBaud":115200, #baud rate for tag (add to GUI)
                                  "anchorAntDelayDec":32900, #anchor antenna delay in decimal
                                  "tagAntDelayDec":0, #tag antenna delay in decimal
+                                 "compressData":False, #Whether or not to save data as a compressed .rfz file
+                                 "pairName":"", #Name of the anchor/tag pair when testing several at once ("" for none)
+                                 "outlierMode":"off", #What to do with range outliers before they are buffered ('drop', 'replace', 'flag' or 'off')
+                                 "outlierWindow":21, #Number of recent ranges the outlier median/MAD is taken over
+                                 "outlierThreshold":3.0, #Ranges further than this many deviations from the median are outliers
+                                 "outlierMinDeviation":5.0, #Smallest deviation (cm) the outlier test uses, so the normal noise of a quiet link isn't rejected
+                                 "nlosWeighting":False, #Whether or not to weight ranges by their NLOS quality in the averages and fits
+                                 "nlosRangeStd":2.0, #Expected line of sight range noise in cm for the NLOS classifier
+                                 "pairTolerance":0.0, #Seconds between anchor and tag reports of the same exchange, e.g. 0.05 (0 to pair the newest reports instead)
+                                 "timingCorrection":False, #Whether or not to correct report times for each port's latency and jitter
+                                 "framePeriod":0.0, #Firmware range line period in s for the timing correction (0 to estimate it)
                                  "enableDebug":False} #Whether or not to enable debug mode
             #Only here as an example of what keys are available
             self.plotInfoDict = {"makeGaussPlot":True, #whether or not to make the gaussian part of the average plot
@@ -103,16 +224,83 @@ class DW1000test(object):
             self.testInfoDict = testInfoDict #use values from external source (most likely GUI)
 
         #Various strings
-        self.remainTimeStr = "N/A"  #String for how much time is left in a test loop
+        self.remainMillis = None    #How much time is left in a test loop in ms (see remainTimeStr)
+        self.loopTimeSum = 0.0      #Running sum of loopTimeBuffer so the average is O(1)
         
         #Buffers
         self.anchorRangeBuffer = collections.deque(maxlen=self.testInfoDict["numSamples"])
         self.tagRangeBuffer = collections.deque(maxlen=self.testInfoDict["numSamples"])
         self.loopTimeBuffer = collections.deque(maxlen=self.testInfoDict["numSamples"])  
+        self.anchorRxPowerBuffer = collections.deque(maxlen=self.testInfoDict["numSamples"])
+        self.tagRxPowerBuffer = collections.deque(maxlen=self.testInfoDict["numSamples"])
+        self.anchorWeightBuffer = collections.deque(maxlen=self.testInfoDict["numSamples"])   #quality weight of each
+        self.tagWeightBuffer = collections.deque(maxlen=self.testInfoDict["numSamples"])      #range (1 without weighting)
+
+        #Functions called with a sample dictionary after every distMeasLoop
+        #(e.g. live plots); keep them quick, they run in the acquisition loop
+        self.sampleListeners = []
+        self.lastSampleTime = None  #time.time() clock time of the last distMeasLoop sample (when its
+                                    #line left the anchor with timingCorrection, otherwise when it arrived)
+
+        #Outlier filter the raw ranges go through before they reach the buffers
+        #(anything with the DW1000filters update() interface; None for none)
+        self.outlierFilter = None
+
+        if (self.testInfoDict.get("outlierMode","off") != "off"):
+            self.outlierFilter = DW1000filters.DW1000hampelFilter(numLinks=2,
+                                                                  windowSize=self.testInfoDict.get("outlierWindow",21),
+                                                                  threshold=self.testInfoDict.get("outlierThreshold",3.0),
+                                                                  minDeviation=self.testInfoDict.get("outlierMinDeviation",5.0),
+                                                                  mode=self.testInfoDict["outlierMode"])
+
+        #NLOS classifier giving every range a quality weight for the averages
+        #and fits (see DW1000quality.py; None to weight every range the same)
+        self.qualityClassifier = None
+
+        if self.testInfoDict.get("nlosWeighting",False):
+            self.qualityClassifier = DW1000quality.DW1000nlosClassifier(numLinks=2,
+                                                                        rangeStd=self.testInfoDict.get("nlosRangeStd",2.0))
+
+        #Pairs the anchor and tag reports of the same exchange by arrival time
+        #and peer address and fuses their ranges (see DW1000fusion.py); None
+        #pairs the newest report of each device instead
+        self.sampleFusion = None
+        self.pairQueueSize = 4      #pairs kept for distMeasLoop; older ones are dropped so a slow
+                                    #caller gets recent pairs rather than a growing backlog
+        self.pairQueue = collections.deque()    #pairs made but not handed out yet
+        self.pairsDropped = 0       #pairs dropped from a full pairQueue
+
+        if (self.testInfoDict.get("pairTolerance",0) > 0):
+            rangeStd = self.testInfoDict.get("nlosRangeStd",2.0)
+            self.sampleFusion = DW1000fusion.DW1000sampleFusion(tolerance=self.testInfoDict["pairTolerance"],
+                                                                rangeStds=(rangeStd,rangeStd))
+
+        #Range x angle correction applied to scaled ranges whenever an
+        #orientation estimate is available (see DW1000angle.py)
+        self.angleCorrection = None
+        self.orientation = None         #latest tag/anchor antenna angle in degrees (see setOrientation)
+        self.orientationTime = None     #perf_counter time the orientation was set
+        self.maxOrientationAge = self.testInfoDict.get("maxOrientationAge",1.0)   #seconds an orientation stays usable
+
+        if self.testInfoDict.get("angleCorrectionFile",""):
+            import DW1000angle
+
+            self.angleCorrection = DW1000angle.DW1000angleCorrection.load(self.testInfoDict["angleCorrectionFile"])
+
+        #Per-stage latency histograms for every sample (see DW1000latency.py);
+        #callers can stamp later stages (calibration, publishing) themselves
+        self.latency = DW1000latency.DW1000latencyRecorder()
+        self.liveTiming = True      #False when the receive times come from a recording (see
+                                    #DW1000replay.py), so the read and parse stages can't be timed
     
         #Timing-related
         self.startDelay = 5 #How long to wait after pressing enter to start the calibration
 
+        #File-related
+        self.rangeResolution = 0.01 #quantization step for compressed range data in cm
+        self.loopTimeResolution = 0.001 #quantization step for compressed loop times in ms
+        self.compressMethod = "zlib" #compression for .rfz files ('zlib' or 'lzma')
+
         #Plot-related
         self.figRes = [19.20,10.80]   #figure resolution (relative)
         self.histBinWidth = 1   #width of the histogram bins
@@ -129,6 +317,24 @@ class DW1000test(object):
         
         self.anchor = DW1000serial.DW1000()
         self.tag = DW1000serial.DW1000()
+
+        #Devices by role, with the port and baud rate to connect them on
+        self.devices = {"anchor":self.anchor,
+                        "tag":self.tag}
+        self.devicePorts = {"anchor":(self.anchorPort,self.anchorBaud),
+                            "tag":(self.tagPort,self.tagBaud)}
+
+        #Shared by both devices so that cancel() stops whichever one is being read
+        self.cancelEvent = threading.Event()
+        self.anchor.cancelEvent = self.cancelEvent
+        self.tag.cancelEvent = self.cancelEvent
+
+        #Reads every connected device from one event loop (see DW1000manager.py)
+        #(with timingCorrection, samples are also given the time they left
+        #the device; see DW1000timing.py)
+        self.manager = DW1000manager.DW1000manager(cancelEvent=self.cancelEvent,
+                                                   timingCorrection=self.testInfoDict.get("timingCorrection",False),
+                                                   framePeriod=self.testInfoDict.get("framePeriod",0) or None)
         
         self.anchor.enableDebugPrint(self.testInfoDict["enableDebug"])
         self.tag.enableDebugPrint(self.testInfoDict["enableDebug"])
@@ -138,46 +344,95 @@ class DW1000test(object):
     #==========================================================================
     # DEVICE FUNCTIONS
     #==========================================================================
-    #Connect to either the 'anchor' or 'tag'
+    #Connect to either the 'anchor' or 'tag'; returns True, or the port that
+    #couldn't be connected to
     def deviceConnect(self,device):        
-        if device == "anchor":
-            try: self.anchor.ser
-            except:
-                if not self.anchor.connectToDUT(selPort=self.anchorPort,
-                                                baudrate=self.anchorBaud):
-                    return self.anchorPort            
-
-            if not self.anchor.ser.isOpen():
-                self.anchor.openDW1000port()
-
-        elif device == "tag":
-            try: self.tag.ser
-            except:
-                if not self.tag.connectToDUT(selPort=self.tagPort,
-                                             baudrate=self.tagBaud):
-                    return self.tagPort
-            
-    
-            if not self.tag.ser.isOpen():
-                self.tag.openDW1000port()
+        dev = self.devices[device]
+        port,baudrate = self.devicePorts[device]
+
+        try: dev.ser
+        except:
+            if not dev.connectToDUT(selPort=port,
+                                    baudrate=baudrate):
+                return port
+
+        if not dev.ser.isOpen():
+            dev.openDW1000port()
+
+        self.manager.addDevice(dev,name=device,role=device)
         
         return True
     
+    #One-line receive statistics for both devices (see DW1000serial.getStats)
+    def serialStatsSummary(self):
+        summary = "Anchor: {0} | Tag: {1}".format(self.anchor.statsSummary(),
+                                                  self.tag.statsSummary())
+
+        if (self.outlierFilter != None):
+            summary += " | Outliers: anchor {0}, tag {1}".format(*self.outlierFilter.rejected)
+
+        if (self.qualityClassifier != None):
+            summary += " | NLOS: anchor {0}, tag {1}".format(*self.qualityClassifier.nlosCount)
+
+        for name,timing in self.manager.timing.items():
+            if timing.ready():
+                stats = timing.getStats()
+                summary += " | {0} latency: {1:.1f} +/- {2:.1f} ms".format(name.capitalize(),
+                                                                         stats["latency"]*1e3,
+                                                                         stats["jitter"]*1e3)
+
+        if (self.sampleFusion != None):
+            summary += " | Unmatched: anchor {0}, tag {1} | Pairs dropped: {2}".format(self.sampleFusion.unmatched["anchor"],
+                                                                                       self.sampleFusion.unmatched["tag"],
+                                                                                       self.pairsDropped)
+
+        return summary
+
+    #Record every byte both devices receive to <prefix>_anchor.dwraw and
+    #<prefix>_tag.dwraw for DW1000replay.py, with any metadata (anything JSON
+    #can store) in their headers
+    def startRawCapture(self,prefix,meta=None):
+        import DW1000replay
+
+        for role,device in self.devices.items():
+            port,baudrate = self.devicePorts[role]
+
+            #The timing correction goes by the baud rate of the open port (see
+            #DW1000manager.handleLine), so that is the one the replay needs
+            if getattr(device,"ser",None):
+                baudrate = getattr(device.ser,"baudrate",None)
+
+            device.recorder = DW1000replay.DW1000rawRecorder("{0}_{1}.dwraw".format(prefix,role),
+                                                             role=role,
+                                                             port=port,
+                                                             baudrate=baudrate,
+                                                             meta=meta)
+
+    def stopRawCapture(self):
+        for device in self.devices.values():
+            if (device.recorder != None):
+                device.recorder.close()
+                device.recorder = None
+
+    #Stop the test loops (and any device query in progress) within one serial
+    #poll interval; safe to call from any thread
+    def cancel(self):
+        self.cancelEvent.set()
+
+    #Allow the test loops to run again after cancel()
+    def resetCancel(self):
+        self.cancelEvent.clear()
+
     #Disconnect from either the 'anchor' or 'tag'
     def deviceDisconnect(self,device):
-        if device == "anchor":
-            try: self.anchor.ser
-            except: return True
+        dev = self.devices[device]
+        self.manager.removeDevice(device)
 
-            if self.anchor.ser.isOpen():
-                self.anchor.closeDW1000port()
+        try: dev.ser
+        except: return True
 
-        if device == "tag":
-            try: self.tag.ser
-            except: return True
-
-            if self.tag.ser.isOpen():
-                self.tag.closeDW1000port()
+        if dev.ser.isOpen():
+            dev.closeDW1000port()
         
         return True
 
@@ -186,35 +441,160 @@ class DW1000test(object):
     #==========================================================================
     #Distance measurement loop
     def distMeasLoop(self):        
-        startTime = datetime.now()
-        
-        anchorRange = self.anchor.getRangeCentimeters()
-        tagRange = self.tag.getRangeCentimeters()
-
-        if (anchorRange == None) or (tagRange == None):
-            self.deviceDisconnect("anchor")
-            self.deviceDisconnect("tag")
+        if self.cancelEvent.is_set():
             return None
+
+        startTime = time.perf_counter_ns()
         
+        #Next anchor/tag pair (see nextPair); both devices are read together,
+        #so neither waits on the other. Pairs with a dropped outlier are skipped
+        while True:
+            samples = self.nextPair(self.anchor.readTimeout)
+
+            if (samples == None):
+                self.deviceDisconnect("anchor")
+                self.deviceDisconnect("tag")
+                return None
+            
+            anchorSample = samples["anchor"]
+            tagSample = samples["tag"]
+            anchorRange = anchorSample["range"]
+            tagRange = tagSample["range"]
+
+            if (self.outlierFilter == None):
+                break
+
+            anchorRange,tagRange = self.outlierFilter.update((anchorRange,tagRange),anchorSample["time"])
+
+            if (anchorRange == anchorRange) and (tagRange == tagRange): #neither is NaN
+                break
+
+        anchorRxPower = anchorSample["rxPower"]
+        tagRxPower = tagSample["rxPower"]
+        self.lastSampleTime = anchorSample.get("correctedTime",anchorSample["time"])
+
+        #A sample starts when the first of its lines was read; each line's
+        #read to parse time is its own device's
+        if self.liveTiming:
+            self.latency.beginSample(min(anchorSample["readNs"],tagSample["readNs"]))
+            self.latency.record("anchorParse",anchorSample["parsedNs"] - anchorSample["readNs"])
+            self.latency.record("tagParse",tagSample["parsedNs"] - tagSample["readNs"])
+            self.latency.stamp("paired",max(anchorSample["parsedNs"],tagSample["parsedNs"]))
+        else:
+            self.latency.beginSample(startTime)
+
         self.anchorRangeBuffer.append(anchorRange)
         self.tagRangeBuffer.append(tagRange)
+        self.anchorRxPowerBuffer.append(anchorRxPower)
+        self.tagRxPowerBuffer.append(tagRxPower)
+
+        if (self.qualityClassifier == None):
+            anchorWeight = tagWeight = 1.0
+        else:
+            anchorWeight,tagWeight = self.qualityClassifier.update((anchorRange,tagRange),
+                                                                   (anchorRxPower,tagRxPower))
+
+        self.anchorWeightBuffer.append(anchorWeight)
+        self.tagWeightBuffer.append(tagWeight)
+
+        self.latency.stamp("buffered")
+
+        if self.sampleListeners:
+            sample = {"anchorRange":anchorRange,
+                      "tagRange":tagRange,
+                      "anchorRxPower":anchorRxPower,
+                      "tagRxPower":tagRxPower,
+                      "anchorWeight":anchorWeight,
+                      "tagWeight":tagWeight,
+                      "time":self.lastSampleTime}
+
+            if (self.outlierFilter != None):
+                sample["anchorOutlier"],sample["tagOutlier"] = self.outlierFilter.lastOutliers
+
+            if (self.sampleFusion != None):
+                sample["fusedRange"],sample["fusedVariance"] = self.sampleFusion.fuse((anchorRange,tagRange),
+                                                                                      self.sampleFusion.weightedVariances((anchorWeight,tagWeight)))
+
+            for listener in self.sampleListeners:
+                listener(sample)
+
+            self.latency.stamp("listeners")
+
+        elapsedNs = time.perf_counter_ns() - startTime
+        self.latency.record("loop",elapsedNs)
+        elapsedTime = elapsedNs/1e6   #total milliseconds
+
+        #Keep the running sum in step with the bounded buffer
+        if (len(self.loopTimeBuffer) == self.loopTimeBuffer.maxlen):
+            self.loopTimeSum -= self.loopTimeBuffer[0]
 
-        elapsedTime = (datetime.now()-startTime).total_seconds()*1000   #total milliseconds
         self.loopTimeBuffer.append(elapsedTime)
-        avgLoopTime = np.average(self.loopTimeBuffer)
-        remainMillis = (self.testInfoDict["numSamples"] - len(self.anchorRangeBuffer))*avgLoopTime
-        
+        self.loopTimeSum += elapsedTime
+        avgLoopTime = self.loopTimeSum/len(self.loopTimeBuffer)
+        self.remainMillis = (self.testInfoDict["numSamples"] - len(self.anchorRangeBuffer))*avgLoopTime
+
+        return True
+
+    #Next anchor and tag samples as a dictionary (same as
+    #DW1000manager.nextSamples); with sample fusion these are reports of the
+    #same exchange (the oldest of the last pairQueueSize made), otherwise the
+    #newest of each. Returns None on timeout or cancel
+    def nextPair(self,timeout):
+        if (self.sampleFusion == None):
+            return self.manager.nextSamples(("anchor","tag"),timeout=timeout)
+
+        deadline = time.perf_counter() + timeout
+
+        while not self.pairQueue:
+            #Both devices' new reports, in the order they arrived (readNs is
+            #what raw captures record, so replays pair the same way)
+            reports = ([("anchor",sample) for sample in self.manager.takeSamples("anchor")]
+                       + [("tag",sample) for sample in self.manager.takeSamples("tag")])
+            reports.sort(key=lambda report: report[1].get("correctedNs",report[1]["readNs"]))
+
+            for role,sample in reports:
+                pair = self.sampleFusion.addReport(role,sample,sample.get("correctedNs",sample["readNs"])/1e9)
+
+                if (pair != None):
+                    if (len(self.pairQueue) >= self.pairQueueSize):
+                        self.pairQueue.popleft()
+                        self.pairsDropped += 1
+
+                    self.pairQueue.append({"anchor":pair[0],"tag":pair[1]})
+
+            if self.pairQueue:
+                break
+
+            remaining = deadline - time.perf_counter()
+
+            if self.cancelEvent.is_set():
+                return None
+
+            if (remaining <= 0):
+                for role,pending in self.sampleFusion.pending.items():
+                    if not pending:
+                        self.devices[role].counters["timeouts"] += 1
+                return None
+
+            self.manager.poll(min(remaining,self.manager.pollInterval))
+
+        return self.pairQueue.popleft()
+
+    #String for how much time is left in a test loop; only formatted when asked for
+    @property
+    def remainTimeStr(self):
+        if (self.remainMillis == None):
+            return "N/A"
+
         (hours,
          minutes,
          seconds,
-         millis) = self.convertTime(remainMillis)
-        
-        self.remainTimeStr = "{0}:{1}:{2}.{3}".format(format(hours,"02"),
-                                                      format(minutes,"02"),
-                                                      format(seconds,"02"),
-                                                      format(millis,"03"))
+         millis) = self.convertTime(self.remainMillis)
         
-        return True
+        return "{0}:{1}:{2}.{3}".format(format(hours,"02"),
+                                        format(minutes,"02"),
+                                        format(seconds,"02"),
+                                        format(millis,"03"))
 
     #Antenna delay calibration loop (for anchor; keep tag antenna delay at zero)
     def antDelayCalLoop(self,initAnchorDelay,calSamples=None):
@@ -244,7 +624,7 @@ class DW1000test(object):
                 self.clearBuffers()
                 return None
             
-        distAvg = np.average(self.anchorRangeBuffer)
+        distAvg = np.average(self.anchorRangeBuffer,weights=self.anchorWeightBuffer)
         self.clearBuffers()
             
         print("distAvg: {0}".format(distAvg))
@@ -291,7 +671,7 @@ class DW1000test(object):
                     self.clearBuffers()
                     return None
             
-            distAvg = np.average(self.anchorRangeBuffer)
+            distAvg = np.average(self.anchorRangeBuffer,weights=self.anchorWeightBuffer)
             print("distAvg: {0}".format(distAvg))
             self.clearBuffers()
             
@@ -300,10 +680,14 @@ class DW1000test(object):
     #==========================================================================
     # PLOTTING FUNCTIONS
     #==========================================================================
-    #Create a plot showing the difference between average calculated distance and actual distance
+    #Create a plot showing the difference between average calculated distance and actual distance;
+    #with weightDict (see linearCurveFit) the averages and the fit are weighted the same way as
+    #the fit used to scale live ranges
     def makeErrorPlotDist(self,
                           distDict,
-                          plotInfoDict):
+                          plotInfoDict,
+                          weightDict=None):
+        plt = loadPyplot()
 
         xVals = []
         yVals = []
@@ -318,7 +702,7 @@ class DW1000test(object):
                                          plotInfoDict)
 
         if (plotInfoDict["makeRefPlot"] == True):
-            curveFitDict = self.linearCurveFit(distDict)
+            curveFitDict = self.linearCurveFit(distDict,plotInfoDict,weightDict)
 
         if ((plotInfoDict["scaleData"] == True) and
             (plotInfoDict["makeRefPlot"] == True)):
@@ -328,7 +712,7 @@ class DW1000test(object):
        
         for actualDist,measDist in distDict.items():
             actualDistanceInt = int(actualDist.split(" cm")[0])
-            measDistAvg = (np.average(measDist))
+            measDistAvg = (np.average(measDist,weights=None if (weightDict == None) else weightDict[actualDist]))
     
             xVals.append(actualDistanceInt) 
             yVals.append(measDistAvg)
@@ -451,17 +835,25 @@ class DW1000test(object):
         
         a = datetime.now()
         if plotInfoDict["scaleData"]:
-            plt.savefig("Distance error plot (scaled) - {0} - {1}".format(self.testInfoDict["device"],
-                                                                          a.strftime("(%Y-%m-%d_%H-%M-%S)")))
+            fileName = "Distance error plot (scaled) - {0} - {1}".format(self.deviceLabel(),
+                                                                         a.strftime("(%Y-%m-%d_%H-%M-%S)"))
         else:
-            plt.savefig("Distance error plot - {0} - {1}".format(self.testInfoDict["device"],
-                                                                 a.strftime("(%Y-%m-%d_%H-%M-%S)")))
+            fileName = "Distance error plot - {0} - {1}".format(self.deviceLabel(),
+                                                                a.strftime("(%Y-%m-%d_%H-%M-%S)"))
+
+        plt.savefig(fileName)
 
-    #Make a Gaussian plot of calculated vs. actual distance
+        return fileName
+
+    #Make a Gaussian plot of calculated vs. actual distance; weightDict (see
+    #linearCurveFit) weights the curve fit only, the distributions are of the
+    #readings as they are
     def makeGaussianPlotDist(self,
                              distDict,
                              plotInfoDict,
-                             histBinWidth = None):
+                             histBinWidth = None,
+                             weightDict = None):
+        plt = loadPyplot()
         
         if (histBinWidth == None):
             histBinWidth = self.histBinWidth
@@ -478,7 +870,7 @@ class DW1000test(object):
                                           plotInfoDict)
 
         if (plotInfoDict["makeRefPlot"] == True):
-            curveFitDict = self.linearCurveFit(distDict)
+            curveFitDict = self.linearCurveFit(distDict,plotInfoDict,weightDict)
             
         if ((plotInfoDict["scaleData"] == True) and
             (plotInfoDict["makeRefPlot"] == True)):
@@ -547,46 +939,37 @@ class DW1000test(object):
         plt.xticks(major_xticks)
         plt.yticks(major_yticks)
         
-        statColorsIndex = 0
+        steps = list(range(self.testInfoDict["startDist"],self.testInfoDict["stopDist"]+self.testInfoDict["stepDist"],self.testInfoDict["stepDist"]))
+
+        #Statistics, scaled PDFs and histograms for every step in one pass
+        stepStats = self.gaussianStepStats([distDict["{0} cm".format(step)] for step in steps],
+                                           histBinWidth,
+                                           self.testInfoDict["stepDist"]-1)
 
-        for step in range(self.testInfoDict["startDist"],self.testInfoDict["stopDist"]+self.testInfoDict["stepDist"],self.testInfoDict["stepDist"]):
-            distMu, distSigma = norm.fit(sorted(distDict["{0} cm".format(step)]))
+        for stepIndex,step in enumerate(steps):
+            distMu = stepStats["mu"][stepIndex]
+            distSigma = stepStats["sigma"][stepIndex]
+            numSamples = stepStats["lengths"][stepIndex]
             
             yVals.append(distMu)
             
             if not distSigma == 0:
-                distGauss = norm.pdf(np.asarray(sorted(distDict["{0} cm".format(step)])),round(distMu,2),round(distSigma,2))
-                distGaussScaled = [(distGauss[index]/np.max(distGauss))*(self.testInfoDict["stepDist"]-1) for index in range(0,len(distGauss))]  #Scale to the distance axis
-        
-                if statColorsIndex == 4:
-                    statColorsIndex = 0
-               
                 if plotInfoDict["makeGaussPlot"] == True:
-                    plt.plot(np.asarray(distGaussScaled)+step,sorted(distDict["{0} cm".format(step)]),
-                             #color=statColors[statColorsIndex],
+                    plt.plot(stepStats["gaussScaled"][stepIndex,:numSamples]+step,
+                             stepStats["sortedVals"][stepIndex,:numSamples],
                              linewidth = 3,
                              label = "$\mu$ = {0} cm\n$\sigma$ = {1} cm".format(round(distMu,2),round(distSigma,2)))
                     
-                if plotInfoDict["makeHistPlot"] == True:
+                numBins = stepStats["numBins"][stepIndex]
+
+                if (plotInfoDict["makeHistPlot"] == True) and (numBins > 0):
                     #Plot the histogram to compare the Gaussian distribution to
-                    distHist, distBinEdges = np.histogram(distDict["{0} cm".format(step)],
-                                                                          bins=np.arange(np.min(distDict["{0} cm".format(step)]),
-                                                                                         np.max(distDict["{0} cm".format(step)]), 
-                                                                                         histBinWidth))
-    
-                    distHistScaled = np.asarray([(float(distHist[index])/np.max(distHist))*(self.testInfoDict["stepDist"]-1) for index in range(0,len(distHist))])
-                
-                    plt.barh(distBinEdges[:-1],
-                             distHistScaled,
+                    plt.barh(stepStats["binEdges"][stepIndex,:numBins],
+                             stepStats["histScaled"][stepIndex,:numBins],
                              histBinWidth,
                              left=step,
                              edgecolor='k',
-                             #color=statColors[statColorsIndex],
                              alpha=0.5)
-            else:
-                distMu, distSigma = 0,0
-                          
-            statColorsIndex += 1
 
         #highlight the axes
         plt.axhline(0, color = 'k')
@@ -638,19 +1021,114 @@ class DW1000test(object):
         
         a = datetime.now()
         if plotInfoDict["scaleData"]:
-            plt.savefig("Distance gaussian plot (scaled) - {0} - {1}".format(self.testInfoDict["device"],
-                                                                             a.strftime("(%Y-%m-%d_%H-%M-%S)")))
+            fileName = "Distance gaussian plot (scaled) - {0} - {1}".format(self.deviceLabel(),
+                                                                            a.strftime("(%Y-%m-%d_%H-%M-%S)"))
         else:
-            plt.savefig("Distance gaussian plot - {0} - {1}".format(self.testInfoDict["device"],
-                                                                    a.strftime("(%Y-%m-%d_%H-%M-%S)")))
-            
-    #Curve fit the data to 
-    def linearCurveFit(self,distDict):
+            fileName = "Distance gaussian plot - {0} - {1}".format(self.deviceLabel(),
+                                                                   a.strftime("(%Y-%m-%d_%H-%M-%S)"))
+
+        plt.savefig(fileName)
+
+        return fileName
+
+    #Compute the Gaussian fit, scaled PDF and scaled histogram of every step at
+    #once. The steps are packed into a NaN-padded 2-D array (one row per step)
+    #so that sorting, the fit, the PDF and the histogram are each a single
+    #vectorized operation. Returns a dictionary of per-step arrays; only the
+    #first lengths[i] entries (or numBins[i] for histograms) of row i are valid
+    def gaussianStepStats(self,stepVals,histBinWidth,scaleHeight):
+        lengths = np.array([len(vals) for vals in stepVals],dtype=np.intp)
+        numSteps = len(stepVals)
+        maxLen = max(lengths.max(),1) if numSteps else 1
+
+        padded = np.full((numSteps,maxLen),np.nan)
+        for stepIndex,vals in enumerate(stepVals):
+            padded[stepIndex,:lengths[stepIndex]] = np.asarray(vals,dtype=np.float64)
+
+        sortedVals = np.sort(padded,axis=1)    #NaN padding sorts to the end
+        valid = ~np.isnan(sortedVals)
+
+        #Steps with a single value or zero spread produce NaN rows; they are
+        #skipped when plotting, so the warnings aren't useful
+        with warnings.catch_warnings(), np.errstate(invalid="ignore",divide="ignore"):
+            warnings.simplefilter("ignore",RuntimeWarning)
+
+            #Maximum likelihood Gaussian fit (same as scipy.stats.norm.fit)
+            mu = np.nanmean(padded,axis=1)
+            sigma = np.nanstd(padded,axis=1)
+
+            #PDF evaluated with the rounded parameters shown in the legend
+            muRound = np.round(mu,2)[:,None]
+            sigmaRound = np.round(sigma,2)[:,None]
+            gauss = np.exp(-0.5*((sortedVals-muRound)/sigmaRound)**2)/(np.sqrt(2*np.pi)*sigmaRound)
+            gaussScaled = gauss/np.nanmax(np.where(valid,gauss,np.nan),axis=1,keepdims=True)*scaleHeight
+
+            #Histogram with bins of histBinWidth starting at each step's minimum
+            #(equivalent to np.histogram(vals,bins=np.arange(min,max,width)))
+            rowMin = sortedVals[:,0]
+            rowMax = np.nanmax(sortedVals,axis=1)
+            numEdges = np.ceil((rowMax-rowMin)/histBinWidth)
+            numEdges = np.nan_to_num(numEdges).astype(np.intp)
+            numBins = np.maximum(numEdges-1,0)
+            maxBins = max(numBins.max(),1) if numSteps else 1
+
+            #Edges are built the way np.arange builds them so that values
+            #sitting exactly on an edge land in the same bin
+            edgeStep = ((rowMin+histBinWidth)-rowMin)[:,None]
+            binIndex = np.nan_to_num(np.floor((sortedVals-rowMin[:,None])/edgeStep))
+            binIndex -= (sortedVals < rowMin[:,None] + binIndex*edgeStep)
+            binIndex += (sortedVals >= rowMin[:,None] + (binIndex+1)*edgeStep)
+
+            lastEdge = rowMin[:,None] + (numEdges-1)[:,None]*edgeStep
+            inRange = valid & (sortedVals <= lastEdge) & (numBins[:,None] > 0)
+            binIndex = np.clip(binIndex,0,np.maximum(numBins-1,0)[:,None]).astype(np.intp)
+
+            flatIndex = (np.arange(numSteps)[:,None]*maxBins + binIndex)[inRange]
+            hist = np.bincount(flatIndex,minlength=numSteps*maxBins).reshape(numSteps,maxBins).astype(np.float64)
+            histScaled = hist/hist.max(axis=1,keepdims=True)*scaleHeight
+
+        binEdges = rowMin[:,None] + np.arange(maxBins)*edgeStep
+
+        return {"lengths":lengths,
+                "sortedVals":sortedVals,
+                "mu":mu,
+                "sigma":sigma,
+                "gaussScaled":gaussScaled,
+                "numBins":numBins,
+                "binEdges":binEdges,
+                "histScaled":histScaled}
+
+    #Curve fit the data to a line; results are cached (see DW1000fitCache),
+    #so pass plotInfoDict when the data has been truncated. weightDict holds
+    #the quality weight of every range in distDict (see DW1000quality.py)
+    def linearCurveFit(self,distDict,plotInfoDict=None,weightDict=None):
+        cacheKey = fitCache.makeKey(distDict,plotInfoDict,weightDict)
+        curveFitDict = fitCache.get(cacheKey)
+
+        if (curveFitDict != None):
+            return curveFitDict
+
+        curveFitDict = self.linearCurveFitUncached(distDict,weightDict)
+        fitCache.put(cacheKey,curveFitDict)
+
+        return curveFitDict
+
+    #Curve fit the data to a line without using the cache; with weights each
+    #distance's average is weighted, and distances count in the fit by their
+    #total weight
+    def linearCurveFitUncached(self,distDict,weightDict=None):
+        from scipy.optimize import curve_fit
+
         xVals = []
         yVals = []
+        sigmas = None if (weightDict == None) else []
         
         for actualDist,measDist in distDict.items():
-            measDistAvg = np.average(measDist)
+            if (weightDict == None):
+                measDistAvg = np.average(measDist)
+            else:
+                measDistAvg = np.average(measDist,weights=weightDict[actualDist])
+                sigmas.append(1/np.sqrt(np.sum(weightDict[actualDist])))
             actualDistVal = int(actualDist.split(" cm")[0])
             if (actualDistVal == 0):
                 xVals.append(actualDistVal+0.1)
@@ -658,7 +1136,7 @@ class DW1000test(object):
                 xVals.append(actualDistVal)
             yVals.append(measDistAvg)
             
-        nOpt,nCov = curve_fit(lambda x,m,b: (m*x+b), xVals, yVals)
+        nOpt,nCov = curve_fit(lambda x,m,b: (m*x+b), xVals, yVals, sigma=sigmas)
         nSigma = np.sqrt(np.diag(nCov))
         
         m = nOpt[0]
@@ -685,12 +1163,26 @@ class DW1000test(object):
     #==========================================================================
     # SUPPORTING FUNCTIONS
     #==========================================================================
+    #Device name used in output file names; prefixed with the pair name when
+    #several anchor/tag pairs are tested at once so their files don't collide
+    def deviceLabel(self):
+        pairName = self.testInfoDict.get("pairName","")
+
+        if pairName:
+            return "{0}_{1}".format(pairName,self.testInfoDict["device"])
+
+        return self.testInfoDict["device"]
+
     #Write relevant data to file
     def fileWrite(self,
                   distDict,
                   loopTimeDict):
+        if self.testInfoDict.get("compressData",False):
+            return self.fileWriteCompressed(distDict,
+                                            loopTimeDict)
+
         Data_OP_Time = datetime.now()
-        Data_OP = open(('DW1000_{0}_{1}_data_Output_{2}.csv'.format(self.testInfoDict["device"],
+        Data_OP = open(('DW1000_{0}_{1}_data_Output_{2}.csv'.format(self.deviceLabel(),
                                                                    self.testInfoDict["testType"],
                                                                    Data_OP_Time.strftime('(%Y-%m-%d_%H-%M-%S)'))),'w')
         
@@ -706,13 +1198,43 @@ class DW1000test(object):
             
         Data_OP.close()
 
+    #Write relevant data to a compressed (quantized, delta-encoded) session file
+    def fileWriteCompressed(self,
+                            distDict,
+                            loopTimeDict):
+        Data_OP_Time = datetime.now()
+        fileName = 'DW1000_{0}_{1}_data_Output_{2}.rfz'.format(self.deviceLabel(),
+                                                              self.testInfoDict["testType"],
+                                                              Data_OP_Time.strftime('(%Y-%m-%d_%H-%M-%S)'))
+
+        with DW1000compress.DW1000sessionWriter(fileName,
+                                                resolution=self.rangeResolution,
+                                                method=self.compressMethod) as writer:
+            writer.writeMeta("testInfoDict",self.testInfoDict)
+            writer.writeMeta("distKeys",list(distDict.keys()))
+            writer.writeMeta("loopTimeKeys",list(loopTimeDict.keys()))
+
+            for key,values in distDict.items():
+                writer.writeColumn("distDict/{0}".format(key),values)
+
+            for key,values in loopTimeDict.items():
+                writer.writeColumn("loopTimeDict/{0}".format(key),values,
+                                   resolution=self.loopTimeResolution)
+
+        return fileName
+
     def fileRead(self,filename):
         extension = filename.split(".")[-1]
+
+        if (extension == "rfz"):
+            return self.fileReadCompressed(filename)
        
         if not (extension == "csv"):
-            self.debugPrint("Incorrect file type selected; expected .csv")
+            self.debugPrint("Incorrect file type selected; expected .csv or .rfz")
             return None
         
+        setCsvFieldSizeLimit()
+
         Data_IP = open(filename,'r')    
         Data_IP_Read = csv.reader(Data_IP, dialect = 'excel', lineterminator = '\n')
         
@@ -726,12 +1248,39 @@ class DW1000test(object):
         
         return valueDict
 
+    #Read a compressed session file; unlike fileRead on a .csv file, the values
+    #in the returned dictionary are already Python objects (not strings)
+    def fileReadCompressed(self,filename):
+        try:
+            reader = DW1000compress.DW1000sessionReader(filename)
+        except Exception as exception:
+            self.debugPrint("Could not read compressed file: {0}".format(exception))
+            return None
+
+        with reader:
+            try:
+                valueDict = {"testInfoDict":reader.readMeta("testInfoDict"),
+                             "distDict":{},
+                             "loopTimeDict":{}}
+
+                for key in reader.readMeta("distKeys"):
+                    valueDict["distDict"][key] = reader.readColumn("distDict/{0}".format(key)).tolist()
+
+                for key in reader.readMeta("loopTimeKeys"):
+                    valueDict["loopTimeDict"][key] = reader.readColumn("loopTimeDict/{0}".format(key)).tolist()
+            except Exception as exception:
+                self.debugPrint("Unexpected value in .rfz file: {0}".format(exception))
+                return None
+
+        return valueDict
+
     #Find the antenna delay values for the anchor and tag
     def getAntDelay(self,sepDistCentimeters,
                          anchorRangeBuffer,
-                         tagRangeBuffer):
+                         tagRangeBuffer,
+                         anchorWeights=None):
         
-        anchorRangeAvg = np.average(anchorRangeBuffer)
+        anchorRangeAvg = np.average(anchorRangeBuffer,weights=anchorWeights)
 #        tagRangeAvg = np.average(tagRangeBuffer)
         
         anchorAntDelay = self.getAvgAntDelay(anchorRangeAvg,sepDistCentimeters)
@@ -779,6 +1328,23 @@ class DW1000test(object):
         self.anchorRangeBuffer.clear()
         self.tagRangeBuffer.clear()
         self.loopTimeBuffer.clear()        
+        self.loopTimeSum = 0.0
+        self.remainMillis = None
+        self.anchorRxPowerBuffer.clear()
+        self.tagRxPowerBuffer.clear()
+        self.anchorWeightBuffer.clear()
+        self.tagWeightBuffer.clear()
+
+        #The next samples may be from another distance or antenna delay
+        if (self.outlierFilter != None):
+            self.outlierFilter.reset()
+
+        if (self.qualityClassifier != None):
+            self.qualityClassifier.reset()
+
+        if (self.sampleFusion != None):
+            self.sampleFusion.reset()
+            self.pairQueue.clear()
 
     #Remove unwanted distances from existing distance data
     def truncateData(self,
@@ -813,6 +1379,36 @@ class DW1000test(object):
         distValue = (distValue-b)/m
         return distValue
 
+    #Latest tag/anchor antenna angle in degrees from whatever tracks it (e.g.
+    #a webcam or IMU); None clears it
+    def setOrientation(self,angle):
+        self.orientation = angle
+        self.orientationTime = time.perf_counter()
+
+    #Orientation if one was set recently enough, otherwise None
+    def currentOrientation(self):
+        if (self.orientation == None):
+            return None
+
+        if ((time.perf_counter() - self.orientationTime) > self.maxOrientationAge):
+            return None
+
+        return self.orientation
+
+    #Remove the angle dependent error from scaled ranges (a value or array);
+    #ranges are returned as they are without a correction table or orientation
+    def correctAngle(self,ranges,angles=None):
+        if (self.angleCorrection == None):
+            return ranges
+
+        if (angles is None):
+            angles = self.currentOrientation()
+
+            if (angles == None):
+                return ranges
+
+        return self.angleCorrection.apply(ranges,angles)
+
     def baseRound(self,value,base,method=None):
         if method == None:
             return int(base * round(float(value)/base))
@@ -857,15 +1453,13 @@ class DW1000test(object):
             self.commonPrint("Debug output disabled.")
 
     #Function to print debug messages
+    #NOTE: only the caller's frame is inspected, and only when debugging is
+    #      enabled; walking the whole stack costs far more than a range read
     def debugPrint(self,string):
-        (frame,
-         filename,
-         line_number,
-         function_name,
-         lines,
-         index) = inspect.getouterframes(inspect.currentframe())[1]
-
         if (self.printDebug == True):
+            callerFrame = inspect.currentframe().f_back
+            filename = callerFrame.f_code.co_filename
+            line_number = callerFrame.f_lineno
             a = datetime.now()
             print("{0} {1} [Notice: {2}]: {3}".format(filename.split("\\")[-1],
                                                        line_number,
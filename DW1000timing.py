@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 TIMING SOFTWARE (x64)
+
+Online estimate of when each frame left the device, from when it reached the
+host. The anchor and tag sit behind different USB-serial adapters that
+buffer differently, so their host timestamps are late by a different and
+varying amount per port. The firmware prints a frame every ranging exchange,
+so the frames of a port come at a regular cadence, and anything that breaks
+that cadence is host-side latency
+
+METHOD:
+-Frames are numbered one after the other; a frame that comes later than
+ the usual latency plus a few standard deviations of jitter is numbered
+ past the frames that must have been missed
+-A frame is never early, only late, so the cadence is the line under the
+ arrival times (lower envelope): the earliest arrival of every block of
+ frames is kept, and every block a line is fitted through the last few of
+ these and moved down onto the lowest few. Its slope is the frame
+ period on the host clock (drift against a nominal period comes from this)
+-A frame's corrected time is its point on the line, less the port's fixed
+ latency; how far it arrived above the line is its latency, which is
+ tracked as a moving mean and standard deviation (jitter)
+
+NOTES:
+-Times are in seconds on one monotonic host clock (e.g. perf_counter), so
+ other streams (webcam frames, IMU samples) stamped on the same clock can be
+ lined up with the corrected times; a stream with a regular cadence of its
+ own can be corrected with its own estimator
+-The constant part of a port's latency can't be seen in the arrival times;
+ fixedLatency is whatever is known of it (e.g. the adapter's latency timer).
+ The time a line takes to send at the port's baud rate is passed in per
+ frame, since lines differ in length
+-If the earliest frame of a block is half a period or more off the
+ envelope, the numbering slipped and the envelope is started again from
+ that block
+-Frames can only be numbered reliably while their jitter stays under about
+ half the frame period
+-Every frame costs a few arithmetic operations; the line fit runs once a
+ block over a handful of points
+-A gap of more than maxGap seconds (device restarted or paused) starts the
+ estimate again
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import collections
+
+import numpy as np
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000cadenceEstimator(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,
+                 nominalPeriod=None,
+                 fixedLatency=0.0,
+                 warmupFrames=20,
+                 blockSize=50,
+                 numBlocks=20,
+                 smoothing=0.01,
+                 maxGap=2.0):
+        self.nominalPeriod = nominalPeriod  #firmware frame period (s); estimated while warming up if None
+        self.fixedLatency = fixedLatency    #constant latency of the port (s)
+        self.warmupFrames = warmupFrames    #frames the first period and envelope are taken from
+        self.blockSize = blockSize          #frames per envelope point
+        self.numBlocks = numBlocks          #envelope points the line is fitted through
+        self.smoothing = smoothing          #how quickly the latency mean and jitter follow changes
+        self.maxGap = maxGap                #longest gap between frames before starting again (s)
+        self.maxDriftPpm = 1000.0           #largest believable drift against the nominal period
+        self.envelopePercentile = 10        #percentile of the block minima the envelope goes through
+        self.jitterLimit = 4.0              #frames later than the mean latency plus this many standard
+                                            #deviations are taken to have missed frames before them
+
+        self.resyncs = 0    #times the estimate was started again
+        self.reset()
+
+    #Start the estimate again
+    def reset(self):
+        self.period = self.nominalPeriod    #frame period on the host clock (s)
+        self.base = None                    #envelope time of frame 0 (s)
+        self.frameIndex = -1                #number of the last frame
+        self.lastArrival = None
+        self.warmup = []                    #arrival times until the first envelope is fitted
+
+        self.envelope = collections.deque(maxlen=self.numBlocks)   #(frame number, earliest arrival) per block
+        self.blockFrames = 0
+        self.blockMin = None                #(arrival, frame number) of this block's earliest frame
+
+        self.latency = 0.0          #mean arrival after the envelope (s)
+        self.latencyVar = 0.0       #its variance (s^2)
+        self.frames = 0             #frames corrected
+        self.missedFrames = 0       #frames the numbering skipped over
+        self.slips = 0              #times the numbering slipped and was put right
+
+    #==========================================================================
+    # ESTIMATION FUNCTIONS
+    #==========================================================================
+    #Add a frame that arrived at the given time and took transmitTime to send;
+    #returns the corrected time it left the device (the arrival time less the
+    #fixed latency until the estimate has warmed up)
+    def update(self,arrival,transmitTime=0.0):
+        arrival -= transmitTime
+
+        if (self.lastArrival != None) and (arrival - self.lastArrival > self.maxGap):
+            self.resyncs += 1
+            self.reset()
+
+        self.lastArrival = arrival
+
+        if (self.base == None):
+            self.warmup.append(arrival)
+
+            if (len(self.warmup) >= self.warmupFrames):
+                self.startEnvelope()
+
+            return arrival - self.fixedLatency
+
+        #The next frame, unless it came so late that frames must have been
+        #missed; one that came before its slot means the frames before it
+        #were numbered too high
+        period = self.period
+        frameIndex = self.frameIndex + 1
+        offset = arrival - (self.base + frameIndex*period)
+        lateLimit = min(max(self.latency + self.jitterLimit*self.latencyVar**0.5,period/2),0.9*period)
+        inSequence = True   #only frames numbered in sequence can mark the envelope
+
+        if (offset > lateLimit):
+            frameIndex += int((offset - lateLimit)/period) + 1
+            inSequence = False
+        elif (offset < -period/2):
+            frameIndex += int(round(offset/period))
+            inSequence = False
+
+        self.missedFrames += frameIndex - self.frameIndex - 1
+        self.frameIndex = frameIndex
+
+        envelopeTime = self.base + frameIndex*period
+        offset = arrival - envelopeTime
+
+        delta = offset - self.latency
+        self.latency += self.smoothing*delta
+        self.latencyVar = (1 - self.smoothing)*(self.latencyVar + self.smoothing*delta*delta)
+        self.frames += 1
+
+        if inSequence and ((self.blockMin == None) or (arrival - frameIndex*period < self.blockMin[0] - self.blockMin[1]*period)):
+            self.blockMin = (arrival,frameIndex)
+
+        self.blockFrames += 1
+
+        if (self.blockFrames >= self.blockSize) and (self.blockMin != None):
+            blockOffset = self.blockMin[0] - (self.base + self.blockMin[1]*period)
+
+            #The earliest frame of the block wasn't anywhere near the envelope,
+            #so the numbering slipped (e.g. missed frames that weren't
+            #noticed); start the envelope again from this block
+            if (abs(blockOffset) > period/2):
+                self.slips += 1
+                self.base += blockOffset
+                self.latency = max(self.latency - blockOffset,0.0)
+                self.envelope.clear()
+
+            self.envelope.append((self.blockMin[1],self.blockMin[0]))
+            self.blockFrames = 0
+            self.blockMin = None
+            self.fitEnvelope()
+
+        return envelopeTime - self.fixedLatency
+
+    #First period and envelope from the warm-up frames. Each frame's phase
+    #within the period is its latency (plus a constant), and the frames that
+    #came on time are the ones just after the widest gap in the phases; the
+    #frames are then numbered from there, skipping any that were missed
+    def startEnvelope(self):
+        arrivals = np.array(self.warmup)
+        self.warmup = []
+
+        if (self.period == None):
+            self.period = float(np.median(np.diff(arrivals)))
+
+        if not (self.period > 0):
+            self.reset()
+            return
+
+        period = self.period
+        phases = np.sort((arrivals - arrivals[0]) % period)
+        gaps = np.diff(np.append(phases,phases[0] + period))
+        widest = int(np.argmax(gaps))
+        start = arrivals[0] + phases[(widest + 1) % len(phases)]
+
+        #Frames just before the start in phase are numbered from the frame
+        #before, so the envelope is never above an arrival
+        frameIndices = np.floor((arrivals - start)/period + 1e-9)
+        frameIndices -= frameIndices[0]
+
+        #A period taken from the gaps is only as good as one gap; the slope of
+        #the numbered arrivals is as good as all of them
+        if (self.nominalPeriod == None) and (frameIndices[-1] > 0):
+            self.period = period = float(np.polyfit(frameIndices,arrivals,1)[0])
+
+        offsets = arrivals - frameIndices*period
+        self.base = float(offsets.min())
+        self.frameIndex = int(frameIndices[-1])
+        self.missedFrames = self.frameIndex + 1 - len(arrivals)
+        self.latency = float(np.mean(offsets - self.base))
+        self.latencyVar = float(np.var(offsets - self.base))
+
+        lowest = int(np.argmin(offsets))
+        self.envelope.append((int(frameIndices[lowest]),float(arrivals[lowest])))
+
+    #Fit the envelope line through the block minima and move it down onto
+    #the lowest of them
+    def fitEnvelope(self):
+        if (len(self.envelope) < 2):
+            return
+
+        points = np.array(self.envelope)
+        frameIndices = points[:,0]
+        arrivals = points[:,1]
+        frameMean = frameIndices.mean()
+        frameSpread = ((frameIndices - frameMean)**2).sum()
+
+        if not (frameSpread > 0):
+            return
+
+        period = ((frameIndices - frameMean)*(arrivals - arrivals.mean())).sum()/frameSpread
+        base = arrivals.mean() - period*frameMean
+
+        if not (period > 0):
+            return
+
+        #Device clocks are good to far better than maxDriftPpm, so a fit that
+        #far from the nominal period means the numbering went wrong
+        if (self.nominalPeriod != None) and (abs(period/self.nominalPeriod - 1)*1e6 > self.maxDriftPpm):
+            self.slips += 1
+            self.envelope.clear()
+            return
+
+        #A late frame numbered past a missed one looks early, so the line goes
+        #onto the lowest few points rather than the very lowest
+        self.period = float(period)
+        self.base = float(base + np.percentile(arrivals - base - period*frameIndices,self.envelopePercentile))
+
+    #==========================================================================
+    # STATISTICS FUNCTIONS
+    #==========================================================================
+    def ready(self):
+        return (self.base != None)
+
+    #Drift of the device clock against the host clock in parts per million
+    #(None without a nominal period)
+    def driftPpm(self):
+        if (self.nominalPeriod == None) or (self.period == None):
+            return None
+
+        return (self.period/self.nominalPeriod - 1)*1e6
+
+    #Port timing as a dictionary: period (s), rate (frames/s), drift (ppm),
+    #mean latency and jitter (s) and missed frames
+    def getStats(self):
+        return {"period":self.period,
+                "rate":1/self.period if self.period else None,
+                "driftPpm":self.driftPpm(),
+                "latency":self.fixedLatency + self.latency,
+                "jitter":self.latencyVar**0.5,
+                "missedFrames":self.missedFrames,
+                "slips":self.slips,
+                "resyncs":self.resyncs}
+
+    #One-line version of getStats for status bars and logs
+    def statsSummary(self):
+        if not self.ready():
+            return "timing warming up"
+
+        stats = self.getStats()
+
+        return "{0:.2f} frames/s, {1:.1f} ms latency, {2:.2f} ms jitter, {3} missed".format(stats["rate"],
+                                                                                        stats["latency"]*1e3,
+                                                                                        stats["jitter"]*1e3,
+                                                                                        stats["missedFrames"])
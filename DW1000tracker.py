@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+DECAWAVE DW1000 TRACKING SOFTWARE (x64)
+
+Particle filter over tag position and velocity, fed with range readings from
+one or more anchors at known coordinates. Meant for moving tags (e.g. the
+wrist-mounted "wiggle" trials) where single range readings jitter too much
+to use directly
+
+METHOD:
+-Predict: constant velocity with random (white noise) acceleration
+-Update: every particle is weighted by the likelihood of the ranges it
+ would have measured; weights are kept as logarithms so that very unlikely
+ particles don't underflow
+-Resample: systematic resampling whenever the effective number of
+ particles drops below a fraction of the particle count
+
+NOTES:
+-Every step works on all of the particles at once with numpy; there are no
+ per-particle Python loops
+-Ranges can arrive from the anchors at any time (addRange); the filter
+ collects them and runs at most updateRate times per second, using the
+ newest range from each anchor
+-With a single anchor at the origin and one dimension the state is simply
+ the range and its rate of change
+"""
+
+#==========================================================================
+# IMPORTS
+#==========================================================================
+import numpy as np
+
+#==========================================================================
+# CLASS
+#==========================================================================
+class DW1000particleTracker(object):
+    verNum = "0.0.0"
+
+    #Object initialization
+    def __init__(self,
+                 anchors,
+                 numParticles=2000,
+                 rangeStd=5.0,
+                 accelStd=200.0,
+                 updateRate=None,
+                 resampleThreshold=0.5,
+                 anchorNames=None,
+                 seed=None):
+        self.anchors = np.atleast_2d(np.asarray(anchors,dtype=np.float64))    #one row of coordinates per anchor
+        self.numAnchors,self.numDims = self.anchors.shape
+        self.anchorNames = anchorNames  #device names of the anchors, in the same order (see addSample)
+        self.numParticles = numParticles
+        self.rangeStd = rangeStd                    #range measurement noise (cm)
+        self.accelStd = accelStd                    #random acceleration of the tag (cm/s^2)
+        self.updateRate = updateRate                #most filter updates per second (None for every range)
+        self.resampleThreshold = resampleThreshold  #resample below this fraction of effective particles
+        self.random = np.random.default_rng(seed)
+
+        #Particle state: positions, velocities and log weights
+        self.positions = np.zeros((self.numParticles,self.numDims))
+        self.velocities = np.zeros((self.numParticles,self.numDims))
+        self.logWeights = np.zeros(self.numParticles)
+
+        self.lastTime = None        #time of the last predict
+        self.pendingRanges = {}     #anchor index -> newest range not used yet
+        self.numUpdates = 0
+        self.numResamples = 0
+
+    #==========================================================================
+    # INITIALIZATION FUNCTIONS
+    #==========================================================================
+    #Spread the particles uniformly over a box (lower and upper corners)
+    def initUniform(self,lower,upper,maxSpeed=0.0,timestamp=None):
+        self.positions = self.random.uniform(lower,upper,(self.numParticles,self.numDims))
+        self.velocities = self.random.uniform(-maxSpeed,maxSpeed,(self.numParticles,self.numDims))
+        self.logWeights[:] = 0
+        self.lastTime = timestamp
+
+    #Spread the particles around a known position
+    def initGaussian(self,position,positionStd,velocityStd=0.0,timestamp=None):
+        self.positions = np.asarray(position,dtype=np.float64) + self.random.normal(0,positionStd,(self.numParticles,self.numDims))
+        self.velocities = self.random.normal(0,velocityStd,(self.numParticles,self.numDims)) if velocityStd else np.zeros((self.numParticles,self.numDims))
+        self.logWeights[:] = 0
+        self.lastTime = timestamp
+
+    #==========================================================================
+    # FILTER FUNCTIONS
+    #==========================================================================
+    #Move every particle forward by dt seconds
+    def predict(self,dt):
+        if (dt <= 0):
+            return
+
+        accel = self.random.normal(0,self.accelStd,(self.numParticles,self.numDims))
+        self.positions += self.velocities*dt + 0.5*accel*dt**2
+        self.velocities += accel*dt
+
+    #Weight the particles by a set of ranges (one per anchor, NaN for none)
+    def update(self,ranges):
+        ranges = np.asarray(ranges,dtype=np.float64)
+        heard = np.flatnonzero(np.isfinite(ranges))
+
+        if (len(heard) == 0):
+            return
+
+        diffs = self.positions[:,None,:] - self.anchors[None,heard,:]
+        predicted = np.sqrt(np.einsum("pai,pai->pa",diffs,diffs))
+        residuals = (predicted - ranges[heard])/self.rangeStd
+
+        self.logWeights -= 0.5*np.einsum("pa,pa->p",residuals,residuals)
+        self.logWeights -= self.logWeights.max()    #keep the largest weight at 1
+        self.numUpdates += 1
+
+        if (self.effectiveParticles() < self.resampleThreshold*self.numParticles):
+            self.resample()
+
+    #Predict up to the given time and update with the given ranges
+    def step(self,timestamp,ranges):
+        if (self.lastTime != None):
+            self.predict(timestamp - self.lastTime)
+
+        self.lastTime = timestamp
+        self.update(ranges)
+
+    #Systematic resampling: one random offset, evenly spaced pointers
+    def resample(self):
+        weights = self.normalizedWeights()
+        cumulative = np.cumsum(weights)
+        cumulative[-1] = 1.0    #guard against rounding
+        pointers = (self.random.random() + np.arange(self.numParticles))/self.numParticles
+        indices = np.searchsorted(cumulative,pointers)
+
+        self.positions = self.positions[indices]
+        self.velocities = self.velocities[indices]
+        self.logWeights[:] = 0
+        self.numResamples += 1
+
+    def normalizedWeights(self):
+        weights = np.exp(self.logWeights - self.logWeights.max())
+
+        return weights/weights.sum()
+
+    def effectiveParticles(self):
+        weights = self.normalizedWeights()
+
+        return 1.0/np.dot(weights,weights)
+
+    #==========================================================================
+    # STREAM FUNCTIONS
+    #==========================================================================
+    #Add a range from one anchor; runs the filter if an update is due and
+    #returns True if it did
+    def addRange(self,anchorIndex,rangeVal,timestamp):
+        self.pendingRanges[anchorIndex] = rangeVal
+
+        if (self.lastTime != None) and (self.updateRate != None) and ((timestamp - self.lastTime) < 1.0/self.updateRate):
+            return False
+
+        ranges = np.full(self.numAnchors,np.nan)
+
+        for index,value in self.pendingRanges.items():
+            ranges[index] = value
+
+        self.pendingRanges.clear()
+        self.step(timestamp,ranges)
+
+        return True
+
+    #Add a range sample (e.g. from DW1000manager) from the named anchor
+    def addSample(self,name,sample):
+        return self.addRange(self.anchorNames.index(name),sample["range"],sample["time"])
+
+    #==========================================================================
+    # ESTIMATE FUNCTIONS
+    #==========================================================================
+    #Weighted mean position and velocity, and the position covariance
+    def estimate(self):
+        weights = self.normalizedWeights()
+        position = weights @ self.positions
+        velocity = weights @ self.velocities
+        diffs = self.positions - position
+        covariance = (diffs*weights[:,None]).T @ diffs
+
+        return position,velocity,covariance
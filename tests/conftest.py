@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Test configuration: the DW1000 modules live in the repository root and are
+imported as top-level modules
+"""
+
+import os
+import sys
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
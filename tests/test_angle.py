@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000angle.py
+"""
+
+import numpy as np
+import pytest
+
+import DW1000angle
+
+def test_fit_keeps_head_on_angles_and_drops_sentinels():
+    ranges = np.array((100.0,100.0,300.0,300.0,200.0,200.0))
+    angles = np.array((0.0,90.0,0.0,90.0,-1.0,np.nan))
+    errors = np.array((4.0,1.0,4.0,1.0,50.0,50.0))
+
+    correction = DW1000angle.DW1000angleCorrection.fit(ranges,angles,errors,rangeBins=2,angleBins=2)
+
+    assert np.allclose(correction.angleAxis,(22.5,67.5))
+    assert np.allclose(correction.table,((4.0,1.0),(4.0,1.0)))
+
+def test_fit_without_valid_samples_raises():
+    with pytest.raises(ValueError):
+        DW1000angle.DW1000angleCorrection.fit((100.0,),(-1.0,),(2.0,))
+
+def test_correction_interpolates_and_clamps():
+    correction = DW1000angle.DW1000angleCorrection((100.0,200.0),(0.0,90.0),((0.0,2.0),(4.0,6.0)))
+
+    assert np.isclose(correction.correction(150.0,45.0),3.0)
+    assert np.isclose(correction.correction(50.0,-30.0),0.0)       #clamped to the first cell
+    assert np.isclose(correction.correction(500.0,180.0),6.0)      #clamped to the last cell
+    assert np.allclose(correction.apply((150.0,150.0),(45.0,np.nan)),(147.0,150.0))
+
+def test_save_and_load_round_trip(tmp_path):
+    correction = DW1000angle.DW1000angleCorrection((100.0,200.0),(0.0,90.0),((0.0,2.0),(4.0,6.0)))
+    fileName = str(tmp_path/"table.npz")
+    correction.save(fileName)
+    loaded = DW1000angle.DW1000angleCorrection.load(fileName)
+
+    assert np.allclose(loaded.table,correction.table)
+    assert np.allclose(loaded.rangeAxis,correction.rangeAxis)
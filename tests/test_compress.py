@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the .rfz session files in DW1000compress.py
+"""
+
+import numpy as np
+import pytest
+
+import DW1000compress
+
+def test_codec_round_trip_within_the_resolution():
+    random = np.random.RandomState(0)
+    values = 100 + np.cumsum(random.normal(0,2,5000))
+    values[100] += 1e6      #a delta too big for the smaller dtypes
+
+    for method in ("none","zlib","lzma"):
+        codec = DW1000compress.DW1000codec(resolution=0.01,method=method)
+        dtypeCode,count,first,payload = codec.encodeSamples(values)
+        decoded = codec.decodeSamples(dtypeCode,count,first,payload,0.01,method)
+
+        assert count == len(values)
+        assert np.max(np.abs(decoded - values)) <= 0.005 + 1e-9
+
+def test_codec_rejects_non_finite_samples():
+    with pytest.raises(ValueError):
+        DW1000compress.DW1000codec().encodeSamples((1.0,np.nan))
+
+def test_session_round_trip(tmp_path):
+    fileName = str(tmp_path/"session.rfz")
+    random = np.random.RandomState(0)
+    ranges = 100 + random.normal(0,2,1000)
+    times = np.arange(1000)*0.1
+
+    with DW1000compress.DW1000sessionWriter(fileName,chunkSize=300) as writer:
+        writer.writeMeta("testInfoDict",{"device":"anchor","numSamples":1000})
+        writer.writeColumn("time",times,resolution=0.001)
+
+        for rangeVal in ranges:
+            writer.append("range",rangeVal)
+
+        writer.writeColumn("empty",[])
+
+    with DW1000compress.DW1000sessionReader(fileName) as reader:
+        assert reader.columns() == ["time","range","empty"]
+        assert reader.numChunks("range") == 4
+        assert reader.numSamples("range") == 1000
+        assert reader.readMeta("testInfoDict") == {"device":"anchor","numSamples":1000}
+        assert np.max(np.abs(reader.readColumn("time") - times)) <= 0.0005 + 1e-9
+        assert np.max(np.abs(reader.readColumn("range") - ranges)) <= 0.005 + 1e-9
+        assert np.allclose(reader.readChunk("range",3),np.round(ranges[900:]*100)/100)
+        assert len(reader.readColumn("empty")) == 0
+
+def test_cut_short_file_keeps_the_whole_chunks(tmp_path):
+    fileName = str(tmp_path/"session.rfz")
+
+    with DW1000compress.DW1000sessionWriter(fileName,chunkSize=100) as writer:
+        writer.writeColumn("range",np.arange(300,dtype=np.float64))
+
+    with open(fileName,"r+b") as sessionFile:
+        sessionFile.truncate(sessionFile.seek(0,2) - 5)
+
+    with DW1000compress.DW1000sessionReader(fileName) as reader:
+        assert np.array_equal(reader.readColumn("range"),np.arange(200))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000filters.py
+"""
+
+import numpy as np
+
+import DW1000filters
+
+def test_sliding_window_median_and_mad_match_numpy():
+    random = np.random.RandomState(0)
+    values = np.round(random.normal(100,5,500))     #repeated values, like quantized ranges
+
+    for size in (1,2,5,20,21):
+        window = DW1000filters.DW1000slidingWindow(size)
+
+        for index,value in enumerate(values):
+            window.push(value)
+            recent = values[max(0,index+1-size):index+1]
+            median = np.median(recent)
+
+            assert len(window) == len(recent)
+            assert window.median() == median
+            assert window.mad(median) == np.median(np.abs(recent - median))
+
+def test_sliding_window_returns_the_dropped_reading():
+    window = DW1000filters.DW1000slidingWindow(2)
+
+    assert window.push(3.0) == None
+    assert window.push(1.0) == None
+    assert window.push(2.0) == 3.0
+    assert window.sorted == [1.0,2.0]
+
+def test_hampel_filter_modes():
+    readings = [100.0,101.0,99.0,100.0,102.0,98.0,160.0,100.0]
+
+    for mode,expected in (("drop",np.nan),("replace",100.0),("flag",160.0)):
+        hampel = DW1000filters.DW1000hampelFilter(numLinks=1,mode=mode)
+        outputs = [hampel.update((value,))[0] for value in readings]
+
+        assert np.allclose(outputs[:6],readings[:6])
+        assert np.allclose(outputs[6],expected,equal_nan=True)
+        assert hampel.rejected == [1]
+        assert hampel.checked == [8]
+
+def test_hampel_filter_follows_a_step():
+    hampel = DW1000filters.DW1000hampelFilter(numLinks=2,windowSize=9)
+    outputs = [hampel.update((100.0 + (index % 2),np.nan))[0] for index in range(20)]
+    outputs += [hampel.update((200.0 + (index % 2),np.nan))[0] for index in range(10)]
+
+    assert np.isnan(outputs[20:25]).all()          #rejected until the step is half the window
+    assert np.isfinite(outputs[25:]).all()
+    assert hampel.checked == [30,0]
+
+def test_kalman_filter_converges_and_tracks_with_little_lag():
+    random = np.random.RandomState(0)
+    times = np.arange(0,20,0.1)
+    truth = 100 + 20*times     #moving away at 20 cm/s
+    readings = truth + random.normal(0,2.0,len(times))
+
+    for numLinks in (1,12):     #scalar and numpy paths
+        kalman = DW1000filters.DW1000kalmanFilter(numLinks=numLinks,processNoise=1.0)
+        filtered = np.array([kalman.update(np.full(numLinks,reading),timestamp)[0]
+                             for reading,timestamp in zip(readings,times)])
+
+        errors = filtered[50:] - truth[50:]
+
+        assert abs(np.mean(errors)) < 0.5      #no lag behind the movement
+        assert np.std(errors) < np.std(readings[50:] - truth[50:])/2
+        assert abs(kalman.rates[0] - 20) < 2
+        assert np.isclose(kalman.predict(times[-1] + 1.0)[0],filtered[-1] + kalman.rates[0])
+
+def test_kalman_filter_skips_missing_readings():
+    for numLinks in (2,12):
+        kalman = DW1000filters.DW1000kalmanFilter(numLinks=numLinks)
+        values = np.full(numLinks,np.nan)
+        values[0] = 100.0
+        ranges = kalman.update(values,0.0)
+
+        assert ranges[0] == 100.0
+        assert np.isnan(ranges[1:]).all()
+
+        values[0] = 101.0
+        ranges = kalman.update(values,0.1)
+
+        assert 100.0 < ranges[0] < 101.0
+        assert np.isnan(ranges[1:]).all()
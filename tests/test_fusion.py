@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000fusion.py and the pairing in DW1000test.nextPair
+"""
+
+import contextlib
+import io
+
+import numpy as np
+
+import DW1000emulator
+import DW1000fusion
+import DW1000test
+
+def anchorReport(rangeVal,peer="T1"):
+    return {"peerAddr":peer,"range":rangeVal}
+
+def tagReport(rangeVal,peer="A1"):
+    return {"peerAddr":peer,"range":rangeVal}
+
+def rangesOf(pair):
+    return None if (pair == None) else (pair[0]["range"],pair[1]["range"])
+
+def test_reports_pair_within_tolerance():
+    fusion = DW1000fusion.DW1000sampleFusion(tolerance=0.05)
+
+    assert fusion.addReport("anchor",anchorReport(1),0.00) == None
+    anchorSample,tagSample,offset = fusion.addReport("tag",tagReport(1),0.01)
+
+    assert (anchorSample["range"],tagSample["range"]) == (1,1)
+    assert np.isclose(offset,-0.01)
+    assert fusion.matched == 1
+
+def test_missed_and_expired_reports_are_unmatched():
+    fusion = DW1000fusion.DW1000sampleFusion(tolerance=0.05)
+    fusion.addReport("anchor",anchorReport(1),0.00)
+    fusion.addReport("tag",tagReport(1),0.01)
+    fusion.addReport("tag",tagReport(2),0.10)       #anchor report missed
+
+    assert rangesOf(fusion.addReport("anchor",anchorReport(3),0.30)) == None   #tag 2 expired
+    assert rangesOf(fusion.addReport("tag",tagReport(3),0.31)) == (3,3)
+    assert fusion.unmatched == {"anchor":0,"tag":1}
+
+#Of several pending reports, the newest from the matching peer is paired and
+#the older ones are dropped as missed
+def test_pairs_with_newest_compatible_report():
+    fusion = DW1000fusion.DW1000sampleFusion(tolerance=0.05)
+    fusion.addReport("anchor",anchorReport(1),0.00)
+    fusion.addReport("anchor",anchorReport(2),0.01)
+
+    assert rangesOf(fusion.addReport("tag",tagReport(2),0.02)) == (2,2)
+    assert fusion.unmatched["anchor"] == 1
+
+def test_wrong_peer_is_not_paired():
+    fusion = DW1000fusion.DW1000sampleFusion(tolerance=0.05,peerPairs={"T1":"A1"})
+    fusion.addReport("tag",tagReport(9,peer="A2"),0.00)
+
+    assert fusion.addReport("anchor",anchorReport(4),0.01) == None
+    assert rangesOf(fusion.addReport("tag",tagReport(4),0.02)) == (4,4)
+
+#A stale report from the wrong peer is one mismatch, however many reports
+#are checked against it before it expires
+def test_address_mismatch_counted_once_per_report():
+    fusion = DW1000fusion.DW1000sampleFusion(tolerance=1.0,peerPairs={"T1":"A1"})
+    fusion.addReport("tag",tagReport(9,peer="A2"),0.00)
+
+    for index in range(5):
+        fusion.addReport("anchor",anchorReport(index),0.01*(index+1))
+        fusion.addReport("tag",tagReport(index),0.01*(index+1) + 0.001)
+
+    assert fusion.addressMismatches == 1
+    assert fusion.matched == 5
+
+def test_fuse_is_inverse_variance_weighted():
+    fusion = DW1000fusion.DW1000sampleFusion(rangeStds=(2.0,2.0))
+
+    assert fusion.fuse((100,104)) == (102.0,2.0)
+    assert fusion.fuse((100,np.nan)) == (100.0,4.0)
+
+    fused,variance = fusion.fuse((100,104),fusion.weightedVariances((1,0.25)))
+
+    assert np.isclose(fused,100.8) and np.isclose(variance,3.2)
+
+    fused,variances = fusion.fuse(np.array([[100,104],[1,3]]))
+
+    assert np.allclose(fused,(102,2)) and np.allclose(variances,(2,2))
+
+#A caller that falls behind gets recent pairs, not the whole backlog
+def test_next_pair_drops_backlog_beyond_queue_size():
+    with contextlib.redirect_stdout(io.StringIO()):
+        DW1000 = DW1000test.DW1000test()
+
+    DW1000emulator.DW1000emulatedLink().attach(DW1000)
+    DW1000.sampleFusion = DW1000fusion.DW1000sampleFusion(tolerance=0.05)
+
+    #20 exchanges at 10 Hz waiting in the device stores
+    for index in range(20):
+        for role,offsetNs in (("anchor",0),("tag",2000000)):
+            parsedNs = DW1000.manager.consumedNs[role] + (index+1)*100000000 + offsetNs
+            DW1000.manager.stores[role].append({"range":float(index),
+                                               "peerAddr":None,
+                                               "rxPower":-80.0,
+                                               "readNs":parsedNs,
+                                               "parsedNs":parsedNs,
+                                               "time":parsedNs/1e9})
+
+    pairs = [DW1000.nextPair(0.0) for _ in range(DW1000.pairQueueSize)]
+
+    assert [pair["anchor"]["range"] for pair in pairs] == [float(index) for index in range(16,20)]
+    assert DW1000.pairsDropped == 16
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000latency.py and the stages distMeasLoop stamps
+"""
+
+import contextlib
+import io
+import time
+
+import DW1000latency
+import DW1000test
+
+def test_histogram_percentiles_are_within_a_bucket():
+    histogram = DW1000latency.DW1000latencyHistogram()
+
+    for value in range(1,100001):
+        histogram.record(value*1000)
+
+    for percent in (50,99):
+        assert abs(histogram.percentile(percent)/(percent*1e6) - 1) < 0.04
+
+    assert (histogram.minValue,histogram.maxRecorded) == (1000,100000000)
+
+def test_stages_start_at_the_first_read_and_parse_times_are_per_device():
+    with contextlib.redirect_stdout(io.StringIO()):
+        DW1000 = DW1000test.DW1000test()
+
+    #Lines read and parsed before distMeasLoop is called: the anchor's read
+    #5 ms ago and parsed 1 ms later, the tag's read 3 ms ago and parsed 2 ms later
+    def nextPair(timeout):
+        nowNs = time.perf_counter_ns()
+        return {role:{"range":100.0,"rxPower":-80.0,"time":time.time(),
+                      "readNs":nowNs - readAgo*1000000,"parsedNs":nowNs - (readAgo - parseTime)*1000000}
+                for role,readAgo,parseTime in (("anchor",5,1),("tag",3,2))}
+
+    DW1000.nextPair = nextPair
+
+    for _ in range(20):
+        assert DW1000.distMeasLoop()
+
+    summary = DW1000.latency.summary()
+
+    assert abs(summary["anchorParse"]["mean"] - 1000) < 100    #us
+    assert abs(summary["tagParse"]["mean"] - 2000) < 100
+    assert abs(summary["paired"]["mean"] - 4000) < 100         #earliest read to the last parse
+    assert all(summary[stage]["count"] == 20 for stage in ("anchorParse","tagParse","paired","buffered"))
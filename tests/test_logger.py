@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000logger.py
+"""
+
+import glob
+import os
+
+import DW1000compress
+import DW1000logger
+
+def test_segments_are_compressed(tmp_path):
+    logger = DW1000logger.DW1000rotatingLogger(str(tmp_path),rotateSeconds=None,rotateBytes=None)
+
+    for index in range(100):
+        logger.publish(index*0.1,(100.0 + index,200.0 - index))
+
+    logger.rotate()
+    logger.publish(10.0,(1.0,2.0))
+    logger.close()
+
+    compressedNames = sorted(glob.glob(os.path.join(str(tmp_path),"*.rfz")))
+
+    assert logger.segmentsCompressed == 2
+    assert not glob.glob(os.path.join(str(tmp_path),"*.csv"))
+
+    with DW1000compress.DW1000sessionReader(compressedNames[0]) as reader:
+        assert list(reader.readColumn("anchor")) == [100.0 + index for index in range(100)]
+
+#The writer thread can apply the retention policy right after the compressor
+#took a segment off its queue; the segment must still count as pending. The
+#compressor loop is run inline so the hand-off can be interrupted
+def test_retention_skips_segment_being_handed_to_compressor(tmp_path,capsys):
+    logger = DW1000logger.DW1000rotatingLogger(str(tmp_path),rotateSeconds=None,rotateBytes=None,
+                                               maxSegments=0,compress=False)
+    logger.compress = True
+    logger.publish(0.0,(1.0,2.0))
+    logger.rotate()
+    logger.compressQueue.put(None)
+
+    queueGet = logger.compressQueue.get
+
+    def getThenApplyRetention():
+        fileName = queueGet()
+        logger.applyRetention()
+        return fileName
+
+    logger.compressQueue.get = getThenApplyRetention
+    logger.compressLoop()
+    logger.closeSegment()
+
+    assert logger.segmentsCompressed == 1
+    assert not ("Could not compress" in capsys.readouterr().out)
+
+def test_rows_that_cant_be_compressed_are_skipped(tmp_path):
+    logger = DW1000logger.DW1000rotatingLogger(str(tmp_path),rotateSeconds=None,rotateBytes=None)
+    logger.publish(0.0,(100.0,200.0))
+    logger.publish(0.1,(float("nan"),200.0))
+    logger.publish(0.2,(float("inf"),200.0))
+    logger.segmentFile.write("0.3,abc,200.0\n")
+    logger.publish(0.4,(101.0,201.0))
+    logger.close()
+
+    compressedNames = glob.glob(os.path.join(str(tmp_path),"*.rfz"))
+
+    assert (logger.segmentsCompressed,logger.rowsSkipped) == (1,3)
+
+    with DW1000compress.DW1000sessionReader(compressedNames[0]) as reader:
+        assert list(reader.readColumn("anchor")) == [100.0,101.0]
+        assert list(reader.readColumn("time")) == [0.0,0.4]
+
+def test_failed_compression_leaves_no_partial_file(tmp_path,monkeypatch,capsys):
+    logger = DW1000logger.DW1000rotatingLogger(str(tmp_path),rotateSeconds=None,rotateBytes=None)
+    logger.publish(0.0,(100.0,200.0))
+
+    def failingAppend(self,name,value):
+        raise IOError("disk full")
+
+    monkeypatch.setattr(DW1000compress.DW1000sessionWriter,"append",failingAppend)
+    logger.close()
+
+    assert logger.segmentsCompressed == 0
+    assert "Could not compress" in capsys.readouterr().out
+    assert [os.path.splitext(fileName)[1] for fileName in os.listdir(str(tmp_path))] == [".csv"]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000pipeline.py: the streamer's per-sample pipeline, live and on
+a replay of the same session
+"""
+
+import contextlib
+import csv
+import io
+
+import numpy as np
+
+import DW1000compress
+import DW1000emulator
+import DW1000pipeline
+import DW1000replay
+import DW1000test
+
+anchorFitDict = {"m":1.02,"b":-3.0}
+tagFitDict = {"m":0.98,"b":2.0}
+
+class recordingOutput(object):
+    def __init__(self):
+        self.samples = []
+        self.closed = False
+
+    def publish(self,timestamp,values):
+        self.samples.append((timestamp,) + tuple(values))
+
+    def close(self):
+        self.closed = True
+
+def makeTest(**settings):
+    with contextlib.redirect_stdout(io.StringIO()):
+        testInfoDict = DW1000test.DW1000test().testInfoDict
+        testInfoDict.update(settings)
+
+        return DW1000test.DW1000test(testInfoDict=testInfoDict)
+
+def runPipeline(DW1000,numSamples,**settings):
+    output = recordingOutput()
+    rangePipeline = DW1000pipeline.DW1000rangePipeline(DW1000,anchorFitDict,tagFitDict,
+                                                       dict(DW1000.testInfoDict,**settings),[output])
+
+    while (rangePipeline.numSamples < numSamples):
+        assert DW1000.distMeasLoop()
+        rangePipeline.process()
+
+    rangePipeline.close()
+    assert output.closed
+
+    return np.array(output.samples)
+
+def test_pipeline_scales_smooths_and_stamps_with_the_sample_time(tmp_path):
+    DW1000 = makeTest(kalmanFilter=True,timingCorrection=True,framePeriod=0.005)
+    DW1000emulator.DW1000emulatedLink(trueDist=100.0,rate=200.0).attach(DW1000)
+    sampleTimes = []
+    DW1000.sampleListeners.append(lambda sample: sampleTimes.append(sample["time"]))
+
+    samples = runPipeline(DW1000,50,captureFile=str(tmp_path/"capture.rfz"))
+
+    assert np.array_equal(samples[:,0],sampleTimes)
+
+    with DW1000compress.DW1000sessionReader(str(tmp_path/"capture.rfz")) as reader:
+        assert np.allclose(reader.readColumn("time"),sampleTimes,atol=1e-4)
+        assert reader.readMeta("anchorFit") == anchorFitDict
+        anchorRanges = reader.readColumn("anchor")
+
+    #Smoothed ranges stay near the scaled raw ranges
+    scaled = (anchorRanges - anchorFitDict["b"])/anchorFitDict["m"]
+    assert abs(np.mean(samples[10:,1]) - np.mean(scaled[10:])) < 1.0
+    assert np.std(samples[10:,1]) < np.std(scaled[10:])
+
+def test_replay_through_the_pipeline_matches_live(tmp_path):
+    prefix = str(tmp_path/"capture")
+    liveTest = makeTest(kalmanFilter=True)
+    DW1000emulator.DW1000emulatedLink(trueDist=100.0).attach(liveTest)
+    liveTest.startRawCapture(prefix)
+    liveSamples = runPipeline(liveTest,100)
+    liveTest.stopRawCapture()
+
+    replayTest = makeTest(kalmanFilter=True)
+    DW1000replay.DW1000replay.fromRawCaptures({"anchor":prefix + "_anchor.dwraw",
+                                               "tag":prefix + "_tag.dwraw"},speed=0).attach(replayTest)
+    replayedSamples = runPipeline(replayTest,100)
+
+    assert np.allclose(replayedSamples[:,0],liveSamples[:,0],rtol=0,atol=1e-3)
+    assert np.allclose(replayedSamples[:,1:],liveSamples[:,1:],rtol=0,atol=0.01)
+
+def test_csv_output(tmp_path):
+    output = DW1000pipeline.DW1000csvOutput(str(tmp_path/"ranges.csv"))
+    output.publish(1.5,(100.25,np.float64(99.5)))
+    output.close()
+
+    with open(str(tmp_path/"ranges.csv"),newline="") as csvFile:
+        assert list(csv.reader(csvFile)) == [["time","anchor","tag"],["1.5","100.25","99.5"]]
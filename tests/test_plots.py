@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the curve fits behind the plots in DW1000test.py
+"""
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+
+import DW1000test
+
+plotInfoDict = {"makeGaussPlot":True,
+                "makeHistPlot":True,
+                "makeRefPlot":True,
+                "scaleData":False,
+                "truncateData":False,
+                "show":False,
+                "minTruncDist":5,
+                "maxTruncDist":5}
+
+#Ranges at three distances with a far off reading at each that has a low quality weight
+def weightedData():
+    distDict = {}
+    weightDict = {}
+
+    for actualDist in (50,100,150):
+        distDict["{0} cm".format(actualDist)] = np.array((actualDist,actualDist+1.0,actualDist-1.0,actualDist+60.0))
+        weightDict["{0} cm".format(actualDist)] = [1.0,1.0,1.0,0.01]
+
+    return distDict,weightDict
+
+def test_plots_fit_with_the_scaler_weights(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    DW1000test.fitCache.clear()
+    DW1000 = DW1000test.DW1000test()
+    DW1000.testInfoDict.update(device="anchor",startDist=50,stopDist=150,stepDist=50)
+    distDict,weightDict = weightedData()
+
+    scalerFit = DW1000.linearCurveFit(distDict,weightDict=weightDict)
+    DW1000.makeErrorPlotDist(dict(distDict),dict(plotInfoDict),weightDict=weightDict)
+    DW1000.makeGaussianPlotDist(dict(distDict),dict(plotInfoDict),weightDict=weightDict)
+
+    #Both plots were drawn from the scaler's cached fit
+    assert (DW1000test.fitCache.misses,DW1000test.fitCache.hits) == (1,2)
+    assert abs(scalerFit["b"]) < 1.0
+
+def test_weights_change_the_fit():
+    DW1000test.fitCache.clear()
+    DW1000 = DW1000test.DW1000test()
+    distDict,weightDict = weightedData()
+
+    weightedFit = DW1000.linearCurveFit(distDict,weightDict=weightDict)
+    unweightedFit = DW1000.linearCurveFit(distDict)
+
+    assert not np.isclose(weightedFit["b"],unweightedFit["b"])
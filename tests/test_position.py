@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000position.py
+"""
+
+import numpy as np
+
+import DW1000position
+
+squareAnchors = [(0,0),(500,0),(500,500),(0,500)]
+
+def test_solve_recovers_position():
+    solver = DW1000position.DW1000positionSolver(squareAnchors,rangeStd=1.0)
+    truth = np.array((123.0,321.0))
+    position,covariance = solver.solve(solver.rangesTo(truth))
+
+    assert np.allclose(position,truth,atol=1e-3)
+    assert covariance.shape == (2,2)
+
+def test_solve_with_missing_range():
+    solver = DW1000position.DW1000positionSolver(squareAnchors)
+    truth = np.array((200.0,100.0))
+    ranges = solver.rangesTo(truth)
+    ranges[2] = np.nan
+
+    position,covariance = solver.solve(ranges)
+
+    assert np.allclose(position,truth,atol=1e-3)
+
+def test_solve_collinear_anchors_has_no_solution():
+    solver = DW1000position.DW1000positionSolver([(0,0),(100,0),(200,0)])
+
+    for truth in ((50.0,0.0),(50.0,30.0)):
+        assert solver.solve(solver.rangesTo(truth)) == (None,None)
+        assert solver.solve(solver.rangesTo(truth),initial=(10.0,0.0)) == (None,None)
+
+def test_solve_collinear_subset_after_missing_ranges():
+    solver = DW1000position.DW1000positionSolver([(0,0),(100,0),(200,0),(100,300)])
+    ranges = solver.rangesTo((80.0,60.0))
+    ranges[3] = np.nan
+
+    assert solver.solve(ranges) == (None,None)
+
+    positions,covariances = solver.solveBatch(np.vstack((ranges,solver.rangesTo((80.0,60.0)))))
+
+    assert np.isnan(positions[0]).all()
+    assert np.allclose(positions[1],(80.0,60.0),atol=1e-3)
+
+def test_solve_batch_matches_solve():
+    solver = DW1000position.DW1000positionSolver(squareAnchors,rangeStd=2.0)
+    random = np.random.RandomState(0)
+    truths = random.uniform(50,450,(20,2))
+    ranges = np.array([solver.rangesTo(truth) for truth in truths]) + random.normal(0,2,(20,4))
+
+    positions,covariances = solver.solveBatch(ranges)
+
+    for index in range(len(truths)):
+        position,covariance = solver.solve(ranges[index])
+        assert np.allclose(positions[index],position,atol=1e-2)
+        assert np.allclose(covariances[index],covariance,rtol=1e-3)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000pubsub.py
+"""
+
+import os
+import socket
+import tempfile
+import time
+
+import pytest
+
+import DW1000pubsub
+
+def makeServer(**kwargs):
+    address = os.path.join(tempfile.mkdtemp(),"DW1000pubsub.sock")
+
+    return DW1000pubsub.DW1000pubsubServer(address,**kwargs)
+
+def waitForSubscribers(server,count,timeout=2.0):
+    deadline = time.perf_counter() + timeout
+
+    while (server.numSubscribers() < count):
+        assert time.perf_counter() < deadline
+        time.sleep(0.001)
+
+def test_samples_round_trip():
+    with makeServer() as server:
+        with DW1000pubsub.DW1000pubsubClient(server.address,timeout=2.0) as client:
+            waitForSubscribers(server,1)
+
+            for index in range(5):
+                server.publish(float(index),(index,-index))
+
+            samples = [client.receive() for _ in range(5)]
+
+    assert client.columns == ["anchor","tag"]
+    assert [sample[0] for sample in samples] == list(range(5))
+    assert samples[3] == (3,3.0,(3.0,-3.0))
+
+def test_columns_frame_survives_a_full_queue():
+    with makeServer(queueSize=4) as server:
+        server.flushSubscriber = lambda sock,subscriber: None     #hold every send
+
+        with DW1000pubsub.DW1000pubsubClient(server.address,timeout=2.0) as client:
+            waitForSubscribers(server,1)
+
+            for index in range(10):
+                server.publish(float(index),(index,index))
+
+            del server.flushSubscriber
+            server.wake()
+
+            sequence,timestamp,values = client.receive()
+
+    assert client.columns == ["anchor","tag"]
+    assert sequence == 6        #the four newest samples were kept
+    assert server.framesDropped == 6
+
+def test_live_socket_is_not_taken_over():
+    with makeServer() as server:
+        with pytest.raises(FileExistsError):
+            DW1000pubsub.DW1000pubsubServer(server.address)
+
+        with DW1000pubsub.DW1000pubsubClient(server.address,timeout=2.0) as client:
+            waitForSubscribers(server,1)
+            server.publish(1.0,(1.0,2.0))
+
+            assert client.receive() == (0,1.0,(1.0,2.0))
+
+def test_stale_socket_is_replaced():
+    address = os.path.join(tempfile.mkdtemp(),"DW1000pubsub.sock")
+    stale = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    stale.bind(address)
+    stale.close()           #left the socket file behind, like a crashed server
+
+    with DW1000pubsub.DW1000pubsubServer(address) as server:
+        with DW1000pubsub.DW1000pubsubClient(address,timeout=2.0) as client:
+            waitForSubscribers(server,1)
+            server.publish(1.0,(1.0,2.0))
+
+            assert client.receive() == (0,1.0,(1.0,2.0))
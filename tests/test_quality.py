@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000quality.py, alone and on the NLOS emulator
+"""
+
+import contextlib
+import io
+
+import numpy as np
+
+import DW1000emulator
+import DW1000quality
+import DW1000test
+
+#A DW1000test object weighting ranges by quality, on an emulated link with
+#20% NLOS ranges
+def emulatedNlosTest(seed=0,numSamples=1000):
+    with contextlib.redirect_stdout(io.StringIO()):
+        testInfoDict = DW1000test.DW1000test().testInfoDict
+        testInfoDict.update(nlosWeighting=True,numSamples=numSamples)
+        DW1000 = DW1000test.DW1000test(testInfoDict=testInfoDict)
+
+    link = DW1000emulator.DW1000emulatedLink(trueDist=100.0,nlosRatio=0.2,seed=seed)
+    link.attach(DW1000)
+
+    return DW1000,link
+
+def takeSamples(DW1000,numSamples):
+    DW1000.clearBuffers()
+
+    while (len(DW1000.anchorRangeBuffer) < numSamples):
+        assert DW1000.distMeasLoop()
+
+def test_line_of_sight_ranges_keep_full_weight():
+    classifier = DW1000quality.DW1000nlosClassifier(numLinks=1)
+    random = np.random.RandomState(0)
+    weights = [classifier.update((100.0 + random.normal(0,1.0),),(-80.0,))[0] for _ in range(200)]
+
+    assert min(weights[20:]) > 0.5
+    assert classifier.nlosCount == [0]
+
+def test_long_weak_range_is_weighted_down_and_counted():
+    classifier = DW1000quality.DW1000nlosClassifier(numLinks=2)
+    random = np.random.RandomState(0)
+
+    for _ in range(50):
+        classifier.update((100.0 + random.normal(0,1.0),np.nan),(-80.0,None))
+
+    weights = classifier.update((130.0,np.nan),(-90.0,None))
+
+    assert weights[0] < 0.05
+    assert np.isnan(weights[1])
+    assert classifier.lastNlos[0]
+    assert classifier.nlosCount == [1,0]
+    assert classifier.checked == [51,0]
+
+def test_weighting_removes_the_nlos_bias():
+    weightedBiases = []
+
+    for seed in range(4):
+        DW1000,link = emulatedNlosTest(seed)
+        link.anchor.antDelay = link.trueAntDelay    #ranges come out at the true distance
+        takeSamples(DW1000,1000)
+
+        ranges = np.array(DW1000.anchorRangeBuffer)
+        weights = np.array(DW1000.anchorWeightBuffer)
+        weightedBiases.append(abs(np.average(ranges,weights=weights) - link.trueDist))
+
+        assert np.average(ranges) - link.trueDist > 4.0
+        assert weightedBiases[-1] < 1.5
+
+    assert np.mean(weightedBiases) < 0.75
+
+def test_weighted_antenna_delay_lands_on_the_true_value():
+    DW1000,link = emulatedNlosTest()
+    takeSamples(DW1000,1000)
+
+    weightedDelay = DW1000.getAntDelay(link.trueDist,DW1000.anchorRangeBuffer,DW1000.tagRangeBuffer,
+                                       DW1000.anchorWeightBuffer)[0]
+    unweightedDelay = DW1000.getAntDelay(link.trueDist,DW1000.anchorRangeBuffer,DW1000.tagRangeBuffer)[0]
+
+    assert abs(weightedDelay - link.trueAntDelay) <= 1
+    assert unweightedDelay - link.trueAntDelay > 5
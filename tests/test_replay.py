@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000replay.py: a replayed raw capture gives the listeners what
+the live session gave them
+"""
+
+import contextlib
+import io
+
+import numpy as np
+
+import DW1000emulator
+import DW1000replay
+import DW1000test
+
+def makeTest(**settings):
+    with contextlib.redirect_stdout(io.StringIO()):
+        testInfoDict = DW1000test.DW1000test().testInfoDict
+        testInfoDict.update(settings)
+
+        return DW1000test.DW1000test(testInfoDict=testInfoDict)
+
+#Run distMeasLoop until the listeners have had numSamples samples (or it
+#fails) and return them
+def runSamples(DW1000,numSamples):
+    samples = []
+    DW1000.sampleListeners.append(samples.append)
+
+    while (len(samples) < numSamples):
+        if not DW1000.distMeasLoop():
+            break
+
+    return samples
+
+def liveAndReplayed(tmp_path,numSamples,rate,**settings):
+    prefix = str(tmp_path/"capture")
+    liveTest = makeTest(**settings)
+    DW1000emulator.DW1000emulatedLink(trueDist=100.0,rate=rate).attach(liveTest)
+    liveTest.startRawCapture(prefix)
+    liveSamples = runSamples(liveTest,numSamples)
+    liveTest.stopRawCapture()
+
+    replayTest = makeTest(**settings)
+    replay = DW1000replay.DW1000replay.fromRawCaptures({"anchor":prefix + "_anchor.dwraw",
+                                                        "tag":prefix + "_tag.dwraw"},speed=0)
+    replay.attach(replayTest)
+    replayedSamples = runSamples(replayTest,numSamples)
+
+    return liveSamples,replayedSamples
+
+def assertSameSamples(liveSamples,replayedSamples):
+    assert len(replayedSamples) == len(liveSamples)
+
+    for liveSample,replayedSample in zip(liveSamples,replayedSamples):
+        assert sorted(replayedSample) == sorted(liveSample)
+
+        for key,value in liveSample.items():
+            if (key == "time"):
+                #The wall clock is only tied to the recorded receive times
+                #when the capture starts
+                assert abs(replayedSample[key] - value) < 1e-3
+            else:
+                assert np.array_equal(replayedSample[key],value,equal_nan=True)
+
+def test_replay_matches_live_newest_pairs(tmp_path):
+    assertSameSamples(*liveAndReplayed(tmp_path,200,rate=None,outlierMode="drop",nlosWeighting=True))
+
+def test_replay_matches_live_with_timing_and_fusion(tmp_path):
+    assertSameSamples(*liveAndReplayed(tmp_path,100,rate=200.0,
+                                       outlierMode="drop",
+                                       nlosWeighting=True,
+                                       pairTolerance=0.002,
+                                       timingCorrection=True,
+                                       framePeriod=0.005))
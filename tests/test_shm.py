@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000shm.py
+"""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from multiprocessing import shared_memory
+
+import DW1000shm
+
+def blockName(request):
+    return "DW1000test_{0}_{1}".format(os.getpid(),request.node.name)[:30]
+
+def test_samples_round_trip(request):
+    with DW1000shm.DW1000shmWriter(blockName(request),numSlots=8) as writer:
+        with DW1000shm.DW1000shmReader(writer.name,fromStart=True) as reader:
+            for index in range(5):
+                writer.publish(float(index),(index,2*index))
+
+            sequences,timestamps,values = reader.read()
+
+            assert reader.columns == ["anchor","tag"]
+            assert list(sequences) == list(range(5))
+            assert np.array_equal(values[:,1],2*np.arange(5))
+            assert reader.latest()[0] == 4
+
+def test_reader_lapped_by_writer_skips_ahead(request):
+    with DW1000shm.DW1000shmWriter(blockName(request),numSlots=8) as writer:
+        with DW1000shm.DW1000shmReader(writer.name,fromStart=True) as reader:
+            for index in range(20):
+                writer.publish(float(index),(index,index))
+
+            sequences,timestamps,values = reader.read()
+
+            assert list(sequences) == list(range(12,20))
+            assert (reader.overruns,reader.samplesMissed) == (1,12)
+
+#A slot the writer is part way through (sequence -1) mustn't be handed out
+def test_slot_being_written_is_skipped(request):
+    with DW1000shm.DW1000shmWriter(blockName(request),numSlots=8) as writer:
+        with DW1000shm.DW1000shmReader(writer.name,fromStart=True) as reader:
+            for index in range(4):
+                writer.publish(float(index),(index,index))
+
+            writer.slotSeqs[2] = -1
+            sequences,timestamps,values = reader.read()
+
+            assert list(sequences) == [0,1,3]
+            assert reader.samplesMissed == 1
+
+def test_second_writer_does_not_detach_live_writer(request):
+    with DW1000shm.DW1000shmWriter(blockName(request),numSlots=8) as writer:
+        with DW1000shm.DW1000shmReader(writer.name) as reader:
+            with pytest.raises(FileExistsError):
+                DW1000shm.DW1000shmWriter(writer.name,numSlots=8)
+
+            writer.publish(1.0,(1.0,2.0))
+
+            assert list(reader.read()[0]) == [0]
+
+@pytest.mark.skipif(os.name == "nt",reason="shared memory is released with its last handle on Windows")
+def test_block_of_dead_writer_is_reclaimed(request):
+    name = blockName(request)
+    deadProcess = subprocess.Popen([sys.executable,"-c","pass"])
+    deadProcess.wait()
+
+    stale = shared_memory.SharedMemory(name=name,create=True,size=DW1000shm.ringSize(8,2))
+    header = np.ndarray((DW1000shm.headerLen,),dtype=np.int64,buffer=stale.buf)
+    header[DW1000shm.headerOwnerPid] = deadProcess.pid
+    del header
+    stale.close()
+
+    with DW1000shm.DW1000shmWriter(name,numSlots=8) as writer:
+        assert writer.header[DW1000shm.headerOwnerPid] == os.getpid()
+
+def test_pushed_samples_keep_their_own_time(request):
+    with DW1000shm.DW1000shmWriter(blockName(request),columns=("anchorRange","tagRange"),numSlots=8) as writer:
+        with DW1000shm.DW1000shmReader(writer.name,fromStart=True) as reader:
+            writer.pushSample({"anchorRange":100.0,"tagRange":None,"time":12.5})
+            writer.pushSample({"anchorRange":101.0,"tagRange":99.0,"time":13.0,"correctedTime":12.9})
+
+            sequences,timestamps,values = reader.read()
+
+            assert list(timestamps) == [12.5,12.9]
+            assert np.array_equal(values,[[100.0,np.nan],[101.0,99.0]],equal_nan=True)
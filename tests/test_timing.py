@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for DW1000timing.py on simulated ports, and the corrected times
+reaching distMeasLoop samples
+"""
+
+import contextlib
+import io
+
+import numpy as np
+
+import DW1000emulator
+import DW1000test
+import DW1000timing
+
+#Emission and arrival times of a port: USB-style latency (3 ms plus up to
+#maxJitter, quantized to the 1 ms latency timer) and 1% of frames dropped;
+#returns (emitted, arrivals, frames dropped)
+def simulatedPort(period,numFrames=20000,maxJitter=0.016,driftPpm=0.0,seed=0):
+    random = np.random.RandomState(seed)
+    emitted = np.arange(numFrames)*period*(1 + driftPpm*1e-6)
+    arrivals = np.ceil((emitted + 0.003 + random.uniform(0,maxJitter,numFrames))*1000)/1000
+    kept = random.rand(numFrames) > 0.01
+    kept[0] = True
+
+    return emitted[kept],arrivals[kept],int(np.count_nonzero(~kept))
+
+def correctPort(estimator,arrivals):
+    return np.array([estimator.update(arrival) for arrival in arrivals])
+
+def test_corrected_times_are_far_tighter_than_the_raw_jitter():
+    for period,maxJitter in ((0.1,0.016),(0.02,0.005)):
+        emitted,arrivals,dropped = simulatedPort(period,maxJitter=maxJitter)
+        estimator = DW1000timing.DW1000cadenceEstimator(nominalPeriod=period)
+        corrected = correctPort(estimator,arrivals)
+
+        #The constant part of the latency can't be seen, so errors are taken
+        #about their median
+        errors = (corrected - emitted)[200:]
+        errors -= np.median(errors)
+        rawErrors = (arrivals - emitted)[200:]
+
+        assert np.percentile(np.abs(errors),99) < 1e-3
+        assert np.percentile(np.abs(errors),99) < np.std(rawErrors)/4
+        assert (estimator.slips,estimator.resyncs) == (0,0)
+
+def test_missed_frames_are_counted_exactly():
+    for seed in range(3):
+        emitted,arrivals,dropped = simulatedPort(0.1,seed=seed)
+        estimator = DW1000timing.DW1000cadenceEstimator(nominalPeriod=0.1)
+        correctPort(estimator,arrivals)
+
+        assert estimator.missedFrames == dropped
+
+def test_drift_and_period_are_estimated():
+    emitted,arrivals,dropped = simulatedPort(0.1,driftPpm=50.0)
+    estimator = DW1000timing.DW1000cadenceEstimator(nominalPeriod=0.1)
+    correctPort(estimator,arrivals)
+
+    assert abs(estimator.driftPpm() - 50.0) < 10.0
+
+    #Without a nominal period the period comes from the frames themselves
+    estimator = DW1000timing.DW1000cadenceEstimator()
+    correctPort(estimator,arrivals)
+
+    assert estimator.driftPpm() == None
+    assert abs((estimator.getStats()["period"]/0.1 - 1)*1e6 - 50.0) < 10.0
+
+def test_long_gap_starts_the_estimate_again():
+    emitted,arrivals,dropped = simulatedPort(0.1,numFrames=200)
+    estimator = DW1000timing.DW1000cadenceEstimator(nominalPeriod=0.1)
+    correctPort(estimator,arrivals)
+    estimator.update(arrivals[-1] + 10.0)
+
+    assert estimator.resyncs == 1
+    assert not estimator.ready()
+
+def test_distMeasLoop_samples_carry_the_corrected_time():
+    with contextlib.redirect_stdout(io.StringIO()):
+        testInfoDict = DW1000test.DW1000test().testInfoDict
+        testInfoDict.update(timingCorrection=True,framePeriod=0.005)
+        DW1000 = DW1000test.DW1000test(testInfoDict=testInfoDict)
+
+    DW1000emulator.DW1000emulatedLink(rate=200.0).attach(DW1000)
+    pairs = []
+    nextPair = DW1000.nextPair
+    DW1000.nextPair = lambda timeout: pairs.append(nextPair(timeout)) or pairs[-1]
+    samples = []
+    DW1000.sampleListeners.append(samples.append)
+
+    for _ in range(40):
+        assert DW1000.distMeasLoop()
+        assert DW1000.lastSampleTime == pairs[-1]["anchor"]["correctedTime"]
+        assert samples[-1]["time"] == DW1000.lastSampleTime